@@ -2,40 +2,110 @@ from app.src import (
     real_time_access_control,
     real_time_access_control_stream,
     allow_access,
+    check_access,
     enable_device_access,
     get_name,
+    AccessPolicy,
+    PolicyHolder,
+    RulesFileWatcher,
+    SessionMonitor,
+    StateSnapshot,
+    Schedule,
+    SpamDetector,
+    Event,
+    sse_frame,
+    EventHub,
+    AccessControlHub,
+    MonitorHub,
+    get_access_control_hub,
+    get_monitor_hub,
     
     check_security,
     check_security_stream,
+    security_check_cycle_stream,
     check_attendances,
     general_check,
-    check_users
+    check_users,
+    FleetMonitor,
+    FleetDevice,
+    load_inventory,
+    run_audit_report,
+    audit_report_stream,
+    merge_shards
 )
 
 from app.utils import (
     ZKConnection,
+    get_connection,
+    DeviceWorker,
+    DevicePool,
+    get_device_pool,
+    CircuitBreaker,
+    DeviceUnavailable,
+    get_circuit_breaker,
+    AttendanceStore,
+    AttendanceBatch,
     get_attendances,
     get_users,
     parse_time,
-    get_logger
+    get_logger,
+    REGISTRY,
+    instrument,
+    UserDirectory,
+    get_user_directory
 )
 
 __all__ = [
     'real_time_access_control',
     'real_time_access_control_stream',
     'allow_access',
+    'check_access',
     'enable_device_access',
     'get_name',
+    'AccessPolicy',
+    'PolicyHolder',
+    'RulesFileWatcher',
+    'SessionMonitor',
+    'StateSnapshot',
+    'Schedule',
+    'SpamDetector',
+    'Event',
+    'sse_frame',
+    'EventHub',
+    'AccessControlHub',
+    'MonitorHub',
+    'get_access_control_hub',
+    'get_monitor_hub',
     
     'check_security',
     'check_security_stream',
+    'security_check_cycle_stream',
     'check_attendances',
     'general_check',
     'check_users',
+    'FleetMonitor',
+    'FleetDevice',
+    'load_inventory',
+    'run_audit_report',
+    'audit_report_stream',
+    'merge_shards',
     
     'ZKConnection',
+    'get_connection',
+    'DeviceWorker',
+    'DevicePool',
+    'get_device_pool',
+    'CircuitBreaker',
+    'DeviceUnavailable',
+    'get_circuit_breaker',
+    'AttendanceStore',
+    'AttendanceBatch',
     'get_attendances',
     'get_users',
     'parse_time',
-    'get_logger'
+    'get_logger',
+    'REGISTRY',
+    'instrument',
+    'UserDirectory',
+    'get_user_directory'
 ]
\ No newline at end of file
@@ -1,33 +1,87 @@
 # this file contains the loop that manages access to door in real-time
-from app.utils import get_logger, ZKConnection
-from dotenv import load_dotenv
+from app.utils import get_logger, ZKConnection, get_user_directory, AttendanceStore
+from dotenv import find_dotenv, load_dotenv
 import os
 from app.src.access_control_core import real_time_access_control
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.access_policy import PolicyHolder, rules_from_env
+from app.src.rules_watcher import RulesFileWatcher
+from app.src.session_monitor import SessionMonitor
+from app.src.spam_detector import SpamDetector
+from app.src.state_snapshot import StateSnapshot
 
-logger = get_logger()
 load_dotenv()
+logger = get_logger()
 
 # device connection configuration
 IP = os.getenv("ZK_IP")
 PORT = int(os.getenv("ZK_PORT"))
 
-# user access rules configuration
-BLACK_LISTED = list(os.getenv("BLACK_LISTED", "").split(","))
-WHITE_LISTED = list(os.getenv("WHITE_LISTED", "").split(","))
-ALLOWED_HOURS = tuple(os.getenv("ALLOWED_HOURS", "8,18").split(","))
+# user access rules configuration: WHITE_LISTED, BLACK_LISTED, ALLOWED_HOURS
+# ("8,18" or e.g. "mon-fri 8-18; sat 9-13"), USER_HOURS and GROUP_HOURS
+# (JSON: {"name": "22:00-06:00"} / {"group_id": "mon-fri 8-12"})
+RULES = rules_from_env(os.environ)
+
+# edits of this file apply to the running loop without reconnecting
+RULES_FILE = os.getenv("RULES_FILE") or find_dotenv()
+RULES_WATCH_INTERVAL = float(os.getenv("RULES_WATCH_INTERVAL", 2))
+
+# live spam detection: SPAM_THRESHOLD attempts within SPAM_WINDOW seconds raise an alert
+SPAM_WINDOW = float(os.getenv("SPAM_WINDOW", 30))
+SPAM_THRESHOLD = int(os.getenv("SPAM_THRESHOLD", 2))
+
+# user table cache configuration
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+
+# SESSION_MONITOR=1 checks every swipe against the allowed hours and stores it
+# as an attendance record, on the capture's session (the polled checks of
+# monitoring_script.py still need their own session)
+SESSION_MONITOR = os.getenv("SESSION_MONITOR", "0") == "1"
+ATTENDANCE_DB = os.getenv("ATTENDANCE_DB")  # defaults to /tmp/data/attendance.db
+
+# user table, rules and attendance watermark saved here for a warm start after a restart
+STATE_SNAPSHOT = os.getenv("STATE_SNAPSHOT", "/tmp/data/state.json")
 
 conn = ZKConnection(ip=IP, port=PORT, timeout=165, ommit_ping=False)
+directory = get_user_directory(IP, PORT, ttl=USER_CACHE_TTL)
+policy = PolicyHolder(**RULES)
+watermark = AttendanceWatermark()  # the session monitor's position in the attendance log
+
+# rules from the environment win over the saved ones
+snapshot = StateSnapshot(STATE_SNAPSHOT, logger=logger)
+snapshot.attach(
+    IP, PORT, directory=directory, rules=policy, watermarks={"session_monitor": watermark}
+)
+snapshot.start()
+
+monitor = None
+if SESSION_MONITOR:
+    monitor = SessionMonitor(
+        allowed_time_range=RULES["allowed_hours"],
+        store=AttendanceStore(ATTENDANCE_DB),
+        logger=logger,
+        watermark=watermark,
+    )
+
+watcher = None
+if RULES_FILE:
+    watcher = RulesFileWatcher(
+        RULES_FILE, policy, interval=RULES_WATCH_INTERVAL, logger=logger
+    ).start()
 
 try:
     real_time_access_control(
         conn=conn,
-        blacklist=BLACK_LISTED,
-        whitelist=WHITE_LISTED,
-        allowed_hours=ALLOWED_HOURS,
+        directory=directory,
+        policy=policy,
+        spam_detector=SpamDetector(window=SPAM_WINDOW, threshold=SPAM_THRESHOLD),
         logger=logger,
+        monitor=monitor,
     )
 except Exception as e:
-    logger.error(f"An error occurred: {e}")
-    print(f"An error occurred: {e}")
+    logger.error(f"An error occurred: {e}", exc_info=True)
 finally:
-    print("Control script terminated.")
+    if watcher is not None:
+        watcher.stop()
+    snapshot.stop()
+    logger.info("Control script terminated.")
@@ -0,0 +1,44 @@
+# this file contains the loop that executes periodic checks across a fleet of devices
+from app.utils import get_logger, AttendanceStore
+from app.src.fleet import FleetMonitor, load_inventory
+from dotenv import load_dotenv
+import asyncio
+import os
+
+load_dotenv()
+logger = get_logger()
+
+# fleet configuration
+INVENTORY = os.getenv("FLEET_INVENTORY", "devices.json")  # JSON list of devices
+MAX_CONCURRENCY = int(os.getenv("FLEET_CONCURRENCY", 10))
+JITTER = float(os.getenv("FLEET_JITTER", 0.1))
+ALERT_INTERVAL = float(os.getenv("FLEET_ALERT_INTERVAL", 5))
+
+# local attendance history
+ATTENDANCE_DB = os.getenv("ATTENDANCE_DB")  # defaults to /tmp/data/attendance.db
+
+
+async def main():
+
+    monitor = FleetMonitor(
+        load_inventory(INVENTORY),
+        max_concurrency=MAX_CONCURRENCY,
+        jitter=JITTER,
+        alert_interval=ALERT_INTERVAL,
+        logger=logger,
+        store=AttendanceStore(ATTENDANCE_DB),
+    )
+
+    async for event in monitor.events():
+        if event.event_type == "security_check_complete":
+            logger.info(f"[{event.device}] check completed, next in {event.next_check_in}s")
+
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    logger.info("Fleet monitoring stopped by user interrupt")
+except Exception as e:
+    logger.error(f"An error occurred: {e}", exc_info=True)
+finally:
+    logger.info("Fleet monitoring script terminated.")
@@ -1,11 +1,11 @@
 # this file contains the loop that executes periodic checks
-from app.utils import get_logger, ZKConnection
+from app.utils import get_logger, ZKConnection, AttendanceStore
 from app.src.monitor_core import check_security
 from dotenv import load_dotenv
 import os
 
-logger = get_logger()
 load_dotenv()
+logger = get_logger()
 
 # device connection configuration
 IP = os.getenv("ZK_IP")
@@ -13,10 +13,15 @@ PORT = int(os.getenv("ZK_PORT", 4370))
 
 # user access rules configuration
 ADMIN_COUNT = int(os.getenv("ADMIN_COUNT", 2))
-ALLOWED_HOURS = tuple(os.getenv("ALLOWED_HOURS", "8,18").split(","))
+ALLOWED_HOURS = os.getenv("ALLOWED_HOURS", "8,18")
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 10))
+MAX_CHECK_INTERVAL = float(os.getenv("MAX_CHECK_INTERVAL", CHECK_INTERVAL))  # idle devices back off up to this
+
+# local attendance history
+ATTENDANCE_DB = os.getenv("ATTENDANCE_DB")  # defaults to /tmp/data/attendance.db
 
 conn = ZKConnection(ip=IP, port=PORT, timeout=165, ommit_ping=False)
+store = AttendanceStore(ATTENDANCE_DB)
 
 try:
     check_security(
@@ -24,10 +29,11 @@ try:
         admin_count=ADMIN_COUNT,
         allowed_time_range=ALLOWED_HOURS,
         check_interval=CHECK_INTERVAL,
+        max_interval=MAX_CHECK_INTERVAL,
         logger=logger,
+        store=store,
     )
 except Exception as e:
-    logger.error(f"An error occurred: {e}")
-    print(f"An error occurred: {e}")
+    logger.error(f"An error occurred: {e}", exc_info=True)
 finally:
-    print("Monitoring script terminated.")
+    logger.info("Monitoring script terminated.")
@@ -0,0 +1,64 @@
+# this file builds the off-hours / rapid entry audit report of a fleet of devices
+#
+#   python -m app.scripts.report_script --start 2026-09-01 --end 2026-09-30
+#   python -m app.scripts.report_script --source device --json
+from app.utils import get_logger
+from app.src.audit_report import SOURCES, merge_shards, run_audit_report
+from app.src.fleet import load_inventory
+from datetime import datetime
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+
+load_dotenv()
+logger = get_logger(console=False)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Off-hours and rapid entry report across devices")
+    parser.add_argument("--inventory", default=os.getenv("FLEET_INVENTORY", "devices.json"))
+    parser.add_argument("--start", type=datetime.fromisoformat, help="first day/time of the report")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="last day/time of the report")
+    parser.add_argument(
+        "--source", choices=SOURCES, default="store",
+        help="local attendance store (ATTENDANCE_DB), a download from every device, "
+        "or the downloads archived in ATTENDANCE_ARCHIVE",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--json", action="store_true", help="print the merged report as JSON")
+    args = parser.parse_args()
+
+    devices = load_inventory(args.inventory)
+    shards = []
+    for shard in run_audit_report(
+        devices,
+        start=args.start,
+        end=args.end,
+        source=args.source,
+        store_path=os.getenv("ATTENDANCE_DB"),
+        max_workers=args.workers,
+        archive_dir=os.getenv("ATTENDANCE_ARCHIVE"),
+    ):
+        shards.append(shard)
+        if shard.error is not None:
+            logger.error(f"Audit of {shard.device} failed: {shard.error}")
+        elif not args.json:
+            print(
+                f"# {shard.device_name or shard.device}: {shard.records} records, "
+                f"{len(shard.entries)} findings ({shard.seconds:.1f}s)"
+            )
+
+    entries = merge_shards(shards)
+    if args.json:
+        print(json.dumps([entry._asdict() for entry in entries], default=str, indent=2))
+        return
+
+    for entry in entries:
+        detail = f" ({entry.seconds:.0f}s after the previous entry)" if entry.kind == "rapid_entry" else ""
+        print(f"{entry.timestamp}  {entry.device_name or entry.device:<21}  {entry.kind:<11}  user {entry.user_id}{detail}")
+
+
+if __name__ == "__main__":
+    main()
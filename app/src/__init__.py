@@ -7,30 +7,83 @@ from .access_control_core import (
     real_time_access_control,
     real_time_access_control_stream,
     allow_access,
+    check_access,
     enable_device_access,
     get_name
 )
 
+from .access_policy import AccessPolicy, PolicyHolder, RulesConflict, Schedule
+
+from .rules_watcher import RulesFileWatcher
+
+from .session_monitor import SessionMonitor
+
+from .state_snapshot import StateSnapshot
+
+from .spam_detector import SpamDetector
+
+from .events import Event, sse_frame
+
+from .device_hub import (
+    EventHub,
+    AccessControlHub,
+    MonitorHub,
+    get_access_control_hub,
+    get_monitor_hub,
+    find_access_control_hub,
+    has_hub
+)
+
 from .monitor_core import (
     check_security,
     check_security_stream,
+    security_check_cycle_stream,
     check_attendances,
     general_check,
     check_users
 )
 
+from .fleet import FleetMonitor, FleetDevice, load_inventory
+
+from .audit_report import run_audit_report, audit_report_stream, merge_shards
+
 __all__ = [
     # Access control functions
     'real_time_access_control',
     'real_time_access_control_stream',
     'allow_access',
+    'check_access',
     'enable_device_access',
     'get_name',
+    'AccessPolicy',
+    'PolicyHolder',
+    'RulesConflict',
+    'RulesFileWatcher',
+    'SessionMonitor',
+    'StateSnapshot',
+    'Schedule',
+    'SpamDetector',
+    'Event',
+    'sse_frame',
+    'EventHub',
+    'AccessControlHub',
+    'MonitorHub',
+    'get_access_control_hub',
+    'get_monitor_hub',
+    'find_access_control_hub',
+    'has_hub',
     
     # Monitoring functions
     'check_security',
     'check_security_stream',
+    'security_check_cycle_stream',
     'check_attendances',
     'general_check',
-    'check_users'
+    'check_users',
+    'FleetMonitor',
+    'FleetDevice',
+    'load_inventory',
+    'run_audit_report',
+    'audit_report_stream',
+    'merge_shards'
 ]
\ No newline at end of file
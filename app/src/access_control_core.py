@@ -1,10 +1,30 @@
-from app.utils.helpers import ZKConnection, parse_time
+from app.src.access_policy import AccessPolicy, Decision, PolicyHolder
+from app.src.events import (
+    Event,
+    AccessGranted,
+    AccessDenied,
+    RapidEntrySpam,
+    SystemShutdown,
+    ErrorEvent,
+    circuit_event,
+)
+from app.src.spam_detector import SpamDetector
+from app.utils.attendance_store import device_key
+from app.utils.circuit_breaker import CLOSED, Backoff, BreakerWatch
+from app.utils.helpers import ZKConnection, get_connection
+from app.utils.metrics import ACCESS_DECISIONS, SWIPE_TO_DECISION, SWIPE_TO_UNLOCK
+from app.utils.user_directory import UserDirectory, get_user_directory
+from concurrent.futures import Future
 from datetime import datetime
-import traceback
 from zk import ZK
+from zk.base import Attendance, User
 import time
 import asyncio
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, NamedTuple, Optional, Union
+import logging
+
+
+log = logging.getLogger("main.access_control")
 
 
 def get_name(user_id, all_users: list, all_ids: list):
@@ -20,76 +40,89 @@ def get_name(user_id, all_users: list, all_ids: list):
         return None
 
 
-def allow_access(
-    zk: ZK,
+# logged explanation for each decision reason
+DECISION_MESSAGES = {
+    "whitelisted": "Access GRANTED for user {user_id} (whitelisted)",
+    "blacklisted": "Access DENIED for user {user_id} (blacklisted)",
+    "no_time_restrictions": "Access GRANTED for user {user_id} (no time restrictions)",
+    "within_allowed_hours": "Access GRANTED for user {user_id} (within allowed time range)",
+    "outside_allowed_hours": "Access DENIED for user {user_id} (outside allowed time range)",
+    "invalid_policy": "Access DENIED for user {user_id} (invalid access policy)",
+}
+
+
+def check_access(
+    user: Optional[User],
     user_id,
     whitelist: list[str] = None,
     blacklist: list[str] = None,
     allowed_hours: tuple = None,
+    policy: AccessPolicy = None,
 ):
     """
-    Main access control logic - determines if user should be allowed access.
+    Apply the access rules to an already resolved user (None if the user_id
+    is not enrolled on the device). Uses the compiled `policy` when given,
+    otherwise compiles one from whitelist/blacklist/allowed_hours.
     Returns True if access should be granted, False otherwise.
     """
 
-    current_time = datetime.now().time()
+    if policy is None:
+        policy = AccessPolicy.compile(whitelist, blacklist, allowed_hours)
 
-    users = zk.get_users()
-    ids = [user.user_id for user in users]
+    now = datetime.now()
 
     # check if user exists
-    if user_id not in ids:
-        print(f"User {user_id} does not exist in the system.")
+    if user is None:
+        log.info(f"User {user_id} does not exist in the system.")
         return False
 
-    user_name = get_name(user_id, users, ids)
-    print(f"Checking access for user {user_name} (ID: {user_id}) at {current_time}")
+    log.debug(f"Checking access for user {user.name} (ID: {user_id}) at {now.time()}")
 
-    # check if user is whitelisted
-    if whitelist and user_name in whitelist:
-        print(f"Access GRANTED for user {user_id} (whitelisted)")
-        return True
+    decision = policy.evaluate(user, now)
+    log.debug(DECISION_MESSAGES[decision.reason].format(user_id=user_id))
 
-    # check if user is blacklisted
-    if blacklist and user_name in blacklist:
-        print(f"Access DENIED for user {user_id} (blacklisted)")
-        return False
+    return decision.granted
 
-    # if no time restrictions are set, allow access
-    if not allowed_hours:
-        print(f"Access GRANTED for user {user_id} (no time restrictions)")
-        return True
 
-    # validate allowed_hours format
-    if len(allowed_hours) != 2:
-        print(
-            f"Invalid allowed_hours format. Expected tuple of 2 elements, got {len(allowed_hours)}."
-        )
-        return False
+def allow_access(
+    zk: ZK,
+    user_id,
+    whitelist: list[str] = None,
+    blacklist: list[str] = None,
+    allowed_hours: tuple = None,
+    directory: UserDirectory = None,
+    policy: AccessPolicy = None,
+):
+    """
+    Main access control logic - determines if user should be allowed access.
+    The user is resolved through `directory` (one cached lookup); without one
+    the user table is downloaded from the device. Pass a compiled `policy` to
+    skip compiling the rules on every call.
+    Returns True if access should be granted, False otherwise.
+    """
 
-    # normal access - check the time
-    try:
-        start_time = parse_time(allowed_hours[0])
-        end_time = parse_time(allowed_hours[1])
-    except ValueError as e:
-        print(f"Error parsing time format: {e}")
-        return False
+    if directory is None:
+        directory = UserDirectory(ttl=0, refresh_on_miss=False)
 
-    if start_time <= current_time <= end_time:
-        print(f"Access GRANTED for user {user_id} (within allowed time range)")
-        return True
-    else:
-        print(f"Access DENIED for user {user_id} (outside allowed time range)")
-        return False
+    user = directory.lookup(zk, user_id)
+
+    return check_access(
+        user,
+        user_id,
+        whitelist=whitelist,
+        blacklist=blacklist,
+        allowed_hours=allowed_hours,
+        policy=policy,
+    )
 
 
 def enable_device_access(zk: ZK):
     try:
         zk.unlock(time=5)  # unlock for 5 seconds
-        print("Device access enabled (door unlocked)")
+        log.debug("Device access enabled (door unlocked)")
         return True
     except Exception as e:
-        print(f"Failed to enable device access: {e}")
+        log.error(f"Failed to enable device access: {e}")
         return False
 
 
@@ -99,68 +132,237 @@ def real_time_access_control(
     whitelist: list[str] = None,
     blacklist: list[str] = None,
     allowed_hours: tuple = None,
+    directory: UserDirectory = None,
+    policy: Union[AccessPolicy, PolicyHolder] = None,
+    spam_detector: SpamDetector = None,
+    monitor=None,
 ):
     """
     Real-time access control system that monitors device events and enforces rules.
     This function continuously listens for access attempts and applies security rules.
+    Users are resolved through `directory` (defaults to the device's shared UserDirectory)
+    and the rules are compiled once into `policy` unless one is given. Pass a
+    PolicyHolder to change the rules while the loop runs (next swipe).
+    Bursts of attempts by the same user are reported by `spam_detector`.
+    After an error the capture is restarted with a growing delay, or when the
+    device's circuit breaker allows it again.
+    A SessionMonitor given as `monitor` checks and stores every swipe as
+    a new attendance record, on the capture's session (see SessionMonitor).
+    Users are resolved from the cached table only. An expired table, a miss
+    or a table restored from a snapshot is downloaded again in the background,
+    not over the capture's session (see _side_connection); until it lands a
+    user the table doesn't hold is denied.
     """
 
-    print(" LIVE CAPTURE ".center(35, "="))
-    if logger:
-        logger.info("Starting live capture for access control")
+    if directory is None:
+        directory = get_user_directory(conn.ip, conn.port)
+    if not isinstance(policy, PolicyHolder):
+        policy = PolicyHolder(
+            policy, whitelist=whitelist, blacklist=blacklist, allowed_hours=allowed_hours
+        )
+    if spam_detector is None:
+        spam_detector = SpamDetector()
+    if logger is None:
+        logger = log
+
+    device = device_key(conn.ip, conn.port)
+
+    logger.info("Starting live capture for access control")
+
+    backoff = Backoff()
+    refresh = None
 
     while True:
         try:
             with conn as zk:
+                backoff.reset()
+                if monitor is not None:
+                    monitor.resume(zk)
+                if directory.is_stale() and (refresh is None or refresh.done()):
+                    refresh = _refresh_in_background(directory, conn)
                 for attendance in zk.live_capture():
 
+                    if directory.needs_revalidation and (refresh is None or refresh.done()):
+                        # warm-started user table
+                        refresh = _refresh_in_background(directory, conn)
+
                     if attendance is None:
                         continue
 
+                    received = time.perf_counter()
                     user_id = attendance.user_id
+                    rules = policy.current  # one rules version per swipe
 
-                    # apply access control rules
-                    if allow_access(
-                        zk,
-                        user_id,
-                        whitelist=whitelist,
-                        blacklist=blacklist,
-                        allowed_hours=allowed_hours,
-                    ):
-                        print(f"ACCESS GRANTED - Unlocking door for user {user_id}")
-                        enable_device_access(zk)
+                    # decide with the cached table; a miss or an expired table is
+                    # refreshed on the side connection, never over the capture's socket
+                    user, stale = directory.lookup_cached(user_id)
+                    if stale and (refresh is None or refresh.done()):
+                        refresh = _refresh_in_background(directory, conn)
 
-                        if logger:
-                            logger.info(
-                                f"Access granted for user {user_id} at {datetime.now()}"
-                            )
+                    # apply access control rules
+                    granted = check_access(user, user_id, policy=rules.policy)
+                    SWIPE_TO_DECISION.observe(device, value=time.perf_counter() - received)
 
-                    else:
-                        print(
-                            f"ACCESS DENIED - Door remains locked for user with id {user_id}"
+                    if granted:
+                        enable_device_access(zk)
+                        SWIPE_TO_UNLOCK.observe(device, value=time.perf_counter() - received)
+                        ACCESS_DECISIONS.inc(device, "granted")
+                        logger.info(
+                            f"Access granted for user {user_id} at {datetime.now()} (rules v{rules.version})"
                         )
 
+                    else:
                         zk.test_voice(2)  # "access denied" voice
+                        ACCESS_DECISIONS.inc(device, "denied")
+                        logger.info(
+                            f"Access denied for user {user_id} at {datetime.now()} (rules v{rules.version})"
+                        )
 
-                        if logger:
-                            logger.info(
-                                f"Access denied for user {user_id} at {datetime.now()}"
-                            )
+                    burst = spam_detector.observe(user_id, attendance.timestamp)
+                    if burst:
+                        message = f"Security Alert: Rapid consecutive entries for user {user_id} ({burst.attempts} attempts in {burst.seconds} seconds)"
+                        logger.warning(message)
 
-                    print("=" * 35)
+                    if monitor is not None:
+                        monitor.observe(attendance)
+                        monitor.flush(conn.ip, conn.port)
 
         except KeyboardInterrupt:
-            print("\nAccess control monitoring stopped by user.")
-            if logger:
-                logger.info("Access control monitoring stopped by user interrupt")
+            logger.info("Access control monitoring stopped by user interrupt")
             break
         except Exception as e:
-            error_msg = f"Error in access control monitoring: {e}"
-            print(error_msg)
-            traceback.print_exc()
-            if logger:
-                logger.error(error_msg)
-            print("Continuing monitoring...\n")
+            # once the circuit opens, the breaker logs the failures
+            if conn.breaker.state == CLOSED:
+                logger.error(f"Error in access control monitoring: {e}", exc_info=True)
+            delay = conn.breaker.retry_in() or backoff.next()
+            logger.info(f"Continuing monitoring in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+_CONNECTED = object()  # queued by the decision stage once the device session is open
+
+
+def _side_connection(conn: ZKConnection) -> ZKConnection:
+    """
+    Connection for the transfers a capture needs besides its events (user
+    table downloads). pyzk reads live events and command replies from the same
+    socket, so a swipe arriving during a transfer on the capture's session
+    would be lost: these go through the device's shared API connection (another
+    pooled session, with its own worker thread).
+    """
+
+    return get_connection(conn.ip, conn.port)
+
+
+def _refresh_on(directory: UserDirectory, conn: ZKConnection):
+
+    with conn as zk:
+        directory.refresh(zk)
+
+
+def _refresh_in_background(directory: UserDirectory, conn: ZKConnection) -> Future:
+    """
+    Blocking capture loops: download the user table again on the side
+    connection's worker (the thread its other calls run on), without waiting.
+    """
+
+    side = _side_connection(conn)
+    refresh = side.worker.enqueue(_refresh_on, directory, side)
+    refresh.add_done_callback(_log_failed_refresh)
+    return refresh
+
+
+def _log_failed_refresh(task: Union[asyncio.Task, Future]):
+
+    if not task.cancelled() and task.exception() is not None:
+        log.warning(f"Failed to refresh the cached user table: {task.exception()}")
+
+
+class _Swipe(NamedTuple):
+    attendance: Attendance
+    user: Optional[User]
+    decision: Decision
+    policy_version: int
+    decided_at: datetime
+    command: asyncio.Future  # unlock (granted) or "access denied" voice, queued on the device worker
+
+
+def _unlock(zk: ZK, device: str, received: float) -> bool:
+
+    unlocked = enable_device_access(zk)
+    SWIPE_TO_UNLOCK.observe(device, value=time.perf_counter() - received)
+    return unlocked
+
+
+async def _decide_swipes(
+    conn: ZKConnection,
+    directory: UserDirectory,
+    policy: PolicyHolder,
+    swipes: asyncio.Queue,
+    monitor=None,
+):
+    """
+    Decision stage: read live capture events, decide, and queue the door command
+    before anything else. The command is submitted to the device worker ahead of
+    the next live_capture read (the worker runs calls in order), without waiting
+    for it. Everything else is handed to the side-effect stage through `swipes`;
+    None marks the end of the capture.
+
+    A `monitor` places its watermark here, on the capture's session before
+    the capture starts. Users are resolved from the cached table only: an
+    expired table, a miss or a table restored from a snapshot is downloaded
+    again in the background, on the side connection, and a user it doesn't
+    hold yet is denied (and logged by the side-effect stage) until it lands.
+    """
+
+    device = device_key(conn.ip, conn.port)
+    refresh = None
+
+    try:
+        async with conn as zk:
+            if monitor is not None:
+                unchecked = await conn.run(monitor.resume, zk)
+                if unchecked is not None:
+                    swipes.put_nowait(unchecked)
+            if directory.is_stale():
+                refresh = directory.refresh_async(_side_connection(conn))
+                refresh.add_done_callback(_log_failed_refresh)
+            swipes.put_nowait(_CONNECTED)
+            async for attendance in conn.worker.iterate(zk.live_capture()):
+
+                if directory.needs_revalidation and (refresh is None or refresh.done()):
+                    # warm-started user table
+                    refresh = directory.refresh_async(_side_connection(conn))
+                    refresh.add_done_callback(_log_failed_refresh)
+
+                if attendance is None:
+                    continue
+
+                received = time.perf_counter()
+                user_id = attendance.user_id
+
+                # decide with the cached table; a miss or an expired table is
+                # refreshed on the side connection, never over the capture's socket
+                user, stale = directory.lookup_cached(user_id)
+                if stale and (refresh is None or refresh.done()):
+                    refresh = directory.refresh_async(_side_connection(conn))
+                    refresh.add_done_callback(_log_failed_refresh)
+
+                decided_at = datetime.now()
+                rules = policy.current  # one rules version per swipe
+                decision = rules.policy.evaluate(user, decided_at)
+                SWIPE_TO_DECISION.observe(device, value=time.perf_counter() - received)
+
+                if decision.granted:
+                    command = conn.worker.submit(_unlock, zk, device, received)
+                else:
+                    command = conn.worker.submit(zk.test_voice, 2)  # "access denied" voice
+
+                swipes.put_nowait(
+                    _Swipe(attendance, user, decision, rules.version, decided_at, command)
+                )
+    finally:
+        swipes.put_nowait(None)
 
 
 async def real_time_access_control_stream(
@@ -169,101 +371,158 @@ async def real_time_access_control_stream(
     whitelist: list[str] = None,
     blacklist: list[str] = None,
     allowed_hours: tuple = None,
-) -> AsyncGenerator[Dict[str, Any], None]:
+    directory: UserDirectory = None,
+    policy: Union[AccessPolicy, PolicyHolder] = None,
+    spam_detector: SpamDetector = None,
+    monitor=None,
+) -> AsyncGenerator[Event, None]:
     """
     Async generator version of real_time_access_control for streaming endpoints.
     Yields access control events as they occur for continuous streaming to clients.
+    Every device call runs on the connection's worker thread, so a slow device
+    never blocks the event loop (or the other streams served by it).
+
+    Swipes go through two stages: a decision task that issues the unlock/deny
+    command first, and this generator, which awaits the command and does the
+    logging, spam detection and event delivery. A slow consumer or a long voice
+    prompt never delays the decision for the next person in the queue.
+
+    Pass a PolicyHolder as `policy` to change the rules while the session runs;
+    every decision event carries the `policy_version` it was decided with.
+
+    A SessionMonitor given as `monitor` checks every swipe as a new
+    attendance record; its events are yielded with the access events and
+    the swipes are stored once the stream has caught up.
+
+    When the capture fails the session is restarted with a growing delay, or
+    when the device's circuit breaker allows it again; breaker state changes
+    are yielded as circuit events.
     """
 
-    print(" LIVE CAPTURE STREAM ".center(35, "="))
-    if logger:
-        logger.info("Starting live capture stream for access control")
+    if directory is None:
+        directory = get_user_directory(conn.ip, conn.port)
+    if not isinstance(policy, PolicyHolder):
+        policy = PolicyHolder(
+            policy, whitelist=whitelist, blacklist=blacklist, allowed_hours=allowed_hours
+        )
+    if spam_detector is None:
+        spam_detector = SpamDetector()
+    if logger is None:
+        logger = log
 
-    try:
-        with conn as zk:
-            for attendance in zk.live_capture():
+    device = device_key(conn.ip, conn.port)
 
-                if attendance is None:
-                    continue
+    logger.info("Starting live capture stream for access control")
 
-                user_id = attendance.user_id
-                timestamp = datetime.now().isoformat()
-
-                users = zk.get_users()
-                ids = [user.user_id for user in users]
-                user_name = get_name(user_id, users, ids)
-
-                # Apply access control rules
-                access_granted = allow_access(
-                    zk,
-                    user_id,
-                    whitelist=whitelist,
-                    blacklist=blacklist,
-                    allowed_hours=allowed_hours,
-                )
+    watch = BreakerWatch(conn.breaker)
+    backoff = Backoff()
 
-                if access_granted:
-                    print(f"ACCESS GRANTED - Unlocking door for user {user_id}")
-                    enable_device_access(zk)
+    while True:
+        if watch.poll():
+            yield circuit_event(conn.breaker)
 
-                    if logger:
-                        logger.info(
-                            f"Access granted for user {user_id} at {datetime.now()}"
-                        )
+        swipes = asyncio.Queue()  # unbounded: the decision stage never waits for side effects
+        capture = asyncio.create_task(_decide_swipes(conn, directory, policy, swipes, monitor))
+
+        try:
+            while True:
+                swipe = await swipes.get()
+                if swipe is None:  # live capture ended
+                    break
+                if swipe is _CONNECTED:
+                    backoff.reset()
+                    if watch.poll():
+                        yield circuit_event(conn.breaker)
+                    continue
+                if isinstance(swipe, Event):  # from the monitor
+                    yield swipe
+                    continue
 
-                    # Yield access granted event
-                    yield {
-                        "event_type": "access_granted",
-                        "timestamp": timestamp,
-                        "user_id": user_id,
-                        "user_name": user_name,
-                        "message": f"[Access granted] - Door unlocked for user {user_id}",
-                        "door_unlocked": True,
-                    }
+                user_id = swipe.attendance.user_id
+                user_name = swipe.user.name if swipe.user else None
 
+                if swipe.user is None:
+                    logger.info(f"User {user_id} does not exist in the system.")
                 else:
-                    print(
-                        f"ACCESS DENIED - Door remains locked for user with id {user_id}"
+                    log.debug(DECISION_MESSAGES[swipe.decision.reason].format(user_id=user_id))
+
+                try:
+                    done = await swipe.command
+                except Exception as e:
+                    logger.warning(f"Device command failed for user {user_id}: {e}")
+                    done = False
+
+                if swipe.decision.granted:
+                    ACCESS_DECISIONS.inc(device, "granted")
+                    logger.info(f"Access granted for user {user_id} at {swipe.decided_at}")
+
+                    yield AccessGranted(
+                        timestamp=swipe.decided_at,
+                        user_id=user_id,
+                        user_name=user_name,
+                        message=f"[Access granted] - Door unlocked for user {user_id}",
+                        door_unlocked=bool(done),
+                        policy_version=swipe.policy_version,
                     )
 
-                    zk.test_voice(2)  # "access denied" voice
+                else:
+                    ACCESS_DECISIONS.inc(device, "denied")
+                    logger.info(f"Access denied for user {user_id} at {swipe.decided_at}")
+
+                    yield AccessDenied(
+                        timestamp=swipe.decided_at,
+                        user_id=user_id,
+                        user_name=user_name,
+                        message=f"[Access denied] - Door remains locked for user {user_id}",
+                        policy_version=swipe.policy_version,
+                    )
 
-                    if logger:
-                        logger.info(
-                            f"Access denied for user {user_id} at {datetime.now()}"
-                        )
+                burst = spam_detector.observe(user_id, swipe.attendance.timestamp)
+                if burst:
+                    message = f"Security Alert: Rapid consecutive entries for user {user_id} ({burst.attempts} attempts in {burst.seconds} seconds)"
+                    logger.warning(message)
+
+                    yield RapidEntrySpam(
+                        user_id=user_id,
+                        user_name=user_name,
+                        attempts=burst.attempts,
+                        window_seconds=spam_detector.window,
+                        time_diff_seconds=burst.seconds,
+                        entry_times=[burst.first, burst.last],
+                        message=message,
+                    )
+
+                if monitor is not None:
+                    for event in monitor.observe(swipe.attendance):
+                        yield event
+                    if swipes.empty():
+                        # caught up with the capture: store its swipes off the event loop
+                        await asyncio.to_thread(monitor.flush, conn.ip, conn.port)
+
+            if monitor is not None:
+                await asyncio.to_thread(monitor.flush, conn.ip, conn.port)
+            # surface the error that ended the capture, if any
+            await capture
+            return
 
-                    # Yield access denied event
-                    yield {
-                        "event_type": "access_denied",
-                        "timestamp": timestamp,
-                        "user_id": user_id,
-                        "user_name": user_name,
-                        "message": f"[Access denied] - Door remains locked for user {user_id}",
-                        "door_unlocked": False,
-                    }
-
-                print("=" * 35)
-
-    except KeyboardInterrupt:
-        print("\nAccess control stream stopped by user.")
-        if logger:
+        except KeyboardInterrupt:
             logger.info("Access control stream stopped by user interrupt")
-        yield {
-            "event_type": "system_shutdown",
-            "timestamp": datetime.now().isoformat(),
-            "message": "Access control monitoring stopped by user",
-        }
-    except Exception as e:
-        error_msg = f"Error in access control stream: {e}"
-        print(error_msg)
-        traceback.print_exc()
-        if logger:
-            logger.error(error_msg)
-
-        yield {
-            "event_type": "error",
-            "timestamp": datetime.now().isoformat(),
-            "error": str(e),
-            "message": error_msg,
-        }
\ No newline at end of file
+            yield SystemShutdown(message="Access control monitoring stopped by user")
+            return
+        except Exception as e:
+            # once the circuit opens, its events report the failures
+            if conn.breaker.state == CLOSED:
+                error_msg = f"Error in access control stream: {e}"
+                logger.error(error_msg, exc_info=True)
+
+                yield ErrorEvent(error=str(e), message=error_msg)
+
+            if watch.poll():
+                yield circuit_event(conn.breaker)
+
+            delay = conn.breaker.retry_in() or backoff.next()
+            logger.info(f"Restarting live capture in {delay:.1f}s...")
+        finally:
+            capture.cancel()
+
+        await asyncio.sleep(delay)
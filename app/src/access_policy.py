@@ -0,0 +1,441 @@
+from app.utils.helpers import parse_time
+from datetime import datetime, time as dtime
+from typing import Mapping, NamedTuple, Optional, Union
+from zk.base import User
+import json
+import logging
+import threading
+
+
+log = logging.getLogger("main.access_policy")
+
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+WEEKDAYS = {
+    "mon": 0,
+    "tue": 1,
+    "wed": 2,
+    "thu": 3,
+    "fri": 4,
+    "sat": 5,
+    "sun": 6,
+}
+ALL_DAYS = frozenset(range(7))
+
+# schedule bitmap values
+OUTSIDE = 0
+INSIDE = 1  # the whole minute is allowed
+END = 2  # a window ends at the start of this minute: only hh:mm:00 exactly is allowed
+
+
+class Window(NamedTuple):
+    days: frozenset
+    start: dtime
+    end: dtime
+
+
+def parse_days(spec: str) -> frozenset:
+    """
+    Parse a weekday spec such as "mon-fri", "sat,sun" or "mon,wed-fri".
+    Ranges wrap around the week, so "fri-mon" is fri, sat, sun, mon.
+    """
+
+    days = set()
+    for part in spec.lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (p.strip()[:3] for p in part.split("-", 1))
+            if first not in WEEKDAYS or last not in WEEKDAYS:
+                raise ValueError(f"Invalid weekday range: {part}")
+            day = WEEKDAYS[first]
+            while True:
+                days.add(day)
+                if day == WEEKDAYS[last]:
+                    break
+                day = (day + 1) % 7
+        elif part[:3] in WEEKDAYS:
+            days.add(WEEKDAYS[part[:3]])
+        else:
+            raise ValueError(f"Invalid weekday: {part}")
+
+    if not days:
+        raise ValueError(f"Invalid weekday spec: {spec}")
+
+    return frozenset(days)
+
+
+def parse_windows(spec) -> list[Window]:
+    """
+    Parse an allowed hours spec into a list of windows.
+
+    Accepted formats:
+    - the legacy pair ("8", "18"), (8, 18) or "8,18" / "08:30,17:45" (every day)
+    - ";"-separated windows with optional weekdays, e.g.
+      "mon-fri 08:00-18:00; sat 9-13" or "22:00-06:00" (overnight)
+    """
+
+    if isinstance(spec, str) and "-" not in spec:
+        spec = tuple(_.strip() for _ in spec.split(","))
+
+    if not isinstance(spec, str):
+        if len(spec) != 2:
+            raise ValueError(
+                f"Invalid allowed_hours format. Expected 2 elements, got {len(spec)}."
+            )
+        return [Window(ALL_DAYS, parse_time(spec[0]), parse_time(spec[1]))]
+
+    windows = []
+    for part in spec.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+
+        tokens = part.split()
+        if len(tokens) == 1:
+            days, hours = ALL_DAYS, tokens[0]
+        elif len(tokens) == 2:
+            days, hours = parse_days(tokens[0]), tokens[1]
+        else:
+            raise ValueError(f"Invalid time window: {part}")
+
+        if hours.count("-") != 1:
+            raise ValueError(f"Invalid time range: {hours}")
+        start, end = hours.split("-")
+        windows.append(Window(days, parse_time(start), parse_time(end)))
+
+    if not windows:
+        raise ValueError(f"Invalid allowed_hours format: {spec!r}")
+
+    return windows
+
+
+def minute_of_week(when: datetime) -> int:
+    return when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+
+
+class Schedule:
+    """
+    Weekly schedule compiled into a per-minute bitmap (one byte per minute of
+    the week), so checking a timestamp is a single index lookup.
+
+    Windows include their start and end instants (`start <= t <= end`, like
+    the plain time comparison they replace): the end minute is marked END,
+    so "8,18" allows 18:00:00 but not 18:00:01. A window whose end is before
+    its start runs overnight into the next day.
+    """
+
+    __slots__ = ("windows", "bitmap")
+
+    def __init__(self, windows: list[Window]):
+
+        self.windows = windows
+        self.bitmap = bytearray(MINUTES_PER_WEEK)
+
+        for window in windows:
+            start = window.start.hour * 60 + window.start.minute
+            end = window.end.hour * 60 + window.end.minute
+            for day in window.days:
+                base = day * MINUTES_PER_DAY
+                if start <= end:
+                    self._fill(base + start, base + end)
+                    self._end(base + end)
+                else:
+                    # overnight: until midnight, then the start of the next day
+                    self._fill(base + start, base + MINUTES_PER_DAY)
+                    next_base = ((day + 1) % 7) * MINUTES_PER_DAY
+                    self._fill(next_base, next_base + end)
+                    self._end(next_base + end)
+
+    def _fill(self, start: int, stop: int):
+        self.bitmap[start:stop] = bytes([INSIDE]) * (stop - start)
+
+    def _end(self, minute: int):
+        # an overlapping window that covers the whole minute wins
+        if self.bitmap[minute] == OUTSIDE:
+            self.bitmap[minute] = END
+
+    @classmethod
+    def parse(cls, spec) -> "Schedule":
+        """Compile an allowed hours spec (see parse_windows). Raises ValueError."""
+
+        return cls(parse_windows(spec))
+
+    def allows(self, when: datetime) -> bool:
+
+        allowed = self.bitmap[minute_of_week(when)]
+        if allowed == END:
+            return when.second == 0 and when.microsecond == 0
+        return allowed == INSIDE
+
+    def window_on(self, when: datetime) -> Optional[Window]:
+        """The first window on the weekday of `when`, or None if the day has none."""
+
+        weekday = when.weekday()
+        return next((window for window in self.windows if weekday in window.days), None)
+
+    def describe(self) -> str:
+
+        parts = []
+        for window in self.windows:
+            hours = f"{window.start} - {window.end}"
+            if window.days == ALL_DAYS:
+                parts.append(hours)
+            else:
+                names = [name for name, day in WEEKDAYS.items() if day in window.days]
+                parts.append(f"{','.join(names)} {hours}")
+        return "; ".join(parts)
+
+
+class Decision(NamedTuple):
+    granted: bool
+    reason: str
+
+
+class AccessPolicy:
+    """
+    Access rules compiled once and evaluated in constant time per swipe.
+
+    Lookups go whitelist -> blacklist -> schedule, where the schedule is the
+    user's own window (by name) if any, then their group's (by group_id),
+    then the global allowed hours. If the hours failed to compile, everyone
+    who is not whitelisted is denied and the error is kept in `error`.
+    """
+
+    __slots__ = (
+        "whitelist",
+        "blacklist",
+        "schedule",
+        "user_schedules",
+        "group_schedules",
+        "error",
+    )
+
+    def __init__(
+        self,
+        whitelist: frozenset = frozenset(),
+        blacklist: frozenset = frozenset(),
+        schedule: Optional[Schedule] = None,
+        user_schedules: dict[str, Schedule] = None,
+        group_schedules: dict[str, Schedule] = None,
+        error: Optional[str] = None,
+    ):
+
+        self.whitelist = whitelist
+        self.blacklist = blacklist
+        self.schedule = schedule  # None means no time restrictions
+        self.user_schedules = user_schedules or {}
+        self.group_schedules = group_schedules or {}
+        self.error = error
+
+    @classmethod
+    def compile(
+        cls,
+        whitelist: list[str] = None,
+        blacklist: list[str] = None,
+        allowed_hours: Union[tuple, str] = None,
+        user_hours: dict[str, str] = None,
+        group_hours: dict[str, str] = None,
+    ) -> "AccessPolicy":
+        """
+        Build a policy from the request / .env values. Never raises: an invalid
+        time spec produces a policy that only lets whitelisted users in (see `error`).
+        """
+
+        whitelist = frozenset(n.strip() for n in whitelist or () if n.strip())
+        blacklist = frozenset(n.strip() for n in blacklist or () if n.strip())
+
+        try:
+            schedule = Schedule.parse(allowed_hours) if allowed_hours else None
+            user_schedules = {
+                name: Schedule.parse(spec) for name, spec in (user_hours or {}).items()
+            }
+            group_schedules = {
+                str(group): Schedule.parse(spec)
+                for group, spec in (group_hours or {}).items()
+            }
+        except (ValueError, TypeError) as e:
+            log.error(f"Error parsing time format: {e}")
+            return cls(whitelist, blacklist, error=str(e))
+
+        return cls(whitelist, blacklist, schedule, user_schedules, group_schedules)
+
+    def schedule_for(self, user: User) -> Optional[Schedule]:
+
+        schedule = self.user_schedules.get(user.name)
+        if schedule is None and user.group_id:
+            schedule = self.group_schedules.get(user.group_id)
+        if schedule is None:
+            schedule = self.schedule
+        return schedule
+
+    def evaluate(self, user: Optional[User], when: datetime = None) -> Decision:
+        """Decide for an already resolved user (None if not enrolled on the device)."""
+
+        if user is None:
+            return Decision(False, "unknown_user")
+        if user.name in self.whitelist:
+            return Decision(True, "whitelisted")
+        if user.name in self.blacklist:
+            return Decision(False, "blacklisted")
+        if self.error is not None:
+            return Decision(False, "invalid_policy")
+
+        schedule = self.schedule_for(user)
+        if schedule is None:
+            return Decision(True, "no_time_restrictions")
+
+        if schedule.allows(when or datetime.now()):
+            return Decision(True, "within_allowed_hours")
+        return Decision(False, "outside_allowed_hours")
+
+
+# AccessPolicy.compile arguments, as kept by PolicyHolder
+RULE_FIELDS = ("whitelist", "blacklist", "allowed_hours", "user_hours", "group_hours")
+
+
+class Rules(NamedTuple):
+    version: int
+    policy: AccessPolicy
+    spec: dict  # the AccessPolicy.compile arguments the policy was built from
+
+
+class RulesConflict(ValueError):
+    """Rules given for a device whose access rules were already set otherwise."""
+
+
+class PolicyHolder:
+    """
+    The access rules of a running decision loop, replaceable while it runs.
+
+    Updates are copy-on-write: a new policy is compiled aside and published
+    with one attribute assignment, together with a version number that grows
+    with every update. The loop reads `current` once per swipe, so a swipe is
+    decided by one consistent version and the next swipe sees the update.
+
+    `configured` tells whether any rules were ever given (at creation, or
+    with `replace`/`update`), as opposed to the default rules.
+    """
+
+    def __init__(self, policy: AccessPolicy = None, **spec):
+
+        spec = {name: value for name, value in spec.items() if value is not None}
+        self.configured = policy is not None or bool(spec)
+        if policy is None:
+            policy = AccessPolicy.compile(**spec)
+        self.current = Rules(1, policy, spec)
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self.current.version
+
+    @property
+    def policy(self) -> AccessPolicy:
+        return self.current.policy
+
+    def replace(self, policy: AccessPolicy, spec: dict = None) -> Rules:
+        """Publish a compiled policy as the next version."""
+
+        with self._lock:
+            rules = Rules(self.current.version + 1, policy, dict(spec or {}))
+            self.current = rules
+            self.configured = True
+        log.info(f"Access rules updated to version {rules.version}")
+        return rules
+
+    def update(self, **changes) -> Rules:
+        """
+        Recompile the rules with `changes` (AccessPolicy.compile arguments;
+        None leaves a rule unchanged) and publish them as the next version.
+        Raises ValueError, keeping the current rules, if the hours don't parse.
+        """
+
+        unknown = set(changes) - set(RULE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown rules: {', '.join(sorted(unknown))}")
+
+        with self._lock:
+            spec = dict(self.current.spec)
+            spec.update((name, value) for name, value in changes.items() if value is not None)
+            policy = AccessPolicy.compile(**spec)
+            if policy.error is not None:
+                raise ValueError(f"Invalid access hours: {policy.error}")
+            rules = Rules(self.current.version + 1, policy, spec)
+            self.current = rules
+            self.configured = True
+
+        log.info(f"Access rules updated to version {rules.version}")
+        return rules
+
+    def seed(self, spec: dict) -> Rules:
+        """
+        Set the first rules (AccessPolicy.compile arguments) of a holder that
+        was never configured. Rules equal to the current ones are accepted as
+        they are; other rules raise RulesConflict, keeping the current ones
+        (change those with `update`).
+        """
+
+        spec = {name: value for name, value in spec.items() if value is not None}
+        with self._lock:
+            current = self.current
+            if self.configured:
+                if spec != current.spec:
+                    raise RulesConflict(
+                        f"The device already has other access rules (version {current.version})"
+                    )
+                return current
+            rules = Rules(current.version + 1, AccessPolicy.compile(**spec), spec)
+            self.current = rules
+            self.configured = True
+
+        log.info(f"Access rules updated to version {rules.version}")
+        return rules
+
+
+ENV_RULES = {
+    "WHITE_LISTED": "whitelist",
+    "BLACK_LISTED": "blacklist",
+    "ALLOWED_HOURS": "allowed_hours",
+    "USER_HOURS": "user_hours",
+    "GROUP_HOURS": "group_hours",
+}  # .env setting -> AccessPolicy.compile argument
+
+
+def rules_from_env(env: Mapping[str, str], partial: bool = False) -> dict:
+    """
+    AccessPolicy.compile arguments from .env style settings (WHITE_LISTED,
+    BLACK_LISTED, ALLOWED_HOURS, USER_HOURS, GROUP_HOURS). With `partial`,
+    only the rules whose setting is present in `env` (to merge them over the
+    current ones with PolicyHolder.update); otherwise missing settings get
+    their defaults.
+    """
+
+    rules = {
+        "whitelist": (env.get("WHITE_LISTED") or "").split(","),
+        "blacklist": (env.get("BLACK_LISTED") or "").split(","),
+        "allowed_hours": env.get("ALLOWED_HOURS") or "8,18",
+        "user_hours": parse_hours_map(env.get("USER_HOURS") or ""),
+        "group_hours": parse_hours_map(env.get("GROUP_HOURS") or ""),
+    }
+    if partial:
+        return {rule: rules[rule] for setting, rule in ENV_RULES.items() if setting in env}
+    return rules
+
+
+def parse_hours_map(value: str) -> dict[str, str]:
+    """
+    Parse a JSON object of name (or group id) -> allowed hours spec, as used by
+    the USER_HOURS / GROUP_HOURS settings. An empty value gives an empty map.
+    """
+
+    if not value or not value.strip():
+        return {}
+
+    hours = json.loads(value)
+    if not isinstance(hours, dict):
+        raise ValueError("Expected a JSON object of name -> allowed hours")
+    return {str(k): v for k, v in hours.items()}
@@ -0,0 +1,186 @@
+from app.src.access_policy import END, INSIDE, MINUTES_PER_DAY, Schedule
+from app.utils.attendance_batch import AttendanceBatch
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Union
+from zk.base import Attendance
+import numpy as np
+
+
+RAPID_ENTRY_SECONDS = 30  # consecutive entries of a user closer than this are reported
+
+_US_PER_SECOND = 1_000_000
+_EPOCH = datetime(1970, 1, 1)
+_ONE_US = timedelta(microseconds=1)
+
+
+class RapidEntry(NamedTuple):
+    user_id: str
+    previous: datetime
+    current: datetime
+    seconds: float
+
+
+def _off_hours_index(times_us: np.ndarray, schedule: Schedule) -> np.ndarray:
+    """Positions of the timestamps (µs since 1970) outside the schedule."""
+
+    times = times_us.view("datetime64[us]")
+    days = times.astype("datetime64[D]")
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    minutes = times.astype("datetime64[m]")
+    minute = (minutes - days).astype(np.int64)
+    on_the_minute = minutes == times  # hh:mm:00.000000, the only allowed instant of an END minute
+    bitmap = np.frombuffer(bytes(schedule.bitmap), dtype=np.uint8)
+    allowed = bitmap[weekday * MINUTES_PER_DAY + minute]
+    return np.flatnonzero((allowed != INSIDE) & ~((allowed == END) & on_the_minute))
+
+
+def _rapid_pairs(
+    codes: np.ndarray, times_us: np.ndarray, threshold: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort by (user, time) and diff neighbours of the same user. Returns the
+    sort order, the gaps (µs) and the positions k in the order where records
+    order[k] and order[k + 1] are closer than `threshold` seconds.
+    """
+
+    order = np.lexsort((times_us, codes))
+    sorted_codes = codes[order]
+    gaps = np.diff(times_us[order])
+    rapid_idx = np.flatnonzero(
+        (sorted_codes[1:] == sorted_codes[:-1]) & (gaps < threshold * _US_PER_SECOND)
+    )
+    return order, gaps, rapid_idx
+
+
+def find_off_hours(
+    attendances: Union[list[Attendance], AttendanceBatch], schedule: Schedule
+) -> list[Attendance]:
+    """Records outside the schedule, in log order."""
+
+    if isinstance(attendances, AttendanceBatch):
+        return attendances.take(_off_hours_index(attendances.times_us(), schedule))
+
+    return [att for att in attendances if not schedule.allows(att.timestamp)]
+
+
+def _batch_rapid_entries(
+    batch: AttendanceBatch, last_seen: Optional[dict[str, datetime]], threshold: float
+) -> list[RapidEntry]:
+
+    codes = batch.user_codes.astype(np.int64)
+    times = batch.times_us()
+
+    # each user's last entry from the previous checks joins the comparison
+    if last_seen:
+        present = np.unique(codes)
+        extra = [
+            (code, last_seen[batch.user_ids[code]])
+            for code in present.tolist()
+            if batch.user_ids[code] in last_seen
+        ]
+        if extra:
+            codes = np.concatenate([codes, np.fromiter((c for c, _ in extra), np.int64, len(extra))])
+            times = np.concatenate([
+                times,
+                np.fromiter(((t - _EPOCH) // _ONE_US for _, t in extra), np.int64, len(extra)),
+            ])
+
+    order, gaps, rapid_idx = _rapid_pairs(codes, times, threshold)
+
+    def at(position: int) -> datetime:
+        return _EPOCH + timedelta(microseconds=int(times[position]))
+
+    entries = []
+    for k in rapid_idx.tolist():
+        previous, current = int(order[k]), int(order[k + 1])
+        user_id = batch.user_ids[codes[current]]
+        entries.append(RapidEntry(user_id, at(previous), at(current), int(gaps[k]) / _US_PER_SECOND))
+    return entries
+
+
+def find_rapid_entries(
+    attendances: Union[list[Attendance], AttendanceBatch],
+    last_seen: dict[str, datetime] = None,
+    threshold: float = RAPID_ENTRY_SECONDS,
+) -> list[RapidEntry]:
+    """
+    Consecutive entries of the same user less than `threshold` seconds apart,
+    grouped by user (in order of first appearance) and sorted by time.
+    `last_seen` adds each user's last entry from previous checks.
+    """
+
+    if isinstance(attendances, AttendanceBatch):
+        return _batch_rapid_entries(attendances, last_seen, threshold)
+
+    user_times = defaultdict(list)
+    for att in attendances:
+        user_times[att.user_id].append(att.timestamp)
+
+    entries = []
+    for user_id, times in user_times.items():
+        previous = last_seen.get(user_id) if last_seen else None
+        if previous is not None:
+            times.append(previous)
+        times.sort()
+        for i in range(1, len(times)):
+            time_diff = (times[i] - times[i - 1]).total_seconds()
+            if time_diff < threshold:
+                entries.append(RapidEntry(user_id, times[i - 1], times[i], time_diff))
+
+    return entries
+
+
+def audit_log(
+    attendances: Union[list[Attendance], AttendanceBatch],
+    schedule: Schedule,
+    threshold: float = RAPID_ENTRY_SECONDS,
+) -> tuple[list[Attendance], list[RapidEntry]]:
+    """
+    Full-log audit for the first monitor check: same results, in the same
+    order, as find_off_hours + find_rapid_entries, but computed with NumPy
+    masks over the whole log instead of a Python loop per record. An
+    AttendanceBatch is audited from its columns without building records.
+    """
+
+    if not len(attendances):
+        return [], []
+
+    if isinstance(attendances, AttendanceBatch):
+        return (
+            find_off_hours(attendances, schedule),
+            _batch_rapid_entries(attendances, None, threshold),
+        )
+
+    # intern user ids by first appearance, which is also the report order
+    codes_by_id = {}
+    codes = np.fromiter(
+        (codes_by_id.setdefault(att.user_id, len(codes_by_id)) for att in attendances),
+        dtype=np.int64,
+        count=len(attendances),
+    )
+    # naive datetimes -> microseconds since 1970 (np.array(..., "datetime64") is much slower)
+    times = np.fromiter(
+        ((att.timestamp - _EPOCH) // _ONE_US for att in attendances),
+        dtype=np.int64,
+        count=len(attendances),
+    )
+
+    off_hours_idx = _off_hours_index(times, schedule)
+    order, gaps, rapid_idx = _rapid_pairs(codes, times, threshold)
+
+    off_hours = [attendances[i] for i in off_hours_idx.tolist()]
+    rapid = []
+    for k in rapid_idx.tolist():
+        previous = attendances[order[k]]
+        current = attendances[order[k + 1]]
+        rapid.append(
+            RapidEntry(
+                current.user_id,
+                previous.timestamp,
+                current.timestamp,
+                int(gaps[k]) / _US_PER_SECOND,
+            )
+        )
+
+    return off_hours, rapid
@@ -0,0 +1,115 @@
+from app.utils.attendance_batch import AttendanceBatch
+from zk.base import Attendance
+from datetime import datetime
+from typing import Optional, Union
+
+
+class AttendanceWatermark:
+    """
+    Position of one monitor in one device's attendance log.
+
+    pyzk returns the log oldest record first, so everything after the first
+    `count` records is new as long as the record at the watermark is still
+    the one we saw last (same uid and timestamp). If the log was cleared or
+    rewritten, records newer than `last_timestamp` are treated as new.
+    `last_seen` keeps each user's latest timestamp so rapid entries that
+    straddle two checks are still detected.
+    Logs may be lists of pyzk records or an AttendanceBatch.
+
+    Every monitor of a device keeps its own watermark: records are new to
+    each of them until that monitor has checked them.
+    """
+
+    def __init__(self):
+
+        self.count = 0
+        self.last_uid = None
+        self.last_timestamp: Optional[datetime] = None
+        self.last_seen: dict[str, datetime] = {}
+        self.initialized = False
+
+    def reset(self):
+        self.__init__()
+
+    def changed(self, record_count: int) -> bool:
+        """Cheap check against the device's record counter (from read_sizes)."""
+
+        return not self.initialized or record_count != self.count
+
+    def _matches(self, attendances: list[Attendance]) -> bool:
+
+        if self.count == 0:
+            return True
+        if len(attendances) < self.count:
+            return False
+        record = attendances[self.count - 1]
+        return record.uid == self.last_uid and record.timestamp == self.last_timestamp
+
+    def new_records(
+        self, attendances: Union[list[Attendance], AttendanceBatch]
+    ) -> Union[list[Attendance], AttendanceBatch]:
+        """Return the records past the watermark."""
+
+        if not self.initialized:
+            return attendances
+        if self._matches(attendances):
+            return attendances[self.count :]
+
+        # the log was cleared or rewritten on the device
+        if self.last_timestamp is None:
+            return attendances
+        if isinstance(attendances, AttendanceBatch):
+            return attendances.after(self.last_timestamp)
+        return [att for att in attendances if att.timestamp > self.last_timestamp]
+
+    def advance(
+        self,
+        attendances: Union[list[Attendance], AttendanceBatch],
+        processed: Union[list[Attendance], AttendanceBatch],
+    ):
+        """Move the watermark to the end of `attendances` after `processed` was checked."""
+
+        self.count = len(attendances)
+        if attendances:
+            self.last_uid = attendances[-1].uid
+            self.last_timestamp = attendances[-1].timestamp
+        self._see(processed)
+        self.initialized = True
+
+    def extend(self, records: list[Attendance]):
+        """
+        Move the watermark past `records`, the newest records of the log, when
+        they are known without downloading it (e.g. swipes seen live).
+        """
+
+        if not records:
+            return
+        self.count += len(records)
+        self.last_uid = records[-1].uid
+        self.last_timestamp = records[-1].timestamp
+        self._see(records)
+
+    def anchor(self, record_count: int) -> int:
+        """
+        Place the watermark at the end of a log of `record_count` records (the
+        device's counter) without downloading it, for a watermark fed by live
+        events. Returns how many records were added since it last moved (0 the
+        first time, or if the log shrank).
+        """
+
+        added = record_count - self.count if self.initialized else 0
+        self.count = record_count
+        self.initialized = True
+        return max(added, 0)
+
+    def _see(self, processed: Union[list[Attendance], AttendanceBatch]):
+
+        if isinstance(processed, AttendanceBatch):
+            latest = processed.latest_by_user().items()
+        else:
+            latest = ((att.user_id, att.timestamp) for att in processed)
+        for user_id, timestamp in latest:
+            seen = self.last_seen.get(user_id)
+            if seen is None or timestamp > seen:
+                self.last_seen[user_id] = timestamp
+
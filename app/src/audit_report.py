@@ -0,0 +1,290 @@
+from app.src.access_policy import Schedule
+from app.src.attendance_audit import RAPID_ENTRY_SECONDS, audit_log
+from app.src.events import Event, AuditShard, AuditReport
+from app.src.fleet import FleetDevice
+from app.utils.attendance_batch import AttendanceBatch
+from app.utils.attendance_store import AttendanceStore, device_key
+from app.utils.circuit_breaker import OPEN, DeviceUnavailable, get_circuit_breaker
+from app.utils.helpers import get_connection
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import AsyncGenerator, Iterator, NamedTuple, Optional
+import asyncio
+import heapq
+import logging
+import multiprocessing
+import os
+import time
+
+
+log = logging.getLogger("main.report")
+
+SOURCES = ("store", "device", "archive")
+
+
+class ReportEntry(NamedTuple):
+    timestamp: datetime
+    device: str
+    device_name: Optional[str]
+    kind: str  # "off_hours" or "rapid_entry"
+    user_id: str
+    previous: Optional[datetime] = None  # rapid entries: the entry before
+    seconds: Optional[float] = None  # rapid entries: time since `previous`
+
+
+class ShardResult(NamedTuple):
+    device: str
+    device_name: Optional[str]
+    records: int
+    entries: list[ReportEntry]  # sorted by timestamp
+    seconds: float
+    error: Optional[str] = None
+
+
+def archive_path(archive_dir: str, device: FleetDevice) -> str:
+    """The archive of a device's last downloaded log."""
+
+    return os.path.join(archive_dir, device_key(device.ip, device.port).replace(":", "_"))
+
+
+def _load_log(
+    device: FleetDevice,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    source: str,
+    store_path: Optional[str],
+    archive_dir: Optional[str],
+):
+
+    if source == "store":
+        store = AttendanceStore(store_path)
+        try:
+            return store.records(device_key(device.ip, device.port), start, end)
+        finally:
+            store.close()
+
+    if source == "archive":
+        # memory-mapped: the worker reads the pages of the period it audits only
+        attendances = AttendanceBatch.load(archive_path(archive_dir, device))
+    else:
+        # pooled: a short probe and connect timeout, behind the device's breaker
+        conn = get_connection(device.ip, device.port)
+        with conn as zk:
+            attendances = AttendanceBatch.from_attendances(zk.get_attendance() or [])
+        if archive_dir is not None:
+            attendances.save(archive_path(archive_dir, device))
+
+    return attendances.between(start, end)
+
+
+def audit_shard(
+    device: FleetDevice,
+    start: datetime = None,
+    end: datetime = None,
+    source: str = "store",
+    store_path: str = None,
+    threshold: float = RAPID_ENTRY_SECONDS,
+    archive_dir: str = None,
+) -> ShardResult:
+    """
+    Off-hours and rapid entries of one device's log in [start, end] (one shard
+    of a report). Runs in a worker process; errors are returned in the result.
+    """
+
+    started = time.perf_counter()
+    key = device_key(device.ip, device.port)
+
+    try:
+        schedule = Schedule.parse(device.allowed_hours)
+        attendances = _load_log(device, start, end, source, store_path, archive_dir)
+        off_hours, rapid = audit_log(attendances, schedule, threshold)
+    except Exception as e:
+        return ShardResult(key, device.name, 0, [], time.perf_counter() - started, str(e))
+
+    entries = [
+        ReportEntry(att.timestamp, key, device.name, "off_hours", str(att.user_id))
+        for att in off_hours
+    ]
+    entries.extend(
+        ReportEntry(
+            entry.current, key, device.name, "rapid_entry", str(entry.user_id),
+            entry.previous, entry.seconds,
+        )
+        for entry in rapid
+    )
+    entries.sort()
+
+    return ShardResult(key, device.name, len(attendances), entries, time.perf_counter() - started)
+
+
+def _unavailable(device: FleetDevice, source: str) -> Optional[ShardResult]:
+    """
+    The failed shard of a device whose circuit is open in this process, so
+    no worker waits on a device the server already knows is down.
+    """
+
+    breaker = get_circuit_breaker(device.ip, device.port)
+    if source != "device" or breaker.state != OPEN:
+        return None
+
+    key = device_key(device.ip, device.port)
+    error = DeviceUnavailable(key, breaker.retry_in())
+    return ShardResult(key, device.name, 0, [], 0.0, str(error))
+
+
+def merge_shards(shards: list[ShardResult]) -> list[ReportEntry]:
+    """One report sorted by time (then device) from the sorted shard entries."""
+
+    return list(heapq.merge(*(shard.entries for shard in shards)))
+
+
+def _pool(devices: list[FleetDevice], max_workers: Optional[int]) -> ProcessPoolExecutor:
+
+    workers = max_workers or os.cpu_count() or 1
+    # spawned workers don't inherit the locks of the server's threads (logging, device workers)
+    return ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(devices))),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def _check_source(source: str, archive_dir: Optional[str]):
+
+    if source not in SOURCES:
+        raise ValueError(f"Invalid source '{source}' (expected one of: {', '.join(SOURCES)})")
+    if source == "archive" and archive_dir is None:
+        raise ValueError("The archive source needs an archive directory")
+
+
+def run_audit_report(
+    devices: list[FleetDevice],
+    start: datetime = None,
+    end: datetime = None,
+    source: str = "store",
+    store_path: str = None,
+    max_workers: int = None,
+    threshold: float = RAPID_ENTRY_SECONDS,
+    archive_dir: str = None,
+) -> Iterator[ShardResult]:
+    """
+    Audit the logs of `devices` in a process pool, one shard per device, and
+    yield each shard's result as soon as it finishes. Logs come from the
+    local AttendanceStore at `store_path` (source="store"), are downloaded
+    from the devices (source="device"; each download is archived in
+    `archive_dir` if given) or are the last downloads archived there
+    (source="archive", memory-mapped). Merge with merge_shards.
+
+    Downloads go through the device's pooled connection in the worker. A
+    device whose circuit breaker is open here fails right away, without a
+    worker.
+    """
+
+    _check_source(source, archive_dir)
+
+    reachable = []
+    for device in devices:
+        shard = _unavailable(device, source)
+        if shard is None:
+            reachable.append(device)
+        else:
+            yield shard
+    if not reachable:
+        return
+
+    with _pool(reachable, max_workers) as pool:
+        futures = [
+            pool.submit(
+                audit_shard, device, start, end, source, store_path, threshold, archive_dir
+            )
+            for device in reachable
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _shard_event(shard: ShardResult) -> AuditShard:
+
+    message = f"Audited {shard.records} records of {shard.device}: {len(shard.entries)} findings"
+    if shard.error is not None:
+        message = f"Audit of {shard.device} failed: {shard.error}"
+
+    return AuditShard(
+        device=shard.device,
+        device_name=shard.device_name,
+        records=shard.records,
+        entries=[entry._asdict() for entry in shard.entries],
+        elapsed_seconds=round(shard.seconds, 3),
+        error=shard.error,
+        message=message,
+    )
+
+
+async def audit_report_stream(
+    devices: list[FleetDevice],
+    start: datetime = None,
+    end: datetime = None,
+    source: str = "store",
+    store_path: str = None,
+    max_workers: int = None,
+    threshold: float = RAPID_ENTRY_SECONDS,
+    logger=None,
+    archive_dir: str = None,
+) -> AsyncGenerator[Event, None]:
+    """
+    Async version of run_audit_report for streaming endpoints: yields an
+    audit_shard event per device as its shard finishes, then one audit_report
+    event with the merged report. The event loop only waits on the pool.
+    """
+
+    _check_source(source, archive_dir)
+    if logger is None:
+        logger = log
+
+    logger.info(f"Starting audit report of {len(devices)} devices ({source})")
+
+    started = time.perf_counter()
+    shards = []
+    reachable = []
+    for device in devices:
+        shard = _unavailable(device, source)
+        if shard is None:
+            reachable.append(device)
+            continue
+        logger.warning(f"Audit of {shard.device} failed: {shard.error}")
+        shards.append(shard)
+        yield _shard_event(shard)
+
+    if reachable:
+        loop = asyncio.get_running_loop()
+        pool = _pool(reachable, max_workers)
+        try:
+            futures = [
+                loop.run_in_executor(
+                    pool, audit_shard, device, start, end, source, store_path, threshold,
+                    archive_dir,
+                )
+                for device in reachable
+            ]
+            for next_shard in asyncio.as_completed(futures):
+                shard = await next_shard
+                if shard.error is not None:
+                    logger.warning(f"Audit of {shard.device} failed: {shard.error}")
+                shards.append(shard)
+                yield _shard_event(shard)
+        finally:
+            # a client that went away doesn't keep the remaining shards running
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    entries = merge_shards(shards)
+    failed = [shard.device for shard in shards if shard.error is not None]
+    elapsed = time.perf_counter() - started
+    logger.info(f"Audit report done: {len(entries)} findings in {elapsed:.1f}s")
+
+    yield AuditReport(
+        devices=len(devices),
+        records=sum(shard.records for shard in shards),
+        failed=failed,
+        entries=[entry._asdict() for entry in entries],
+        elapsed_seconds=round(elapsed, 3),
+        message=f"Audit report of {len(devices)} devices: {len(entries)} findings",
+    )
@@ -0,0 +1,431 @@
+from app.src.access_control_core import real_time_access_control_stream
+from app.src.access_policy import AccessPolicy, PolicyHolder, RulesConflict
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.events import Event, SecurityCheckComplete, sse_frame
+from app.src.monitor_core import check_security_stream
+from app.src.session_monitor import SessionMonitor
+from app.src.user_audit import UserSnapshot
+from app.src.spam_detector import SpamDetector
+from app.utils.attendance_store import AttendanceStore
+from app.utils.helpers import ZKConnection, get_connection
+from app.utils.user_directory import UserDirectory, get_user_directory
+from collections import deque
+from itertools import islice
+from typing import AsyncGenerator, NamedTuple, Optional, Union
+import abc
+import asyncio
+import time
+
+
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 1000  # events buffered per subscriber before the oldest are dropped
+DEFAULT_COALESCE = 64  # max queued events sent to a client in one write
+DEFAULT_REPLAY_SIZE = 1000  # recent events kept per device for Last-Event-ID resume
+DEFAULT_LINGER = 30  # seconds the device session outlives its last subscriber
+
+
+class Published(NamedTuple):
+    event: Event
+    frame: bytes  # SSE frame, encoded once and shared by every subscriber
+    seq: int
+
+
+class EventBuffer:
+    """
+    Ring buffer of the last `size` events of a stream, with their ids.
+
+    Ids are "<epoch>-<seq>": seq increases by one per event and the epoch
+    (creation time in ms) changes with every process, so an id from before a
+    restart is never mistaken for a recent one.
+    """
+
+    def __init__(self, size: int = DEFAULT_REPLAY_SIZE):
+
+        self.epoch = int(time.time() * 1000)
+        self.seq = 0
+        self.items: deque[Published] = deque(maxlen=size)
+
+    def publish(self, event: Event) -> Published:
+
+        self.seq += 1
+        published = Published(event, sse_frame(event, f"{self.epoch}-{self.seq}"), self.seq)
+        self.items.append(published)
+        return published
+
+    def since(self, last_event_id: Optional[str]) -> list[Published]:
+        """Buffered events after `last_event_id` (as many as are still kept)."""
+
+        if not last_event_id or not self.items:
+            return []
+        try:
+            epoch, seq = (int(part) for part in last_event_id.split("-"))
+        except ValueError:
+            return []
+        if epoch != self.epoch or seq >= self.seq:
+            return []
+
+        start = max(0, seq + 1 - self.items[0].seq)
+        return list(islice(self.items, start, None))
+
+
+class EventHub(abc.ABC):
+    """
+    Owns one device session that produces events and broadcasts them to any
+    number of subscribers (SSE clients).
+
+    The session starts with the first subscriber and stops `linger` seconds
+    after the last one leaves, so a client that reconnects quickly finds it
+    still running. Recent events are kept in an EventBuffer: a subscriber
+    passing the id of the last event it saw gets the missed ones first.
+    """
+
+    def __init__(
+        self,
+        logger=None,
+        queue_size: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE,
+        replay_size: int = DEFAULT_REPLAY_SIZE,
+        linger: float = DEFAULT_LINGER,
+    ):
+
+        self.logger = logger
+        self.queue_size = queue_size
+        self.linger = linger
+        self.buffer = EventBuffer(replay_size)
+
+        self.subscribers: set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stop_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def subscribe(self, last_event_id: str = None) -> tuple[asyncio.Queue, list[Published]]:
+        """
+        Register a subscriber queue, starting the device session if needed.
+        Also returns the buffered events after `last_event_id` to send first.
+        """
+
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        if not self.running:
+            self._task = asyncio.create_task(self._run(previous=self._task))
+
+        return queue, self.buffer.since(last_event_id)
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Remove a subscriber queue; the session stops `linger` seconds after the last one."""
+
+        self.subscribers.discard(queue)
+
+        if self.subscribers or not self.running:
+            return
+        if self.linger:
+            if self._stop_handle is None:
+                self._stop_handle = asyncio.get_running_loop().call_later(
+                    self.linger, self._stop_if_idle
+                )
+        else:
+            self._task.cancel()
+
+    def _stop_if_idle(self):
+
+        self._stop_handle = None
+        if not self.subscribers and self.running:
+            self._task.cancel()
+
+    async def events(self, last_event_id: str = None) -> AsyncGenerator[Event, None]:
+        """Subscribe and yield events until the session ends or the caller stops iterating."""
+
+        queue, replay = self.subscribe(last_event_id)
+        try:
+            for published in replay:
+                yield published.event
+            while True:
+                published = await queue.get()
+                if published is None:  # session ended
+                    return
+                yield published.event
+        finally:
+            self.unsubscribe(queue)
+
+    async def sse(
+        self, last_event_id: str = None, coalesce: int = DEFAULT_COALESCE
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Like events(), but yields the pre-encoded SSE frames (with ids). Events
+        already waiting in the queue (up to `coalesce`) are joined into one write.
+        """
+
+        queue, replay = self.subscribe(last_event_id)
+        try:
+            if replay:
+                yield b"".join(published.frame for published in replay)
+            while True:
+                published = await queue.get()
+                frames = []
+                while published is not None:
+                    frames.append(published.frame)
+                    if len(frames) >= coalesce or queue.empty():
+                        break
+                    published = queue.get_nowait()
+
+                if frames:
+                    yield b"".join(frames)
+                if published is None:  # session ended
+                    return
+        finally:
+            self.unsubscribe(queue)
+
+    def _broadcast(self, event: Optional[Event]):
+
+        published = None if event is None else self.buffer.publish(event)
+        for queue in self.subscribers:
+            if queue.full():
+                # slow subscriber: drop its oldest event rather than stall the device
+                queue.get_nowait()
+            queue.put_nowait(published)
+
+    @abc.abstractmethod
+    def _source(self) -> AsyncGenerator[Event, None]:
+        """The device session's event stream."""
+
+    async def _run(self, previous: Optional[asyncio.Task] = None):
+
+        # let a session that is still shutting down release the device first
+        if previous is not None and not previous.done():
+            try:
+                await previous
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            async for event in self._source():
+                self._broadcast(event)
+        finally:
+            self._broadcast(None)
+
+
+class AccessControlHub(EventHub):
+    """
+    Owns the single live capture session and decision loop of one device and
+    broadcasts every event to any number of subscribers (SSE clients).
+
+    Settings given to `configure` are used by the next session start;
+    subscribers joining a running session share its settings. The access
+    rules live in `rules` (a PolicyHolder): `configure` only seeds them once,
+    and updating them there applies to the running session from the next
+    swipe, without reconnecting.
+
+    With a `monitor` (SessionMonitor) the session also checks every swipe as
+    a new attendance record, on the same device session, and the monitor's
+    events are broadcast with the access events. The monitor's position in
+    the attendance log is the hub's `watermark`.
+    """
+
+    def __init__(
+        self,
+        conn: ZKConnection,
+        directory: UserDirectory = None,
+        policy: Union[AccessPolicy, PolicyHolder] = None,
+        spam_detector: SpamDetector = None,
+        logger=None,
+        monitor: SessionMonitor = None,
+        **kwargs,
+    ):
+
+        super().__init__(logger=logger, **kwargs)
+        self.conn = conn
+        self.directory = directory or get_user_directory(conn.ip, conn.port)
+        self.rules = policy if isinstance(policy, PolicyHolder) else PolicyHolder(policy)
+        self.spam_detector = spam_detector or SpamDetector()
+        self.monitor = monitor
+        self.watermark = monitor.watermark if monitor is not None else AttendanceWatermark()
+
+    def configure(
+        self,
+        directory: UserDirectory = None,
+        policy: AccessPolicy = None,
+        spam_detector: SpamDetector = None,
+        logger=None,
+        rules: dict = None,
+        monitor: dict = None,
+    ):
+        """
+        Set the settings used by the next session; ignored while a session is running.
+
+        `rules` (AccessPolicy.compile arguments, kept for later partial
+        updates) or `policy` (an already compiled policy) only seed the access
+        rules of a hub whose rules were never set: rules set since (by an
+        earlier session, an update of `rules` or a snapshot) are kept, and
+        different ones raise RulesConflict, running session or not.
+        `monitor` (SessionMonitor settings) adds the live attendance checks to
+        the session; the hub keeps one monitor and its watermark.
+        """
+
+        if rules is not None:
+            self.rules.seed(rules)
+        elif policy is not None and policy is not self.rules.policy:
+            if self.rules.configured:
+                raise RulesConflict(
+                    f"The device already has other access rules (version {self.rules.version})"
+                )
+            self.rules.replace(policy)
+        if self.running:
+            return
+        if directory is not None:
+            self.directory = directory
+        if spam_detector is not None:
+            self.spam_detector = spam_detector
+        if logger is not None:
+            self.logger = logger
+        if monitor is not None:
+            if self.monitor is None:
+                self.monitor = SessionMonitor(watermark=self.watermark, **monitor)
+            else:
+                self.monitor.configure(**monitor)
+        if self.monitor is not None and self.logger is not None:
+            self.monitor.logger = self.logger
+
+    def _source(self) -> AsyncGenerator[Event, None]:
+
+        return real_time_access_control_stream(
+            conn=self.conn,
+            directory=self.directory,
+            policy=self.rules,
+            spam_detector=self.spam_detector,
+            logger=self.logger,
+            monitor=self.monitor,
+        )
+
+
+class MonitorHub(EventHub):
+    """
+    Owns the security monitoring loop of one device and broadcasts its events.
+
+    Only the first session of the hub runs the full first-check audit; a
+    session restarted later continues from the hub's attendance `watermark`
+    and `user_snapshot`. So does the first session when the watermark was
+    restored from a snapshot.
+    """
+
+    def __init__(
+        self,
+        conn: ZKConnection,
+        admin_count: int = 2,
+        allowed_hours: str = "8,18",
+        check_interval: float = 30,
+        store: AttendanceStore = None,
+        logger=None,
+        max_interval: float = None,
+        **kwargs,
+    ):
+
+        super().__init__(logger=logger, **kwargs)
+        self.conn = conn
+        self.admin_count = admin_count
+        self.allowed_hours = allowed_hours
+        self.check_interval = check_interval
+        self.max_interval = max_interval
+        self.store = store
+        self.watermark = AttendanceWatermark()
+        self.user_snapshot = UserSnapshot()
+        self.first_check = True
+
+    def configure(
+        self,
+        admin_count: int = None,
+        allowed_hours: str = None,
+        check_interval: float = None,
+        store: AttendanceStore = None,
+        logger=None,
+        max_interval: float = None,
+    ):
+        """Set the rules used by the next session; ignored while a session is running."""
+
+        if self.running:
+            return
+        if admin_count is not None:
+            self.admin_count = admin_count
+        if allowed_hours is not None:
+            self.allowed_hours = allowed_hours
+        if check_interval is not None:
+            self.check_interval = check_interval
+        if max_interval is not None:
+            self.max_interval = max_interval
+        if store is not None:
+            self.store = store
+        if logger is not None:
+            self.logger = logger
+
+    async def _source(self) -> AsyncGenerator[Event, None]:
+
+        async for event in check_security_stream(
+            conn=self.conn,
+            admin_count=self.admin_count,
+            allowed_time_range=self.allowed_hours,
+            check_interval=self.check_interval,
+            logger=self.logger,
+            store=self.store,
+            first_check=self.first_check and not self.watermark.initialized,
+            max_interval=self.max_interval,
+            watermark=self.watermark,
+            snapshot=self.user_snapshot,
+        ):
+            if isinstance(event, SecurityCheckComplete):
+                self.first_check = False
+            yield event
+
+
+_hubs: dict[tuple, AccessControlHub] = {}
+_monitor_hubs: dict[tuple, MonitorHub] = {}
+
+
+def get_access_control_hub(
+    ip: str, port: int = 4370, timeout: int = 165, ommit_ping: bool = False
+) -> AccessControlHub:
+    """Return the AccessControlHub of the device at (ip, port), creating it if needed."""
+
+    key = (ip, port)
+    hub = _hubs.get(key)
+    if hub is None:
+        conn = ZKConnection(ip=ip, port=port, timeout=timeout, ommit_ping=ommit_ping)
+        hub = AccessControlHub(conn)
+        _hubs[key] = hub
+
+    return hub
+
+
+def find_access_control_hub(ip: str, port: int = 4370) -> Optional[AccessControlHub]:
+    """The AccessControlHub of the device at (ip, port), or None (nothing is created)."""
+
+    return _hubs.get((ip, port))
+
+
+def has_hub(ip: str, port: int = 4370) -> bool:
+    """Whether the device at (ip, port) has an access control or monitor hub."""
+
+    return (ip, port) in _hubs or (ip, port) in _monitor_hubs
+
+
+def get_monitor_hub(
+    ip: str, port: int = 4370, timeout: int = 165, ommit_ping: bool = False
+) -> MonitorHub:
+    """
+    Return the MonitorHub of the device at (ip, port), creating it if needed.
+    Its loop runs on the device's shared get_connection, like the checks of
+    the access control session and the API's transfers: together with the
+    live capture, a device is never asked for more than two sessions.
+    """
+
+    key = (ip, port)
+    hub = _monitor_hubs.get(key)
+    if hub is None:
+        conn = get_connection(ip, port, timeout=timeout, ommit_ping=ommit_ping)
+        hub = MonitorHub(conn)
+        _monitor_hubs[key] = hub
+
+    return hub
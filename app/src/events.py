@@ -0,0 +1,327 @@
+from app.utils.circuit_breaker import HALF_OPEN, OPEN
+from dataclasses import dataclass, field, fields, MISSING
+from datetime import date, datetime, time
+from typing import Any, ClassVar, Optional
+import json
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used without it
+    orjson = None
+
+
+@dataclass(slots=True, kw_only=True)
+class Event:
+    """
+    Base of every streamed event. `event_type` and `severity` are fixed per
+    class; fields declared with a None default are left out of the JSON
+    when unset (e.g. `device`, which only fleet streams fill in).
+    Datetimes are kept as objects and formatted by the encoder.
+    """
+
+    event_type: ClassVar[str] = "event"
+    severity: ClassVar[Optional[str]] = None
+
+    timestamp: datetime = field(default_factory=datetime.now)
+    message: str = ""
+    device: Optional[str] = None
+    device_name: Optional[str] = None
+
+    def to_dict(self) -> dict[str, Any]:
+
+        data = {"event_type": self.event_type}
+        for name, optional in _schema(type(self)):
+            value = getattr(self, name)
+            if value is None and optional:
+                continue
+            data[name] = value
+        if self.severity is not None:
+            data["severity"] = self.severity
+        return data
+
+    def encode(self) -> bytes:
+        """The event as JSON (UTF-8 bytes)."""
+        return encode_json(self.to_dict())
+
+
+# access control
+
+
+@dataclass(slots=True, kw_only=True)
+class AccessGranted(Event):
+    event_type: ClassVar[str] = "access_granted"
+
+    user_id: str
+    user_name: Optional[str]
+    door_unlocked: bool = True
+    policy_version: Optional[int] = None  # version of the access rules that decided
+
+
+@dataclass(slots=True, kw_only=True)
+class AccessDenied(Event):
+    event_type: ClassVar[str] = "access_denied"
+
+    user_id: str
+    user_name: Optional[str]
+    door_unlocked: bool = False
+    policy_version: Optional[int] = None  # version of the access rules that decided
+
+
+@dataclass(slots=True, kw_only=True)
+class RapidEntrySpam(Event):
+    event_type: ClassVar[str] = "rapid_entry_spam"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    user_id: str
+    time_diff_seconds: float
+    entry_times: list[datetime]
+    user_name: Optional[str] = None
+    attempts: Optional[int] = None  # live detection only
+    window_seconds: Optional[float] = None  # live detection only
+
+
+# security monitoring
+
+
+@dataclass(slots=True, kw_only=True)
+class SecurityCheckStarted(Event):
+    event_type: ClassVar[str] = "security_check_started"
+
+    first_check: bool
+
+
+@dataclass(slots=True, kw_only=True)
+class SecurityCheckComplete(Event):
+    event_type: ClassVar[str] = "security_check_complete"
+
+    check_interval: float
+    next_check_in: Optional[float] = None  # fleet monitoring only
+    priority: Optional[bool] = None  # fleet monitoring only
+
+
+@dataclass(slots=True, kw_only=True)
+class TimeDriftAlert(Event):
+    event_type: ClassVar[str] = "time_drift_alert"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    device_time: datetime
+    system_time: datetime
+    time_diff_seconds: float
+
+
+@dataclass(slots=True, kw_only=True)
+class NoUsersFound(Event):
+    event_type: ClassVar[str] = "no_users_found"
+    severity: ClassVar[Optional[str]] = "warning"
+
+
+@dataclass(slots=True, kw_only=True)
+class ExcessAdminUsers(Event):
+    event_type: ClassVar[str] = "excess_admin_users"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    admin_count: int
+    expected_count: int
+    admin_users: list[dict]
+
+
+@dataclass(slots=True, kw_only=True)
+class UserNoPassword(Event):
+    event_type: ClassVar[str] = "user_no_password"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    user_id: str
+    user_name: Optional[str]
+
+
+@dataclass(slots=True, kw_only=True)
+class UserAdded(Event):
+    event_type: ClassVar[str] = "user_added"
+    severity: ClassVar[Optional[str]] = "info"
+
+    user_id: str
+    user_name: Optional[str]
+    privilege: int
+
+
+@dataclass(slots=True, kw_only=True)
+class UserRemoved(Event):
+    event_type: ClassVar[str] = "user_removed"
+    severity: ClassVar[Optional[str]] = "info"
+
+    user_id: str
+    user_name: Optional[str]
+    privilege: int
+
+
+@dataclass(slots=True, kw_only=True)
+class PrivilegeChanged(Event):
+    event_type: ClassVar[str] = "privilege_changed"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    user_id: str
+    user_name: Optional[str]
+    old_privilege: int
+    new_privilege: int
+    admin_count: int
+
+
+@dataclass(slots=True, kw_only=True)
+class InvalidTimeRange(Event):
+    event_type: ClassVar[str] = "invalid_time_range"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    error: str
+
+
+@dataclass(slots=True, kw_only=True)
+class NoAttendances(Event):
+    event_type: ClassVar[str] = "no_attendances"
+    severity: ClassVar[Optional[str]] = "info"
+
+
+@dataclass(slots=True, kw_only=True)
+class AttendanceTimeViolation(Event):
+    event_type: ClassVar[str] = "attendance_time_violation"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    attendance_time: datetime
+    user_id: str
+    allowed_hours: str
+    # the window of the record's weekday (left out on a day without one)
+    allowed_start: Optional[time] = None
+    allowed_end: Optional[time] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class UncheckedRecords(Event):
+    event_type: ClassVar[str] = "unchecked_records"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    count: int
+
+
+# audit reports
+
+
+@dataclass(slots=True, kw_only=True)
+class AuditShard(Event):
+    event_type: ClassVar[str] = "audit_shard"
+
+    records: int
+    entries: list[dict]
+    elapsed_seconds: float
+    error: Optional[str] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class AuditReport(Event):
+    event_type: ClassVar[str] = "audit_report"
+
+    devices: int
+    records: int
+    failed: list[str]
+    entries: list[dict]
+    elapsed_seconds: float
+
+
+# device reachability (circuit breaker)
+
+
+@dataclass(slots=True, kw_only=True)
+class CircuitOpen(Event):
+    event_type: ClassVar[str] = "circuit_open"
+    severity: ClassVar[Optional[str]] = "warning"
+
+    failures: int
+    retry_in_seconds: float
+    error: Optional[str] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class CircuitHalfOpen(Event):
+    event_type: ClassVar[str] = "circuit_half_open"
+    severity: ClassVar[Optional[str]] = "info"
+
+    failures: int
+
+
+@dataclass(slots=True, kw_only=True)
+class CircuitClosed(Event):
+    event_type: ClassVar[str] = "circuit_closed"
+    severity: ClassVar[Optional[str]] = "info"
+
+
+def circuit_event(breaker) -> Event:
+    """The event reporting the current state of a device's CircuitBreaker."""
+
+    if breaker.state == OPEN:
+        retry_in = round(breaker.retry_in(), 3)
+        return CircuitOpen(
+            failures=breaker.failures,
+            retry_in_seconds=retry_in,
+            error=breaker.last_error,
+            message=f"Device {breaker.device} unreachable, next attempt in {retry_in}s",
+        )
+    if breaker.state == HALF_OPEN:
+        return CircuitHalfOpen(
+            failures=breaker.failures,
+            message=f"Trying to reconnect to device {breaker.device}",
+        )
+    return CircuitClosed(message=f"Device {breaker.device} is reachable")
+
+
+# lifecycle
+
+
+@dataclass(slots=True, kw_only=True)
+class SystemShutdown(Event):
+    event_type: ClassVar[str] = "system_shutdown"
+
+
+@dataclass(slots=True, kw_only=True)
+class ErrorEvent(Event):
+    event_type: ClassVar[str] = "error"
+
+    error: str
+
+
+_schemas: dict[type, tuple] = {}
+
+
+def _schema(cls: type) -> tuple[tuple[str, bool], ...]:
+    """(field name, omitted when None) for every field of an event class, computed once."""
+
+    schema = _schemas.get(cls)
+    if schema is None:
+        schema = tuple(
+            (f.name, f.default is None and f.default_factory is MISSING) for f in fields(cls)
+        )
+        _schemas[cls] = schema
+    return schema
+
+
+def _default(value):
+
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Event):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(data) -> bytes:
+    """JSON-encode with orjson when installed, else the stdlib encoder."""
+
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode()
+
+
+def sse_frame(event, event_id=None) -> bytes:
+    """One Server-Sent Events frame for an Event (or a plain dict)."""
+
+    payload = event.encode() if isinstance(event, Event) else encode_json(event)
+    if event_id is None:
+        return b"data: " + payload + b"\n\n"
+    return b"id: " + str(event_id).encode() + b"\ndata: " + payload + b"\n\n"
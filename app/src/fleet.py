@@ -0,0 +1,252 @@
+from app.src.events import Event, SecurityCheckStarted, SecurityCheckComplete, ErrorEvent, circuit_event
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.monitor_core import security_check_cycle_stream
+from app.src.user_audit import UserSnapshot
+from app.utils.attendance_store import AttendanceStore, device_key
+from app.utils.circuit_breaker import CLOSED, OPEN, BreakerWatch
+from app.utils.helpers import get_connection
+from datetime import datetime
+from typing import AsyncGenerator, NamedTuple, Optional
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+
+
+log = logging.getLogger("main.fleet")
+
+DEFAULT_MAX_CONCURRENCY = 10  # device checks running at the same time across the fleet
+DEFAULT_JITTER = 0.1  # +/- fraction of the interval added to every poll
+DEFAULT_ALERT_INTERVAL = 5  # seconds between checks of a device that just raised alerts
+EVENT_QUEUE_SIZE = 1000  # merged events buffered before device checks wait for the consumer
+
+ALERT_SEVERITIES = ("warning", "error")
+
+
+class FleetDevice(NamedTuple):
+    ip: str
+    port: int = 4370
+    admin_count: int = 2
+    allowed_hours: str = "8,18"
+    check_interval: float = 30
+    name: Optional[str] = None
+
+
+def load_inventory(path: str) -> list[FleetDevice]:
+    """
+    Load a device inventory from a JSON file: a list of objects with the
+    FleetDevice fields, e.g. [{"ip": "192.168.1.10", "admin_count": 2}].
+    """
+
+    with open(path) as f:
+        entries = json.load(f)
+
+    if not isinstance(entries, list):
+        raise ValueError(f"Invalid inventory file '{path}': expected a JSON list")
+
+    return [FleetDevice(**entry) for entry in entries]
+
+
+class _DeviceState:
+
+    def __init__(self, device: FleetDevice):
+
+        self.device = device
+        self.key = device_key(device.ip, device.port)
+        # the device's shared connection: fleet streams don't start worker threads of their own
+        self.conn = get_connection(device.ip, device.port)
+        self.watch = BreakerWatch(self.conn.breaker)
+        # the fleet's own view of the device: its first check doesn't reset other monitors'
+        self.watermark = AttendanceWatermark()
+        self.user_snapshot = UserSnapshot()
+        self.first_check = True
+        self.alerted = False
+
+
+class FleetMonitor:
+    """
+    Runs the security checks (general, users, attendances) for a whole fleet of
+    devices in one process and merges their events into one stream.
+
+    - at most `max_concurrency` device checks run at the same time
+    - each device is polled every `check_interval` seconds +/- `jitter`, with
+      first polls spread over the interval so the fleet doesn't fire at once
+    - a device that raised alerts goes to the priority lane: it is polled
+      again after `alert_interval` seconds and served before normal devices
+      when the concurrency cap is reached
+    - each device keeps its own attendance watermark and user snapshot, so
+      the fleet's first check doesn't reset the state of other monitors of
+      the same device (hubs, scripts) and none of them hides new records or
+      user changes from the others
+    - an unreachable device (circuit breaker open) is skipped without
+      connecting until its breaker allows a trial connection
+    """
+
+    def __init__(
+        self,
+        devices: list[FleetDevice],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        jitter: float = DEFAULT_JITTER,
+        alert_interval: float = DEFAULT_ALERT_INTERVAL,
+        logger=None,
+        store: AttendanceStore = None,
+    ):
+
+        self.devices = [_DeviceState(device) for device in devices]
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.alert_interval = alert_interval
+        self.logger = logger or log
+        self.store = store
+
+        self._lanes: tuple[list, list] = ([], [])  # (priority, normal) heaps of (due, seq, state)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+
+    def _schedule(self, state: _DeviceState, delay: float):
+
+        lane = self._lanes[0] if state.alerted else self._lanes[1]
+        heapq.heappush(lane, (time.monotonic() + delay, next(self._seq), state))
+        self._wake.set()
+
+    def _next_delay(self, state: _DeviceState) -> float:
+
+        interval = self.alert_interval if state.alerted else state.device.check_interval
+        return max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def _pop_due(self) -> tuple[Optional[_DeviceState], Optional[float]]:
+        """Pop the next due device (priority lane first), or return the wait until one is due."""
+
+        now = time.monotonic()
+        waits = []
+        for lane in self._lanes:
+            if lane:
+                due = lane[0][0]
+                if due <= now:
+                    return heapq.heappop(lane)[2], None
+                waits.append(due - now)
+
+        return None, min(waits) if waits else None
+
+    async def _check_device(self, state: _DeviceState, queue: asyncio.Queue):
+
+        device = state.device
+        breaker = state.conn.breaker
+        if breaker.state == OPEN:
+            # no check (nor events) until the breaker lets a trial connection through
+            self._schedule(state, breaker.retry_in())
+            return
+
+        started = datetime.now()
+        state.alerted = False
+
+        def tag(event: Event) -> Event:
+            event.device = state.key
+            event.device_name = device.name
+            return event
+
+        if state.watch.poll():
+            await queue.put(tag(circuit_event(breaker)))
+
+        await queue.put(
+            tag(
+                SecurityCheckStarted(
+                    timestamp=started,
+                    message=f"Starting security check cycle (interval: {device.check_interval}s)",
+                    first_check=state.first_check,
+                )
+            )
+        )
+
+        try:
+            async for event in security_check_cycle_stream(
+                state.conn,
+                device.admin_count,
+                device.allowed_hours,
+                state.first_check,
+                self.logger,
+                store=self.store,
+                watermark=state.watermark,
+                snapshot=state.user_snapshot,
+            ):
+                if event.severity in ALERT_SEVERITIES:
+                    state.alerted = True
+                await queue.put(tag(event))
+
+            state.first_check = False
+
+        except Exception as e:
+            # once the circuit opens, its events report the failures
+            if breaker.state == CLOSED:
+                error_msg = f"Error in security monitoring of {state.key}: {e}"
+                self.logger.error(error_msg)
+                await queue.put(tag(ErrorEvent(error=str(e), message=error_msg)))
+
+        # circuit events don't send the device to the priority lane
+        if state.watch.poll():
+            await queue.put(tag(circuit_event(breaker)))
+
+        delay = max(self._next_delay(state), breaker.retry_in())
+        await queue.put(
+            tag(
+                SecurityCheckComplete(
+                    timestamp=started,
+                    message="Security check cycle completed",
+                    check_interval=device.check_interval,
+                    next_check_in=round(delay, 3),
+                    priority=state.alerted,
+                )
+            )
+        )
+        self._schedule(state, delay)
+
+    async def _run(self, queue: asyncio.Queue):
+
+        slots = asyncio.Semaphore(self.max_concurrency)
+        running = set()
+
+        # spread the first polls over each device's interval
+        for state in self.devices:
+            self._schedule(state, random.uniform(0, state.device.check_interval))
+
+        async def check(state: _DeviceState):
+            try:
+                await self._check_device(state, queue)
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+
+                state, wait = self._pop_due()
+                while state is None:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    state, wait = self._pop_due()
+
+                task = asyncio.create_task(check(state))
+                running.add(task)
+                task.add_done_callback(running.discard)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def events(self) -> AsyncGenerator[Event, None]:
+        """Run the fleet and yield the merged events of every device."""
+
+        self.logger.info(f"Starting fleet monitoring of {len(self.devices)} devices")
+
+        queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        runner = asyncio.create_task(self._run(queue))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            runner.cancel()
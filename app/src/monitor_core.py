@@ -1,12 +1,41 @@
+from app.src.access_policy import Schedule
+from app.src.attendance_audit import RapidEntry, audit_log, find_off_hours, find_rapid_entries
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.user_audit import UserSnapshot
+from app.src.events import (
+    Event,
+    SecurityCheckStarted,
+    SecurityCheckComplete,
+    TimeDriftAlert,
+    NoUsersFound,
+    ExcessAdminUsers,
+    UserNoPassword,
+    UserAdded,
+    UserRemoved,
+    PrivilegeChanged,
+    InvalidTimeRange,
+    NoAttendances,
+    AttendanceTimeViolation,
+    RapidEntrySpam,
+    SystemShutdown,
+    ErrorEvent,
+    circuit_event,
+)
 from app.utils import ZKConnection
-from app.utils.helpers import parse_time
-from collections import defaultdict
+from app.utils.attendance_batch import AttendanceBatch
+from app.utils.attendance_store import AttendanceStore, device_key
+from app.utils.circuit_breaker import CLOSED, Backoff, BreakerWatch
+from app.utils.metrics import MONITOR_CYCLE_SECONDS, MONITOR_INTERVAL_SECONDS
+from app.utils.poll_interval import AdaptiveInterval
 from datetime import datetime
-from zk.base import const
+from zk.base import Attendance
 import asyncio
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, Iterator
+import logging
 import time
-import traceback
+
+
+log = logging.getLogger("main.monitor")
 
 
 def check_security(
@@ -15,6 +44,10 @@ def check_security(
     allowed_time_range: tuple = (8, 18),
     check_interval: int = 10,
     logger=None,
+    store: AttendanceStore = None,
+    max_interval: float = None,
+    watermark: AttendanceWatermark = None,
+    snapshot: UserSnapshot = None,
 ):
     """
     Main security check function that continuously performs the following checks:
@@ -22,57 +55,102 @@ def check_security(
     2. User checks (admin count, password checks)
     3. Attendance checks (time range, spam detection)
 
+    New attendance records are saved to `store` when one is given.
+    `watermark` is this monitor's position in the attendance log and `snapshot`
+    its view of the users (new ones by default); the first check is skipped
+    if the watermark was already initialized, e.g. restored from a StateSnapshot.
     This function runs in an infinite loop until interrupted by Ctrl+C.
+    Failed checks are retried with a growing delay (up to `check_interval`),
+    or when the device's circuit breaker allows it again.
+
+    With a `max_interval` above `check_interval` the polling adapts: each wait
+    starts with a cheap size probe, the checks are skipped while the device's
+    user and record counts are unchanged, and the wait doubles up to
+    `max_interval`. New records bring it back to `check_interval`. A full
+    check still runs at least every `max_interval` seconds.
     """
 
-    print(" SECURITY MONITORING ".center(35, "="))
-    if logger:
-        logger.info("Starting security monitoring")
+    if logger is None:
+        logger = log
+
+    logger.info("Starting security monitoring")
+
+    if watermark is None:
+        watermark = AttendanceWatermark()
+    if snapshot is None:
+        snapshot = UserSnapshot()
 
-    first_check = True
+    key = device_key(conn.ip, conn.port)
+    first_check = not watermark.initialized
+    backoff = Backoff(cap=max(check_interval, 1))
+    interval = AdaptiveInterval(check_interval, max_interval)
+    sizes = None
+    full_check_due = 0.0
 
     while True:
         try:
+            changed = False
+            if interval.adaptive:
+                previous, sizes = sizes, _device_sizes(conn)
+                changed = previous is not None and sizes != previous
+                if not (first_check or changed or time.monotonic() >= full_check_due):
+                    # nothing new on the device: skip the checks and wait longer
+                    backoff.reset()
+                    MONITOR_INTERVAL_SECONDS.set(key, value=interval.update(False))
+                    time.sleep(interval.current)
+                    continue
+
             if first_check:
-                print("Performing initial comprehensive security check...")
-                if logger:
-                    logger.info("Performing initial comprehensive security check")
+                logger.info("Performing initial comprehensive security check")
             else:
-                print("Initiating security check...")
-                if logger:
-                    logger.info("Initiating periodic security check")
+                logger.info("Initiating periodic security check")
 
+            started = time.perf_counter()
             general_check(conn, logger=logger)
-            check_users(conn, admin_count, first_check, logger=logger)
-            check_attendances(conn, allowed_time_range, first_check, logger=logger)
+            check_users(conn, admin_count, first_check, logger=logger, snapshot=snapshot)
+            check_attendances(
+                conn, allowed_time_range, first_check, logger=logger, watermark=watermark, store=store
+            )
+            MONITOR_CYCLE_SECONDS.observe(key, value=time.perf_counter() - started)
+
+            delay = interval.update(changed)
+            full_check_due = time.monotonic() + interval.maximum
+            MONITOR_INTERVAL_SECONDS.set(key, value=delay)
 
             if first_check:
-                print("Initial security check completed.")
-                if logger:
-                    logger.info("Initial security check completed")
+                logger.info("Initial security check completed")
                 first_check = False
             else:
-                print("Security check completed.")
-                if logger:
-                    logger.info("Security check completed")
-
-            print("=" * 35)
+                logger.info(f"Security check completed (next in {delay:g}s)")
 
-            time.sleep(check_interval)
+            backoff.reset()
+            time.sleep(delay)
 
         except KeyboardInterrupt:
-            print("\nSecurity monitoring stopped by user.")
-            if logger:
-                logger.info("Security monitoring stopped by user interrupt")
+            logger.info("Security monitoring stopped by user interrupt")
             break
         except Exception as e:
-            error_msg = f"Error in security monitoring: {e}"
-            print(error_msg)
-            traceback.print_exc()
-            if logger:
-                logger.error(error_msg)
-            print("Continuing monitoring...\n")
-            time.sleep(5)  # brief delay before retrying
+            # once the circuit opens, the breaker logs the failures
+            if conn.breaker.state == CLOSED:
+                logger.error(f"Error in security monitoring: {e}", exc_info=True)
+            delay = conn.breaker.retry_in() or backoff.next()
+            logger.info(f"Continuing monitoring in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+def _device_sizes(conn: ZKConnection) -> tuple[int, int]:
+    """User and attendance record counts of the device (one cheap call)."""
+
+    with conn as zk:
+        zk.read_sizes()
+        return zk.users, zk.records
+
+
+async def _device_sizes_async(conn: ZKConnection) -> tuple[int, int]:
+
+    async with conn as zk:
+        await conn.run(zk.read_sizes)
+        return zk.users, zk.records
 
 
 def check_attendances(
@@ -80,121 +158,140 @@ def check_attendances(
     allowed_time_range: tuple = (8, 18),
     first_check: bool = False,
     logger=None,
+    watermark: AttendanceWatermark = None,
+    store: AttendanceStore = None,
 ):
+    """
+    Check the attendance log for off-hours entries and rapid consecutive entries.
+    The first check audits the whole log; later checks only look at the records
+    past the caller's `watermark` and skip the download when the record count
+    reported by the device hasn't changed (without a watermark every record is
+    new). Checked records are saved to `store`.
+    The downloaded log is kept as an AttendanceBatch and checked from its
+    columns.
+    """
 
-    if not allowed_time_range or len(allowed_time_range) != 2:
-        print("Invalid allowed_time_range provided. Skipping attendance time checks.")
-        if logger:
-            logger.warning(
-                "Invalid allowed_time_range provided. Skipping attendance time checks."
-            )
+    if watermark is None:
+        watermark = AttendanceWatermark()
+    if logger is None:
+        logger = log
+
+    # compile the allowed hours once instead of parsing them for every record
+    try:
+        if not allowed_time_range:
+            raise ValueError("no allowed hours given")
+        schedule = Schedule.parse(allowed_time_range)
+    except (ValueError, TypeError) as e:
+        logger.warning(
+            f"Invalid allowed_time_range provided ({e}). Skipping attendance time checks."
+        )
         return
 
+    allowed_range = schedule.describe()
+
     with conn as zk:
+        if first_check:
+            watermark.reset()
+        else:
+            # cheap size probe: skip the full log download if nothing was added
+            zk.read_sizes()
+            if not watermark.changed(zk.records):
+                return
+
         # check if attendances times are within the allowed range
         attendances = zk.get_attendance()
         if not attendances:
-            print("No attendances found.")
-            if logger:
-                logger.warning("No attendances found.")
+            logger.warning("No attendances found.")
+        attendances = AttendanceBatch.from_attendances(attendances or [])
 
-        check_range = None  # attendances concerned with this iteration
+        # attendances concerned with this iteration (everything on the first check)
+        check_range = watermark.new_records(attendances)
 
         if first_check:
-            check_range = attendances
+            # whole-log audit, vectorized
+            off_hours, rapid_entries = audit_log(check_range, schedule)
         else:
-            # Only check the first 3 attendances if there are more than 3
-            # This is to avoid overwhelming the system with too many checks
-            # and to focus on the most recent entries.
-            # I think 3 is a good numner to balance overlap between iterations and ensure security.
-            if len(attendances) < 3:
-                check_range = attendances
-            else:
-                check_range = attendances[:3]
-
-        for attendance in check_range:
-
-            attendance_time = attendance.timestamp.time()
+            off_hours, rapid_entries = _audit_new_records(check_range, schedule, watermark.last_seen)
 
-            try:
-                start_time = parse_time(allowed_time_range[0])
-                end_time = parse_time(allowed_time_range[1])
-            except ValueError as e:
-                print(f"Error parsing time format in attendance check: {e}")
-                if logger:
-                    logger.error(f"Error parsing time format in attendance check: {e}")
-                continue
-
-            if not (start_time <= attendance_time <= end_time):
-                print(
-                    f"Security alert! Attendance at {attendance.timestamp} is outside the allowed range ({start_time} - {end_time})."
-                )
-                if logger:
-                    logger.warning(
-                        f"Security alert! Attendance at {attendance.timestamp} is outside the allowed range ({start_time} - {end_time})."
-                    )
+        for attendance in off_hours:
+            logger.warning(
+                f"Security alert! Attendance at {attendance.timestamp} is outside the allowed range ({allowed_range})."
+            )
 
-        user_times = defaultdict(list)
+        # Check for spam (per user)
+        for entry in rapid_entries:
+            logger.warning(
+                f"Security Alert: Rapid consecutive entries for user {entry.user_id}"
+            )
 
-        for att in check_range:
-            user_times[att.user_id].append(att.timestamp)
+        if store is not None:
+            store.add(device_key(conn.ip, conn.port), check_range)
 
-        # Check for spam (per user)
-        for user_id, times in user_times.items():
-            times.sort()
-            for i in range(1, len(times)):
-                time_diff = (times[i] - times[i - 1]).total_seconds()
-                if time_diff < 30:  # < 30 sec
-                    print(
-                        f"Security Alert: Rapid consecutive entries for user {user_id}"
-                    )
-                    if logger:
-                        logger.warning(
-                            f"Security Alert: Rapid consecutive entries for user {user_id}"
-                        )
+        watermark.advance(attendances, check_range)
 
 
 def general_check(conn: ZKConnection, logger=None):
 
+    if logger is None:
+        logger = log
+
     with conn as zk:
         device_time = zk.get_time()
         system_time = datetime.now()
         time_diff = abs((device_time - system_time).total_seconds())
 
         if time_diff > 300:  # 5 minutes tolerance
-            print(f"Security Alert: Device time drift detected ({time_diff} seconds)")
-            if logger:
-                logger.warning(
-                    f"Security Alert: Device time drift detected ({time_diff} seconds)"
-                )
+            logger.warning(
+                f"Security Alert: Device time drift detected ({time_diff} seconds)"
+            )
+
 
+def check_users(
+    conn: ZKConnection,
+    admin_count: int,
+    first_check: bool,
+    logger=None,
+    snapshot: UserSnapshot = None,
+):
+    """
+    Diff the users against the caller's UserSnapshot (a new one by default):
+    log added, removed and re-privileged users, the admin count on every
+    check while there are too many admins, and users without a password
+    among the new or modified ones (every user on the first check).
+    """
 
-def check_users(conn: ZKConnection, admin_count: int, first_check: bool, logger=None):
+    if snapshot is None:
+        snapshot = UserSnapshot()
+    if logger is None:
+        logger = log
 
     with conn as zk:
         users = zk.get_users()
-        if not users:
-            print("No users found.")
-            return
 
-        admin_users = [u for u in users if u.privilege == const.USER_ADMIN]
-        if len(admin_users) > admin_count:
-            print(f"Security Alert: Too many admin users ({len(admin_users)})")
-            if logger:
-                logger.warning(
-                    f"Security Alert: Too many admin users ({len(admin_users)})"
-                )
+    if first_check:
+        snapshot.reset()
+    changes = snapshot.update(users or [])
+
+    for row in changes.added:
+        logger.info(f"User {row.user_id} ({row.name}) was added to the device")
+    for row in changes.removed:
+        logger.info(f"User {row.user_id} ({row.name}) was removed from the device")
+    for before, after in changes.privilege_changed:
+        logger.warning(
+            f"Security Alert: Privilege of user {after.user_id} changed from {before.privilege} to {after.privilege}"
+        )
 
-        if first_check:
-            # check if users with no password exist
-            # this is annoying to loop so we keep it for the first check
-            for user in users:
-                if not user.password or user.password == "":
-                    print(f"Security Alert: User {user.user_id} has no password set.")
-                    if logger:
-                        logger.warning(
-                            f"Security Alert: User {user.user_id} has no password set."
-                        )
+    if not users:
+        logger.warning("No users found.")
+        return
+
+    if snapshot.admin_count > admin_count:
+        logger.warning(f"Security Alert: Too many admin users ({snapshot.admin_count})")
+
+    # only users that are new or changed since the last check
+    for row in changes.changed:
+        if not row.password_set:
+            logger.warning(f"Security Alert: User {row.user_id} has no password set.")
 
 
 async def check_security_stream(
@@ -203,97 +300,183 @@ async def check_security_stream(
     allowed_time_range: tuple = (8, 18),
     check_interval: int = 30,
     logger=None,
-) -> AsyncGenerator[Dict[str, Any], None]:
+    store: AttendanceStore = None,
+    first_check: bool = True,
+    max_interval: float = None,
+    watermark: AttendanceWatermark = None,
+    snapshot: UserSnapshot = None,
+) -> AsyncGenerator[Event, None]:
     """
     Async generator version of check_security for streaming endpoints.
     Continuously performs security checks and yields results as they occur.
+    Device calls run on the connection's worker thread, off the event loop.
 
     Args:
         conn: ZKConnection instance
         admin_count: Expected number of admin users
         allowed_time_range: Tuple of allowed hours (start, end)
-        check_interval: Seconds between security checks
+        check_interval: Seconds between security checks (the shortest wait
+            when polling adapts)
         logger: Logger instance
+        store: AttendanceStore that new attendance records are saved to
+        first_check: Start with the full audit (False when resuming a device
+            whose log was already audited)
+        max_interval: Longest wait between checks of an idle device; polling
+            is fixed at `check_interval` when not above it
+        watermark: This monitor's position in the attendance log (a new one
+            by default)
+        snapshot: This monitor's UserSnapshot of the device's users (a new
+            one by default)
+
+    When polling adapts, a size probe decides whether to run the checks: they
+    are skipped while the user and record counts are unchanged, and the wait
+    doubles after every check without new records or alerts. The current wait
+    is reported as `check_interval` in security_check_complete events.
+
+    Failed cycles are retried with a growing delay (up to `check_interval`);
+    while the device is unreachable its circuit breaker sets the retry time
+    and its state changes are yielded as circuit events.
     """
 
-    print(" SECURITY MONITORING STREAM ".center(35, "="))
-    if logger:
-        logger.info("Starting security monitoring stream")
+    if logger is None:
+        logger = log
 
-    first_check = True
+    if watermark is None:
+        watermark = AttendanceWatermark()
+    if snapshot is None:
+        snapshot = UserSnapshot()
+
+    logger.info("Starting security monitoring stream")
+
+    key = device_key(conn.ip, conn.port)
+    watch = BreakerWatch(conn.breaker)
+    backoff = Backoff(cap=max(check_interval, 1))
+    interval = AdaptiveInterval(check_interval, max_interval)
+    sizes = None
+    full_check_due = 0.0
 
     while True:
         try:
-            timestamp = datetime.now().isoformat()
-            
+            if watch.poll():
+                yield circuit_event(conn.breaker)
+
+            changed = False
+            if interval.adaptive:
+                previous, sizes = sizes, await _device_sizes_async(conn)
+                changed = previous is not None and sizes != previous
+                if not (first_check or changed or time.monotonic() >= full_check_due):
+                    # nothing new on the device: skip the checks and wait longer
+                    backoff.reset()
+                    MONITOR_INTERVAL_SECONDS.set(key, value=interval.update(False))
+                    await asyncio.sleep(interval.current)
+                    continue
+
+            timestamp = datetime.now()
+
             # Yield start of check cycle
-            yield {
-                "event_type": "security_check_started",
-                "timestamp": timestamp,
-                "message": f"Starting security check cycle (interval: {check_interval}s)",
-                "first_check": first_check,
-            }
-
-            # General device checks
-            async for event in general_check_stream(conn, logger):
-                yield event
+            yield SecurityCheckStarted(
+                timestamp=timestamp,
+                message=f"Starting security check cycle (interval: {interval.current:g}s)",
+                first_check=first_check,
+            )
 
-            # User checks
-            async for event in check_users_stream(
-                conn, admin_count, first_check, logger
+            alerts = 0
+            async for event in security_check_cycle_stream(
+                conn, admin_count, allowed_time_range, first_check, logger,
+                store=store, watermark=watermark, snapshot=snapshot,
             ):
+                if event.severity == "warning":
+                    alerts += 1
                 yield event
 
-            # Attendance checks
-            async for event in check_attendances_stream(
-                conn, allowed_time_range, first_check, logger
-            ):
-                yield event
+            if watch.poll():
+                yield circuit_event(conn.breaker)
+
+            delay = interval.update(changed or alerts > 0)
+            full_check_due = time.monotonic() + interval.maximum
+            MONITOR_INTERVAL_SECONDS.set(key, value=delay)
 
             # Yield periodic status update
-            yield {
-                "event_type": "security_check_complete",
-                "timestamp": timestamp,
-                "message": "Security check cycle completed",
-                "check_interval": check_interval,
-            }
+            yield SecurityCheckComplete(
+                timestamp=timestamp,
+                message=f"Security check cycle completed (next in {delay:g}s)",
+                check_interval=delay,
+            )
 
             first_check = False
+            backoff.reset()
 
             # Wait before next check cycle
-            await asyncio.sleep(check_interval)
+            await asyncio.sleep(delay)
 
         except KeyboardInterrupt:
-            print("\nSecurity monitoring stream stopped by user.")
-            if logger:
-                logger.info("Security monitoring stream stopped by user interrupt")
-            yield {
-                "event_type": "system_shutdown",
-                "timestamp": datetime.now().isoformat(),
-                "message": "Security monitoring stopped by user",
-            }
+            logger.info("Security monitoring stream stopped by user interrupt")
+            yield SystemShutdown(message="Security monitoring stopped by user")
             break
         except Exception as e:
-            error_msg = f"Error in security monitoring stream: {e}"
-            print(error_msg)
-            if logger:
+            # once the circuit opens, its events report the failures
+            if conn.breaker.state == CLOSED:
+                error_msg = f"Error in security monitoring stream: {e}"
                 logger.error(error_msg)
 
-            yield {
-                "event_type": "error",
-                "timestamp": datetime.now().isoformat(),
-                "error": str(e),
-                "message": error_msg,
-            }
+                yield ErrorEvent(error=str(e), message=error_msg)
+
+            if watch.poll():
+                yield circuit_event(conn.breaker)
+
+            await asyncio.sleep(conn.breaker.retry_in() or backoff.next())
+
+
+async def security_check_cycle_stream(
+    conn: ZKConnection,
+    admin_count: int,
+    allowed_time_range: tuple = (8, 18),
+    first_check: bool = False,
+    logger=None,
+    store: AttendanceStore = None,
+    watermark: AttendanceWatermark = None,
+    snapshot: UserSnapshot = None,
+) -> AsyncGenerator[Event, None]:
+    """
+    One cycle of the security checks (device, users, attendances) as a stream.
+    `watermark` and `snapshot` are the caller's position in the attendance log
+    and its view of the users; the first check resets them.
+    """
+
+    started = time.perf_counter()
+
+    # General device checks
+    async for event in general_check_stream(conn, logger):
+        yield event
+
+    # User checks
+    async for event in check_users_stream(
+        conn, admin_count, first_check, logger, snapshot=snapshot
+    ):
+        yield event
+
+    # Attendance checks
+    async for event in check_attendances_stream(
+        conn, allowed_time_range, first_check, logger, watermark=watermark, store=store
+    ):
+        yield event
+
+    # includes the time the consumer took to take the events
+    MONITOR_CYCLE_SECONDS.observe(
+        device_key(conn.ip, conn.port), value=time.perf_counter() - started
+    )
 
 
 async def general_check_stream(
     conn: ZKConnection, logger=None
-) -> AsyncGenerator[Dict[str, Any], None]:
+) -> AsyncGenerator[Event, None]:
     """Stream version of general_check"""
 
-    with conn as zk:
-        device_time = zk.get_time()
+    if logger is None:
+        logger = log
+
+    async with conn as zk:
+        device_time = await conn.run(zk.get_time)
         system_time = datetime.now()
         time_diff = abs((device_time - system_time).total_seconds())
 
@@ -301,75 +484,166 @@ async def general_check_stream(
             message = (
                 f"Security Alert: Device time drift detected ({time_diff} seconds)"
             )
-            print(message)
-            if logger:
-                logger.warning(message)
-
-            yield {
-                "event_type": "time_drift_alert",
-                "timestamp": datetime.now().isoformat(),
-                "device_time": device_time.isoformat(),
-                "system_time": system_time.isoformat(),
-                "time_diff_seconds": time_diff,
-                "message": message,
-                "severity": "warning",
-            }
+            logger.warning(message)
+
+            yield TimeDriftAlert(
+                timestamp=system_time,
+                device_time=device_time,
+                system_time=system_time,
+                time_diff_seconds=time_diff,
+                message=message,
+            )
 
 
 async def check_users_stream(
-    conn: ZKConnection, admin_count: int, first_check: bool, logger=None
-) -> AsyncGenerator[Dict[str, Any], None]:
-    """Stream version of check_users"""
+    conn: ZKConnection,
+    admin_count: int,
+    first_check: bool,
+    logger=None,
+    snapshot: UserSnapshot = None,
+) -> AsyncGenerator[Event, None]:
+    """
+    Stream version of check_users. Yields user_added, user_removed and
+    privilege_changed events, excess admins on every check while there are
+    too many, and missing passwords among the new or modified users.
+    """
 
-    with conn as zk:
-        users = zk.get_users()
-        if not users:
-            yield {
-                "event_type": "no_users_found",
-                "timestamp": datetime.now().isoformat(),
-                "message": "No users found on device",
-                "severity": "warning",
-            }
-            return
+    if snapshot is None:
+        snapshot = UserSnapshot()
+    if logger is None:
+        logger = log
+
+    async with conn as zk:
+        users = await conn.run(zk.get_users)
+
+    if first_check:
+        snapshot.reset()
+    # the diff is O(changes) after one list comparison, but keep it off the loop anyway
+    changes = await conn.run(snapshot.update, users or [])
+    now = datetime.now()
+
+    for row in changes.added:
+        message = f"User {row.user_id} ({row.name}) was added to the device"
+        logger.info(message)
+
+        yield UserAdded(
+            timestamp=now,
+            user_id=row.user_id,
+            user_name=row.name,
+            privilege=row.privilege,
+            message=message,
+        )
 
-        admin_users = [u for u in users if u.privilege == const.USER_ADMIN]
-        if len(admin_users) > admin_count:
-            message = f"Security Alert: Too many admin users ({len(admin_users)})"
-            print(message)
-            if logger:
-                logger.warning(message)
-
-            yield {
-                "event_type": "excess_admin_users",
-                "timestamp": datetime.now().isoformat(),
-                "admin_count": len(admin_users),
-                "expected_count": admin_count,
-                "admin_users": [
-                    {"user_id": u.user_id, "name": u.name} for u in admin_users
-                ],
-                "message": message,
-                "severity": "warning",
-            }
+    for row in changes.removed:
+        message = f"User {row.user_id} ({row.name}) was removed from the device"
+        logger.info(message)
 
-        if first_check:
-            # Check for users with no password
-            for user in users:
-                if not user.password or user.password == "":
-                    message = (
-                        f"Security Alert: User {user.user_id} has no password set."
-                    )
-                    print(message)
-                    if logger:
-                        logger.warning(message)
-
-                    yield {
-                        "event_type": "user_no_password",
-                        "timestamp": datetime.now().isoformat(),
-                        "user_id": user.user_id,
-                        "user_name": user.name,
-                        "message": message,
-                        "severity": "warning",
-                    }
+        yield UserRemoved(
+            timestamp=now,
+            user_id=row.user_id,
+            user_name=row.name,
+            privilege=row.privilege,
+            message=message,
+        )
+
+    for before, after in changes.privilege_changed:
+        message = f"Security Alert: Privilege of user {after.user_id} changed from {before.privilege} to {after.privilege}"
+        logger.warning(message)
+
+        yield PrivilegeChanged(
+            timestamp=now,
+            user_id=after.user_id,
+            user_name=after.name,
+            old_privilege=before.privilege,
+            new_privilege=after.privilege,
+            admin_count=snapshot.admin_count,
+            message=message,
+        )
+
+    if not users:
+        yield NoUsersFound(message="No users found on device")
+        return
+
+    if snapshot.admin_count > admin_count:
+        message = f"Security Alert: Too many admin users ({snapshot.admin_count})"
+        logger.warning(message)
+
+        yield ExcessAdminUsers(
+            timestamp=now,
+            admin_count=snapshot.admin_count,
+            expected_count=admin_count,
+            admin_users=[{"user_id": u.user_id, "name": u.name} for u in snapshot.admins.values()],
+            message=message,
+        )
+
+    # Check for users with no password (only new or changed since the last check)
+    for row in changes.changed:
+        if not row.password_set:
+            message = f"Security Alert: User {row.user_id} has no password set."
+            logger.warning(message)
+
+            yield UserNoPassword(
+                timestamp=now,
+                user_id=row.user_id,
+                user_name=row.name,
+                message=message,
+            )
+
+
+def _audit_new_records(
+    records: list[Attendance], schedule: Schedule, last_seen: dict[str, datetime]
+) -> tuple[list[Attendance], list[RapidEntry]]:
+
+    # include each user's last entry from the previous checks
+    return find_off_hours(records, schedule), find_rapid_entries(records, last_seen)
+
+
+def attendance_alerts(
+    off_hours: list[Attendance],
+    rapid_entries: list[RapidEntry],
+    schedule: Schedule,
+    logger=None,
+) -> Iterator[Event]:
+    """Log and yield the events of the attendance checks' findings."""
+
+    if logger is None:
+        logger = log
+
+    allowed_range = schedule.describe()
+
+    # one timestamp for the events of this batch
+    now = datetime.now()
+
+    # Check time range violations
+    for attendance in off_hours:
+        message = f"Security alert! Attendance at {attendance.timestamp} is outside the allowed range ({allowed_range})."
+        logger.warning(message)
+
+        window = schedule.window_on(attendance.timestamp)
+        yield AttendanceTimeViolation(
+            timestamp=now,
+            attendance_time=attendance.timestamp,
+            user_id=attendance.user_id,
+            allowed_start=window.start if window else None,
+            allowed_end=window.end if window else None,
+            allowed_hours=allowed_range,
+            message=message,
+        )
+
+    # Check for spam (rapid consecutive entries)
+    for entry in rapid_entries:
+        message = (
+            f"Security Alert: Rapid consecutive entries for user {entry.user_id}"
+        )
+        logger.warning(message)
+
+        yield RapidEntrySpam(
+            timestamp=now,
+            user_id=entry.user_id,
+            time_diff_seconds=entry.seconds,
+            entry_times=[entry.previous, entry.current],
+            message=message,
+        )
 
 
 async def check_attendances_stream(
@@ -377,92 +651,58 @@ async def check_attendances_stream(
     allowed_time_range: tuple = (8, 18),
     first_check: bool = False,
     logger=None,
-) -> AsyncGenerator[Dict[str, Any], None]:
+    watermark: AttendanceWatermark = None,
+    store: AttendanceStore = None,
+) -> AsyncGenerator[Event, None]:
     """Stream version of check_attendances"""
 
-    if not allowed_time_range or len(allowed_time_range) != 2:
-        yield {
-            "event_type": "invalid_time_range",
-            "timestamp": datetime.now().isoformat(),
-            "message": "Invalid allowed_time_range provided. Skipping attendance time checks.",
-            "severity": "warning",
-        }
+    if watermark is None:
+        watermark = AttendanceWatermark()
+    if logger is None:
+        logger = log
+
+    try:
+        if not allowed_time_range:
+            raise ValueError("no allowed hours given")
+        schedule = Schedule.parse(allowed_time_range)
+    except (ValueError, TypeError) as e:
+        yield InvalidTimeRange(
+            error=str(e),
+            message="Invalid allowed_time_range provided. Skipping attendance time checks.",
+        )
         return
 
-    with conn as zk:
-        attendances = zk.get_attendance()
+    async with conn as zk:
+        if first_check:
+            watermark.reset()
+        else:
+            # cheap size probe: skip the full log download if nothing was added
+            await conn.run(zk.read_sizes)
+            if not watermark.changed(zk.records):
+                return
+
+        attendances = await conn.run(zk.get_attendance)
+        attendances = await conn.run(AttendanceBatch.from_attendances, attendances or [])
         if not attendances:
-            yield {
-                "event_type": "no_attendances",
-                "timestamp": datetime.now().isoformat(),
-                "message": "No attendances found",
-                "severity": "info",
-            }
+            watermark.advance(attendances, [])
+            yield NoAttendances(message="No attendances found")
             return
 
-        check_range = (
-            attendances
-            if first_check
-            else (attendances[:3] if len(attendances) >= 3 else attendances)
-        )
+        check_range = watermark.new_records(attendances)
+
+        # the audit is CPU work on the whole log: run it on the worker, off the event loop
+        if first_check:
+            # whole-log audit, vectorized
+            off_hours, rapid_entries = await conn.run(audit_log, check_range, schedule)
+        else:
+            off_hours, rapid_entries = await conn.run(
+                _audit_new_records, check_range, schedule, watermark.last_seen
+            )
+
+        for event in attendance_alerts(off_hours, rapid_entries, schedule, logger):
+            yield event
+
+        if store is not None:
+            await conn.run(store.add, device_key(conn.ip, conn.port), check_range)
 
-        # Check time range violations
-        for attendance in check_range:
-            attendance_time = attendance.timestamp.time()
-
-            try:
-                start_time = parse_time(allowed_time_range[0])
-                end_time = parse_time(allowed_time_range[1])
-            except ValueError as e:
-                yield {
-                    "event_type": "time_parse_error",
-                    "timestamp": datetime.now().isoformat(),
-                    "error": str(e),
-                    "message": f"Error parsing time format in attendance check: {e}",
-                    "severity": "error",
-                }
-                continue
-
-            if not (start_time <= attendance_time <= end_time):
-                message = f"Security alert! Attendance at {attendance.timestamp} is outside the allowed range ({start_time} - {end_time})."
-                print(message)
-                if logger:
-                    logger.warning(message)
-
-                yield {
-                    "event_type": "attendance_time_violation",
-                    "timestamp": datetime.now().isoformat(),
-                    "attendance_time": attendance.timestamp.isoformat(),
-                    "user_id": attendance.user_id,
-                    "allowed_start": start_time.isoformat(),
-                    "allowed_end": end_time.isoformat(),
-                    "message": message,
-                    "severity": "warning",
-                }
-
-        # Check for spam (rapid consecutive entries)
-        user_times = defaultdict(list)
-        for att in check_range:
-            user_times[att.user_id].append(att.timestamp)
-
-        for user_id, times in user_times.items():
-            times.sort()
-            for i in range(1, len(times)):
-                time_diff = (times[i] - times[i - 1]).total_seconds()
-                if time_diff < 30:  # < 30 sec
-                    message = (
-                        f"Security Alert: Rapid consecutive entries for user {user_id}"
-                    )
-                    print(message)
-                    if logger:
-                        logger.warning(message)
-
-                    yield {
-                        "event_type": "rapid_entry_spam",
-                        "timestamp": datetime.now().isoformat(),
-                        "user_id": user_id,
-                        "time_diff_seconds": time_diff,
-                        "entry_times": [t.isoformat() for t in times[i - 1 : i + 1]],
-                        "message": message,
-                        "severity": "warning",
-                    }
+        watermark.advance(attendances, check_range)
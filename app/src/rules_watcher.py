@@ -0,0 +1,91 @@
+from app.src.access_policy import PolicyHolder, rules_from_env
+from dotenv import dotenv_values
+from typing import Optional
+import logging
+import os
+import threading
+
+
+log = logging.getLogger("main.access_policy")
+
+DEFAULT_WATCH_INTERVAL = 2  # seconds between checks of the rules file
+
+
+class RulesFileWatcher:
+    """
+    Applies the access rules of a .env style file (WHITE_LISTED, BLACK_LISTED,
+    ALLOWED_HOURS, USER_HOURS, GROUP_HOURS) to a PolicyHolder whenever the
+    file changes, so a running decision loop picks them up on its next swipe
+    without reconnecting to the device. Only the rules the file sets are
+    changed; the others keep their current value.
+
+    The file is polled every `interval` seconds from a daemon thread (a stat
+    call; it is only read when its modification time or size changed). An
+    invalid file is logged and the current rules are kept.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        holder: PolicyHolder,
+        interval: float = DEFAULT_WATCH_INTERVAL,
+        logger=None,
+    ):
+
+        self.path = path
+        self.holder = holder
+        self.interval = interval
+        self.logger = logger or log
+
+        self._stamp = self._stat()  # the rules loaded at startup are already applied
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Optional[tuple]:
+
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """Apply the file if it changed since the last check; True if new rules were applied."""
+
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+
+        try:
+            rules = self.holder.update(**rules_from_env(dotenv_values(self.path), partial=True))
+        except ValueError as e:
+            self.logger.error(f"Ignoring invalid access rules in {self.path}: {e}")
+            return False
+
+        self.logger.info(f"Reloaded access rules from {self.path} (version {rules.version})")
+        return True
+
+    def _run(self):
+
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Error while checking {self.path}: {e}", exc_info=True)
+
+    def start(self) -> "RulesFileWatcher":
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="rules-watcher", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
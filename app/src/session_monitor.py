@@ -0,0 +1,103 @@
+from app.src.access_policy import Schedule
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.events import Event, UncheckedRecords
+from app.src.monitor_core import attendance_alerts
+from app.utils.attendance_store import AttendanceStore, device_key
+from typing import Optional
+from zk import ZK
+from zk.base import Attendance
+import logging
+import threading
+
+
+log = logging.getLogger("main.session_monitor")
+
+
+class SessionMonitor:
+    """
+    Security monitoring fed by a device's live capture (pass it as `monitor`
+    to the access control loops): the swipes the capture sees are the
+    device's new attendance records, so they are checked and stored as they
+    arrive, without polling the device or downloading its log.
+
+    - A swipe outside `allowed_time_range` raises an AttendanceTimeViolation
+      (rapid entries are already reported by the capture's spam detector).
+    - Swipes move the monitor's `watermark`, its position in the attendance
+      log (pass one restored from a StateSnapshot to resume it), and are
+      added to `store`.
+    - When the capture (re)starts, the device's record count tells how many
+      records were added while no capture ran. They are reported as
+      UncheckedRecords, not checked.
+
+    The polled checks of the security monitor (device time, the user audit,
+    the records the capture didn't see) are not run here. pyzk reads live
+    events and command replies from the same socket, so a transfer on the
+    capture's session would swallow the swipes arriving meanwhile, and
+    running them on a second session is what sharing the capture avoids.
+    They stay with the security monitor loop, on its own session.
+    """
+
+    def __init__(
+        self,
+        allowed_time_range: str = "8,18",
+        store: AttendanceStore = None,
+        logger=None,
+        watermark: AttendanceWatermark = None,
+    ):
+
+        self.watermark = watermark if watermark is not None else AttendanceWatermark()
+        self.store = store
+        self.logger = logger or log
+        self.pending: list[Attendance] = []  # swipes not stored yet
+        self._lock = threading.Lock()
+        self.configure(allowed_time_range)
+
+    def configure(self, allowed_time_range: str = None, store: AttendanceStore = None):
+        """Change the monitoring rules; settings left out (None) stay as they are."""
+
+        if store is not None:
+            self.store = store
+        if allowed_time_range is not None:
+            self.allowed_time_range = allowed_time_range
+            try:
+                self.schedule = Schedule.parse(allowed_time_range)
+            except (ValueError, TypeError) as e:
+                self.logger.warning(f"Invalid allowed_time_range provided ({e}). Skipping attendance time checks.")
+                self.schedule = None
+
+    def resume(self, zk: ZK) -> Optional[Event]:
+        """
+        Place the watermark at the end of the device's log. Call it on the
+        capture's session before the capture starts (no events are pushed
+        yet, so the reply can't be mistaken for one).
+        """
+
+        zk.read_sizes()
+        unchecked = self.watermark.anchor(zk.records)
+        if not unchecked:
+            return None
+
+        message = f"{unchecked} attendance records were added while no capture ran; they are not checked by the capture session"
+        self.logger.warning(message)
+        return UncheckedRecords(count=unchecked, message=message)
+
+    def observe(self, attendance: Attendance) -> list[Event]:
+        """Check a live swipe (a new record of the device's log) and queue it for the store."""
+
+        events = []
+        if self.schedule is not None and not self.schedule.allows(attendance.timestamp):
+            events = list(attendance_alerts([attendance], [], self.schedule, self.logger))
+
+        self.watermark.extend([attendance])
+        if self.store is not None:
+            with self._lock:
+                self.pending.append(attendance)
+        return events
+
+    def flush(self, ip: str, port: int):
+        """Add the swipes observed since the last flush to the store."""
+
+        with self._lock:
+            pending, self.pending = self.pending, []
+        if pending:
+            self.store.add(device_key(ip, port), pending)
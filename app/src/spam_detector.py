@@ -0,0 +1,66 @@
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+
+DEFAULT_SPAM_WINDOW = 30  # seconds
+DEFAULT_SPAM_THRESHOLD = 2  # attempts within the window that count as a burst
+DEFAULT_MAX_TRACKED_USERS = 10000
+
+
+class Burst(NamedTuple):
+    user_id: str
+    attempts: int
+    first: datetime
+    last: datetime
+    seconds: float
+
+
+class SpamDetector:
+    """
+    Sliding-window burst detector for live capture events.
+
+    Each user gets a ring buffer of their last `threshold` attempt times, so
+    a burst (`threshold` attempts within `window` seconds) is detected with
+    one comparison per event. At most `max_users` users are tracked; the least
+    recently seen one is forgotten first, which keeps memory bounded.
+    """
+
+    def __init__(
+        self,
+        window: float = DEFAULT_SPAM_WINDOW,
+        threshold: int = DEFAULT_SPAM_THRESHOLD,
+        max_users: int = DEFAULT_MAX_TRACKED_USERS,
+    ):
+
+        if threshold < 2:
+            raise ValueError("threshold must be at least 2 attempts")
+
+        self.window = window
+        self.threshold = threshold
+        self.max_users = max_users
+        self._attempts: OrderedDict[str, deque] = OrderedDict()
+
+    def __len__(self):
+        return len(self._attempts)
+
+    def observe(self, user_id: str, timestamp: datetime) -> Optional[Burst]:
+        """Record an attempt; returns a Burst if it completes one, None otherwise."""
+
+        attempts = self._attempts.get(user_id)
+        if attempts is None:
+            attempts = deque(maxlen=self.threshold)
+            self._attempts[user_id] = attempts
+            if len(self._attempts) > self.max_users:
+                self._attempts.popitem(last=False)
+        else:
+            self._attempts.move_to_end(user_id)
+
+        attempts.append(timestamp)
+        if len(attempts) < self.threshold:
+            return None
+
+        seconds = (attempts[-1] - attempts[0]).total_seconds()
+        if seconds < self.window:
+            return Burst(user_id, self.threshold, attempts[0], attempts[-1], seconds)
+        return None
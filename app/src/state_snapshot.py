@@ -0,0 +1,266 @@
+from app.src.access_policy import AccessPolicy, PolicyHolder
+from app.src.attendance_sync import AttendanceWatermark
+from app.utils.attendance_store import device_key
+from app.utils.user_directory import USER_FIELDS, UserDirectory
+from datetime import datetime
+from typing import NamedTuple, Optional
+from zk.base import User
+import json
+import logging
+import os
+import threading
+
+
+log = logging.getLogger("main.snapshot")
+
+SNAPSHOT_FORMAT = 1
+DEFAULT_SAVE_INTERVAL = 2  # seconds between checks for changes to save
+
+
+class _Tracked(NamedTuple):
+    ip: str
+    port: int
+    directory: Optional[UserDirectory]
+    rules: Optional[PolicyHolder]
+    watermarks: dict[str, AttendanceWatermark]  # by monitor name
+
+
+def _fingerprint(tracked: _Tracked) -> tuple:
+    """Cheap summary of a device's state that changes whenever there is something to save."""
+
+    directory, rules = tracked.directory, tracked.rules
+    return (
+        directory.etag if directory is not None else None,
+        rules.version if rules is not None else None,
+        tuple(
+            (name, watermark.count, watermark.last_timestamp, len(watermark.last_seen))
+            for name, watermark in sorted(tracked.watermarks.items())
+            if watermark.initialized
+        ),
+    )
+
+
+def _dump_users(directory: UserDirectory) -> list[dict]:
+    # passwords stay on the device
+    return [{name: getattr(user, name) for name in USER_FIELDS} for user in directory.users]
+
+
+def _load_users(rows: list[dict]) -> list[User]:
+
+    return [
+        User(
+            row["uid"],
+            row["name"],
+            row["privilege"],
+            group_id=row.get("group_id", ""),
+            user_id=row["user_id"],
+            card=row.get("card", 0),
+        )
+        for row in rows
+    ]
+
+
+def _dump_watermark(watermark: AttendanceWatermark) -> dict:
+
+    last = watermark.last_timestamp
+    return {
+        "count": watermark.count,
+        "last_uid": watermark.last_uid,
+        "last_timestamp": last.isoformat() if last is not None else None,
+        "last_seen": {
+            user_id: timestamp.isoformat()
+            for user_id, timestamp in dict(watermark.last_seen).items()
+        },
+    }
+
+
+def _load_watermark(watermark: AttendanceWatermark, data: dict):
+
+    last = data.get("last_timestamp")
+    watermark.count = data["count"]
+    watermark.last_uid = data.get("last_uid")
+    watermark.last_timestamp = datetime.fromisoformat(last) if last else None
+    watermark.last_seen = {
+        user_id: datetime.fromisoformat(timestamp)
+        for user_id, timestamp in data.get("last_seen", {}).items()
+    }
+    watermark.initialized = True
+
+
+class StateSnapshot:
+    """
+    Warm-start state of the devices served by this process, kept in one JSON
+    file so a restart can decide the first swipe without waiting for the
+    device: each device's user table (without passwords), access rules and
+    the attendance watermarks of its monitors (each monitor keeps its own,
+    saved under the name it was attached with).
+
+    `attach` restores a device's saved state into its objects and tracks them;
+    a daemon thread started with `start` saves the file (atomically) whenever
+    a tracked device changed. Restored user tables are marked for
+    revalidation: the capture loops download the table again in their first
+    idle gap, and decisions are made from the snapshot until then. Devices in
+    the file that this process doesn't attach are kept as they are.
+    """
+
+    def __init__(self, path: str, interval: float = DEFAULT_SAVE_INTERVAL, logger=None):
+
+        self.path = path
+        self.interval = interval
+        self.logger = logger or log
+
+        self.saved: dict[str, dict] = self._read()  # device key -> saved state
+        self._tracked: dict[str, _Tracked] = {}
+        self._fingerprints: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _read(self) -> dict[str, dict]:
+
+        try:
+            with open(self.path, "rb") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable state snapshot {self.path}: {e}")
+            return {}
+
+        if data.get("format") != SNAPSHOT_FORMAT:
+            self.logger.warning(f"Ignoring state snapshot {self.path} of another format")
+            return {}
+        return data.get("devices", {})
+
+    def devices(self) -> list[tuple[str, int]]:
+        """(ip, port) of every device in the snapshot file."""
+        return [(state["ip"], state["port"]) for state in self.saved.values()]
+
+    def attach(
+        self,
+        ip: str,
+        port: int = 4370,
+        directory: UserDirectory = None,
+        rules: PolicyHolder = None,
+        watermarks: dict[str, AttendanceWatermark] = None,
+    ) -> bool:
+        """
+        Restore the saved state of the device at (ip, port) into the given
+        objects and save them from now on. `watermarks` are the attendance
+        watermarks of the device's monitors, by name. Objects that already
+        hold state keep it: a loaded user table, an initialized watermark, and
+        rules given at startup (e.g. from the environment) win over the snapshot.
+        Returns True if anything was restored; a device already attached is
+        left alone.
+        """
+
+        key = device_key(ip, port)
+        if key in self._tracked:
+            return False
+        state = self.saved.get(key, {})
+        watermarks = dict(watermarks or {})
+        restored = []
+
+        try:
+            if directory is not None and directory.loaded_at is None and "users" in state:
+                directory.load(_load_users(state["users"]), revalidate=True)
+                restored.append(f"{len(directory)} users")
+
+            if rules is not None and not rules.configured and "rules" in state:
+                spec = state["rules"]
+                rules.replace(AccessPolicy.compile(**spec), spec)
+                restored.append("access rules")
+
+            saved_watermarks = state.get("watermarks", {})
+            for name, watermark in watermarks.items():
+                if not watermark.initialized and name in saved_watermarks:
+                    _load_watermark(watermark, saved_watermarks[name])
+                    restored.append(f"{name} attendance watermark")
+        except (KeyError, TypeError, ValueError) as e:
+            self.logger.warning(f"Ignoring invalid snapshot state of {key}: {e}")
+
+        with self._lock:
+            tracked = _Tracked(ip, port, directory, rules, watermarks)
+            self._tracked[key] = tracked
+            if key in self.saved:
+                # what was just restored doesn't need saving again
+                self._fingerprints[key] = _fingerprint(tracked)
+
+        if restored:
+            self.logger.info(f"Warm start of {key} from {self.path}: {', '.join(restored)}")
+        return bool(restored)
+
+    def _state(self, tracked: _Tracked) -> dict:
+
+        state = dict(self.saved.get(device_key(tracked.ip, tracked.port), {}))
+        state.update(ip=tracked.ip, port=tracked.port)
+        if tracked.directory is not None and tracked.directory.loaded_at is not None:
+            state["users"] = _dump_users(tracked.directory)
+        if tracked.rules is not None and tracked.rules.current.spec:
+            state["rules"] = tracked.rules.current.spec
+        watermarks = dict(state.get("watermarks", {}))
+        for name, watermark in tracked.watermarks.items():
+            if watermark.initialized:
+                watermarks[name] = _dump_watermark(watermark)
+        if watermarks:
+            state["watermarks"] = watermarks
+        return state
+
+    def save(self, force: bool = False) -> bool:
+        """Write the snapshot if a tracked device changed since the last save; True if written."""
+
+        with self._lock:
+            changed = {
+                key: fingerprint
+                for key, tracked in self._tracked.items()
+                if (fingerprint := _fingerprint(tracked)) != self._fingerprints.get(key)
+            }
+            if not changed and not force:
+                return False
+
+            for key in changed:
+                self.saved[key] = self._state(self._tracked[key])
+            data = {
+                "format": SNAPSHOT_FORMAT,
+                "saved_at": datetime.now().isoformat(),
+                "devices": self.saved,
+            }
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, default=str)
+            os.replace(tmp, self.path)
+
+            self._fingerprints.update(changed)
+
+        self.logger.debug(f"Saved state snapshot of {len(changed)} devices to {self.path}")
+        return True
+
+    def _run(self):
+
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                self.logger.error(f"Error while saving {self.path}: {e}", exc_info=True)
+
+    def start(self) -> "StateSnapshot":
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="state-snapshot", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the saver thread and save what changed since its last run."""
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
@@ -0,0 +1,98 @@
+from zk.base import User, const
+from typing import NamedTuple
+
+
+class UserFingerprint(NamedTuple):
+    user_id: str
+    name: str
+    privilege: int
+    password_set: bool
+    card: int
+
+    @property
+    def is_admin(self) -> bool:
+        return self.privilege == const.USER_ADMIN
+
+
+def fingerprint(user: User) -> UserFingerprint:
+
+    return UserFingerprint(
+        str(user.user_id), user.name, user.privilege, bool(user.password), user.card
+    )
+
+
+class UserChanges(NamedTuple):
+    added: list[UserFingerprint]
+    removed: list[UserFingerprint]
+    privilege_changed: list[tuple[UserFingerprint, UserFingerprint]]  # (before, after)
+    changed: list[UserFingerprint]  # added or modified, to re-check (e.g. passwords)
+    admins_changed: bool
+    baseline: bool  # first snapshot: every user is in `changed`, none in `added`
+
+    def __bool__(self) -> bool:
+        return bool(self.changed or self.removed)
+
+
+class UserSnapshot:
+    """
+    Fingerprints (name, privilege, password set, card) of the users of one
+    device, as of one monitor's last check, and the running set of admins.
+    Every monitor of a device keeps its own snapshot, so each one reports
+    the changes since its own last check.
+
+    `update` diffs a fresh user list against the snapshot. An unchanged table
+    is detected with one list comparison, so the per-cycle work beyond the
+    download is proportional to what changed. The device has no change feed,
+    so the user table itself still has to be downloaded every cycle.
+    """
+
+    def __init__(self):
+
+        self.users: dict[str, UserFingerprint] = {}
+        self.admins: dict[str, UserFingerprint] = {}
+        self.initialized = False
+        self._rows: list[UserFingerprint] = []
+
+    def reset(self):
+        self.__init__()
+
+    @property
+    def admin_count(self) -> int:
+        return len(self.admins)
+
+    def update(self, users: list[User]) -> UserChanges:
+        """Diff `users` against the snapshot and make them the new snapshot."""
+
+        rows = [fingerprint(user) for user in users]
+        if self.initialized and rows == self._rows:
+            return UserChanges([], [], [], [], False, False)
+
+        baseline = not self.initialized
+        current = {row.user_id: row for row in rows}
+        added, changed, privilege_changed = [], [], []
+        admins_changed = baseline
+
+        for user_id, row in current.items():
+            before = self.users.get(user_id)
+            if before == row:
+                continue
+            changed.append(row)
+            if before is None:
+                if not baseline:
+                    added.append(row)
+                    admins_changed = admins_changed or row.is_admin
+            elif before.privilege != row.privilege:
+                privilege_changed.append((before, row))
+                admins_changed = admins_changed or before.is_admin or row.is_admin
+
+        removed = [row for user_id, row in self.users.items() if user_id not in current]
+        admins_changed = admins_changed or any(row.is_admin for row in removed)
+
+        if admins_changed:
+            self.admins = {user_id: row for user_id, row in current.items() if row.is_admin}
+        self.users = current
+        self._rows = rows
+        self.initialized = True
+
+        return UserChanges(added, removed, privilege_changed, changed, admins_changed, baseline)
+
@@ -3,13 +3,33 @@ Utilities Package
 Helper functions and utilities for the ZK Access Control System.
 """
 
-from .helpers import ZKConnection, get_attendances, get_users, parse_time
+from .helpers import ZKConnection, get_connection, get_attendances, get_users, parse_time
+from .device_worker import DeviceWorker
+from .device_pool import DevicePool, get_device_pool
+from .circuit_breaker import CircuitBreaker, DeviceUnavailable, get_circuit_breaker
+from .attendance_store import AttendanceStore
+from .attendance_batch import AttendanceBatch
 from .logger import get_logger
+from .metrics import REGISTRY, instrument
+from .user_directory import UserDirectory, get_user_directory
 
 __all__ = [
     'ZKConnection',
+    'get_connection',
+    'DeviceWorker',
+    'DevicePool',
+    'get_device_pool',
+    'CircuitBreaker',
+    'DeviceUnavailable',
+    'get_circuit_breaker',
+    'AttendanceStore',
+    'AttendanceBatch',
     'get_attendances',
     'get_users',
     'parse_time',
-    'get_logger'
+    'get_logger',
+    'REGISTRY',
+    'instrument',
+    'UserDirectory',
+    'get_user_directory'
 ]
\ No newline at end of file
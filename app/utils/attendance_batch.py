@@ -0,0 +1,189 @@
+from zk.base import Attendance
+from datetime import datetime, timedelta
+from typing import Iterator, Union
+import json
+import numpy as np
+import os
+import shutil
+
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+
+_COLUMNS = ("times", "uids", "user_codes", "status", "punch")
+
+# archive: a directory with one .npy file per column and the user id table
+_USER_IDS = "user_ids.json"
+
+
+class AttendanceBatch:
+    """
+    Attendance records stored by column instead of one pyzk Attendance (and
+    datetime) per record: about 18 bytes per record and no per-record objects
+    for the garbage collector to track.
+
+    - `times`: int64 seconds since 1970 of the device's (naive, local) timestamps
+    - `uids`: int32 record numbers
+    - `user_codes`: int32 index into `user_ids`, the interned user id strings
+    - `status`, `punch`: uint8
+
+    Indexing gives an Attendance, slicing a batch sharing the same arrays, and
+    iterating yields Attendance objects, so code written for lists still works.
+    `save` writes an archive that `load` memory-maps without copying.
+    """
+
+    __slots__ = ("times", "uids", "user_codes", "status", "punch", "user_ids")
+
+    def __init__(self, times, uids, user_codes, status, punch, user_ids: list[str]):
+
+        self.times = times
+        self.uids = uids
+        self.user_codes = user_codes
+        self.status = status
+        self.punch = punch
+        self.user_ids = user_ids
+
+    @classmethod
+    def from_attendances(cls, attendances: list[Attendance]) -> "AttendanceBatch":
+        """
+        Build a batch from pyzk records (user ids interned by first appearance).
+        A batch (e.g. a loaded archive) is returned as it is.
+        """
+
+        if isinstance(attendances, AttendanceBatch):
+            return attendances
+
+        count = len(attendances)
+        codes_by_id = {}
+        user_codes = np.fromiter(
+            (codes_by_id.setdefault(str(att.user_id), len(codes_by_id)) for att in attendances),
+            dtype=np.int32,
+            count=count,
+        )
+        times = np.fromiter(
+            ((att.timestamp - _EPOCH) // _ONE_SECOND for att in attendances),
+            dtype=np.int64,
+            count=count,
+        )
+        uids = np.fromiter((att.uid or 0 for att in attendances), dtype=np.int32, count=count)
+        status = np.fromiter((att.status or 0 for att in attendances), dtype=np.uint8, count=count)
+        punch = np.fromiter((att.punch or 0 for att in attendances), dtype=np.uint8, count=count)
+
+        return cls(times, uids, user_codes, status, punch, list(codes_by_id))
+
+    # list-like access
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, index: Union[int, slice]):
+
+        if isinstance(index, slice):
+            return self.select(index)
+        return Attendance(
+            self.user_ids[self.user_codes[index]],
+            self.timestamp(index),
+            int(self.status[index]),
+            punch=int(self.punch[index]),
+            uid=int(self.uids[index]),
+        )
+
+    def __iter__(self) -> Iterator[Attendance]:
+
+        for i in range(len(self)):
+            yield self[i]
+
+    def select(self, index) -> "AttendanceBatch":
+        """The records at a slice, boolean mask or index array (slices share the arrays)."""
+
+        return AttendanceBatch(
+            self.times[index],
+            self.uids[index],
+            self.user_codes[index],
+            self.status[index],
+            self.punch[index],
+            self.user_ids,
+        )
+
+    def take(self, indexes) -> list[Attendance]:
+        """Attendance objects for some records only (e.g. the ones to report)."""
+
+        return [self[int(i)] for i in indexes]
+
+    def timestamp(self, index: int) -> datetime:
+        return _EPOCH + timedelta(seconds=int(self.times[index]))
+
+    def times_us(self) -> np.ndarray:
+        """Timestamps as microseconds since 1970 (the unit of the audit functions)."""
+        return self.times * 1_000_000
+
+    def user_id_array(self) -> np.ndarray:
+        """User id of every record as an object array (for filtering by user)."""
+        return np.asarray(self.user_ids, dtype=object)[self.user_codes]
+
+    def after(self, when: datetime) -> "AttendanceBatch":
+        """Records strictly newer than `when`."""
+
+        return self.select(self.times > (when - _EPOCH) // _ONE_SECOND)
+
+    def between(self, start: datetime = None, end: datetime = None) -> "AttendanceBatch":
+        """Records in [start, end] (None leaves that side open)."""
+
+        if start is None and end is None:
+            return self
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.times >= -((_EPOCH - start) // _ONE_SECOND)  # rounded up
+        if end is not None:
+            mask &= self.times <= (end - _EPOCH) // _ONE_SECOND
+        return self.select(mask)
+
+    def latest_by_user(self) -> dict[str, datetime]:
+        """Each user's newest timestamp in the batch."""
+
+        if not len(self):
+            return {}
+        order = np.lexsort((self.times, self.user_codes))
+        codes = self.user_codes[order]
+        last = np.append(codes[1:] != codes[:-1], True)  # last record of each user
+        return {
+            self.user_ids[code]: _EPOCH + timedelta(seconds=seconds)
+            for code, seconds in zip(codes[last].tolist(), self.times[order][last].tolist())
+        }
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in _COLUMNS)
+
+    # archives
+
+    def save(self, path: str):
+        """Write the batch as an archive directory (replaced atomically)."""
+
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in _COLUMNS:
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp, _USER_IDS), "w") as f:
+            json.dump(self.user_ids, f)
+
+        old = f"{path}.old"
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "AttendanceBatch":
+        """
+        Open an archive directory. With `mmap` the columns are read-only views
+        of the mapped files: nothing is copied and pages are read on first use.
+        """
+
+        with open(os.path.join(path, _USER_IDS)) as f:
+            user_ids = json.load(f)
+        columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in _COLUMNS
+        }
+        return cls(user_ids=user_ids, **columns)
@@ -0,0 +1,180 @@
+from zk.base import Attendance
+from datetime import datetime
+from typing import Optional
+import os
+import sqlite3
+import threading
+
+
+DEFAULT_DB_PATH = "/tmp/data/attendance.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    device TEXT NOT NULL,
+    uid INTEGER,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    status INTEGER,
+    punch INTEGER,
+    UNIQUE (device, user_id, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_device_time
+    ON attendance (device, timestamp);
+CREATE INDEX IF NOT EXISTS idx_attendance_device_user
+    ON attendance (device, user_id, timestamp);
+"""
+
+
+def device_key(ip: str, port: int = 4370) -> str:
+    return f"{ip}:{port}"
+
+
+def _format_time(value: datetime) -> str:
+    """Timestamps are stored as naive local ISO text, which sorts chronologically."""
+
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat(sep=" ")
+
+
+class AttendanceStore:
+    """
+    Local SQLite (WAL mode) copy of the attendance records seen by the monitor,
+    so history questions are answered without touching the device.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = None):
+
+        if path is None:
+            path = DEFAULT_DB_PATH
+        if path != ":memory:":
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            except OSError as e:
+                raise OSError(f"Failed to create database directory for '{path}': {str(e)}")
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._db.commit()
+
+    def add(self, device: str, attendances: list[Attendance]) -> int:
+        """Insert records (duplicates are ignored). Returns the number of new rows."""
+
+        rows = [
+            (
+                device,
+                att.uid,
+                str(att.user_id),
+                _format_time(att.timestamp),
+                att.status,
+                att.punch,
+            )
+            for att in attendances
+        ]
+        if not rows:
+            return 0
+
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO attendance "
+                "(device, uid, user_id, timestamp, status, punch) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+            return self._db.total_changes - before
+
+    @staticmethod
+    def _where(
+        device: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        user_id: Optional[str],
+    ) -> tuple[str, list]:
+
+        clauses = ["device = ?"]
+        params = [device]
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(str(user_id))
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(_format_time(start))
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            params.append(_format_time(end))
+
+        return " AND ".join(clauses), params
+
+    def query(
+        self,
+        device: str,
+        start: datetime = None,
+        end: datetime = None,
+        user_id: str = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> list[dict]:
+        """Records of a device in [start, end], optionally for one user, oldest first."""
+
+        where, params = self._where(device, start, end, user_id)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT uid, user_id, timestamp, status, punch FROM attendance "
+                f"WHERE {where} ORDER BY timestamp, user_id LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def records(
+        self, device: str, start: datetime = None, end: datetime = None
+    ) -> list[Attendance]:
+        """Every record of a device in [start, end] as pyzk Attendance objects, oldest first."""
+
+        where, params = self._where(device, start, end, None)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT uid, user_id, timestamp, status, punch FROM attendance "
+                f"WHERE {where} ORDER BY timestamp, user_id",
+                params,
+            ).fetchall()
+
+        return [
+            Attendance(
+                row["user_id"],
+                datetime.fromisoformat(row["timestamp"]),
+                row["status"],
+                punch=row["punch"],
+                uid=row["uid"],
+            )
+            for row in rows
+        ]
+
+    def count(
+        self,
+        device: str,
+        start: datetime = None,
+        end: datetime = None,
+        user_id: str = None,
+    ) -> int:
+
+        where, params = self._where(device, start, end, user_id)
+        with self._lock:
+            return self._db.execute(
+                f"SELECT COUNT(*) FROM attendance WHERE {where}", params
+            ).fetchone()[0]
+
+    def close(self):
+
+        with self._lock:
+            self._db.close()
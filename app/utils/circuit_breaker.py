@@ -0,0 +1,208 @@
+from app.utils.attendance_store import device_key
+from app.utils.metrics import DEVICE_CIRCUIT_OPENS, DEVICE_CIRCUIT_STATE
+from typing import Optional
+import logging
+import random
+import socket
+import threading
+import time
+
+
+log = logging.getLogger("main.device")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # zk_device_circuit_state
+
+DEFAULT_FAILURE_THRESHOLD = 3  # consecutive connection failures that open the circuit
+DEFAULT_BASE_DELAY = 1  # seconds before the first retry
+DEFAULT_MAX_DELAY = 300  # cap of the exponential backoff
+DEFAULT_PROBE_TIMEOUT = 2  # seconds for the TCP reachability probe
+
+
+class DeviceUnavailable(ConnectionError):
+    """Raised instead of connecting while a device's circuit is open."""
+
+    def __init__(self, device: str, retry_in: float):
+
+        super().__init__(f"Device {device} is unreachable (circuit open, retry in {retry_in:.1f}s)")
+        self.device = device
+        self.retry_in = retry_in
+
+
+def backoff_delay(attempt: int, base: float = DEFAULT_BASE_DELAY, cap: float = DEFAULT_MAX_DELAY) -> float:
+    """
+    Exponential backoff with jitter: base * 2^attempt capped at `cap`, of which
+    the upper half is random so retries of many devices don't line up.
+    """
+
+    delay = min(cap, base * 2 ** min(attempt, 32))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Backoff:
+    """Growing, jittered retry delays; `reset` after a success."""
+
+    def __init__(self, base: float = DEFAULT_BASE_DELAY, cap: float = DEFAULT_MAX_DELAY):
+
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next(self) -> float:
+
+        delay = backoff_delay(self.attempt, self.base, self.cap)
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+def probe(ip: str, port: int, timeout: float = DEFAULT_PROBE_TIMEOUT) -> bool:
+    """Cheap reachability check: can a TCP connection be opened within `timeout`?"""
+
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class CircuitBreaker:
+    """
+    Per-device circuit breaker in front of the connection attempts.
+
+    - closed: connections are attempted; `failure_threshold` consecutive
+      failures open the circuit
+    - open: connection attempts fail right away with DeviceUnavailable (no
+      socket, no thread blocked on a timeout) until the backoff delay passes
+    - half-open: the delay passed; one trial connection is let through.
+      Success closes the circuit, failure opens it again with a longer delay
+    """
+
+    def __init__(
+        self,
+        device: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ):
+
+        self.device = device
+        self.failure_threshold = failure_threshold
+        self.backoff = Backoff(base_delay, max_delay)
+
+        self.failures = 0  # consecutive failures
+        self.last_error: Optional[str] = None
+        self._opened = False
+        self._retry_at = 0.0
+        self._trial = False  # a half-open trial is in progress
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+
+        if not self._opened:
+            return CLOSED
+        if self._trial or time.monotonic() >= self._retry_at:
+            return HALF_OPEN
+        return OPEN
+
+    def retry_in(self) -> float:
+        """Seconds until the next connection attempt is allowed (0 when it is now)."""
+
+        if not self._opened or self._trial:
+            return 0.0
+        return max(0.0, self._retry_at - time.monotonic())
+
+    def before_connect(self):
+        """Raise DeviceUnavailable unless a connection may be attempted now."""
+
+        with self._lock:
+            if not self._opened:
+                return
+            if self._trial or time.monotonic() < self._retry_at:
+                # only one trial at a time while half-open
+                raise DeviceUnavailable(self.device, self.retry_in())
+            self._trial = True
+            DEVICE_CIRCUIT_STATE.set(self.device, value=_STATE_VALUES[HALF_OPEN])
+
+    def abort_trial(self):
+        """End a half-open trial that never reached the device (counts as neither outcome)."""
+
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+
+        with self._lock:
+            if self._opened:
+                log.info(f"Device {self.device} is reachable again, circuit closed")
+            self.failures = 0
+            self.last_error = None
+            self._opened = False
+            self._trial = False
+            self.backoff.reset()
+            DEVICE_CIRCUIT_STATE.set(self.device, value=_STATE_VALUES[CLOSED])
+
+    def record_failure(self, error: BaseException = None):
+
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) if error is not None else None
+            if not (self._trial or self.failures >= self.failure_threshold):
+                return
+
+            delay = self.backoff.next()
+            if not self._opened:
+                DEVICE_CIRCUIT_OPENS.inc(self.device)
+            self._opened = True
+            self._trial = False
+            self._retry_at = time.monotonic() + delay
+            DEVICE_CIRCUIT_STATE.set(self.device, value=_STATE_VALUES[OPEN])
+
+        log.warning(
+            f"Device {self.device} unreachable after {self.failures} failures, "
+            f"circuit open for {delay:.1f}s: {error}"
+        )
+
+
+class BreakerWatch:
+    """Remembers the breaker state a stream last reported, to emit only the changes."""
+
+    def __init__(self, breaker: CircuitBreaker):
+
+        self.breaker = breaker
+        self.reported = CLOSED
+
+    def poll(self) -> Optional[str]:
+        """The new state if it changed since the last poll, else None."""
+
+        state = self.breaker.state
+        if state == self.reported:
+            return None
+        self.reported = state
+        return state
+
+
+_breakers: dict[tuple, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(ip: str, port: int = 4370, **kwargs) -> CircuitBreaker:
+    """
+    Return the shared CircuitBreaker of the device at (ip, port), creating it if needed.
+    Keyword arguments only apply when the breaker is created.
+    """
+
+    key = (ip, port)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(device_key(ip, port), **kwargs)
+            _breakers[key] = breaker
+
+    return breaker
@@ -0,0 +1,206 @@
+from app.utils.attendance_store import device_key
+from app.utils.circuit_breaker import probe
+from app.utils.metrics import DEVICE_CONNECTS, DEVICE_RECONNECTS, instrument
+from zk import ZK
+from typing import Optional
+import logging
+import threading
+import time
+import zk as pyzk
+
+
+log = logging.getLogger("main.device")
+
+DEFAULT_MAX_SESSIONS = 2  # ZK devices accept very few concurrent sessions
+DEFAULT_MAX_IDLE = 60  # seconds an idle session is kept alive
+DEFAULT_HEALTH_CHECK_AFTER = 5  # idle seconds after which a session is probed before reuse
+DEFAULT_ACQUIRE_TIMEOUT = 30  # seconds to wait for a free session
+DEFAULT_CONNECT_TIMEOUT = 5  # seconds to probe and open a session; `timeout` applies once connected
+
+
+class PoolExhausted(ConnectionError):
+    """No session of the device became free within the acquire timeout."""
+
+
+# newest pyzk whose private timeout attributes set_session_timeout was checked against
+PYZK_CHECKED_VERSION = (0, 9)
+
+
+def set_session_timeout(zk: ZK, timeout: float) -> bool:
+    """
+    Change the timeout of an open pyzk session (e.g. from the short connect
+    timeout the ZK was built with to a longer one for transfers).
+
+    pyzk has no public setter: the timeout given to ZK() is kept in the
+    name-mangled `ZK.__timeout`, which later calls (e.g. live_capture)
+    restore on the socket. This is the only place writing it, and only for
+    pyzk versions up to PYZK_CHECKED_VERSION that still have the attributes;
+    otherwise the session keeps its timeout and False is returned.
+    """
+
+    version = tuple(getattr(pyzk, "VERSION", ()))
+    if not version or version > PYZK_CHECKED_VERSION:
+        return False
+    sock = getattr(zk, "_ZK__sock", None)
+    if sock is None or not hasattr(zk, "_ZK__timeout"):
+        return False
+
+    zk._ZK__timeout = timeout
+    sock.settimeout(timeout)
+    return True
+
+
+class DevicePool:
+    """
+    Keep-alive pyzk sessions for one device.
+
+    At most `max_sessions` sessions are borrowed at the same time. Released
+    sessions are kept for `max_idle` seconds and handed out again; a session
+    idle for more than `health_check_after` seconds is probed first and
+    silently replaced by a new connection if the device dropped it.
+    New sessions are opened with `connect_timeout` (after a TCP probe), so an
+    unreachable device fails in seconds instead of after the full `timeout`.
+    """
+
+    def __init__(
+        self,
+        ip: str,
+        port: int = 4370,
+        timeout: int = 165,
+        ommit_ping: bool = False,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        max_idle: float = DEFAULT_MAX_IDLE,
+        health_check_after: float = DEFAULT_HEALTH_CHECK_AFTER,
+        acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    ):
+
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.ommit_ping = ommit_ping
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self.connect_timeout = min(connect_timeout, timeout)
+        self.device = device_key(ip, port)
+
+        self.connects = 0  # new sessions opened
+        self.reconnects = 0  # sessions replaced because the old one was dead
+
+        self._idle: list[tuple[ZK, float]] = []  # (session, released at)
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> ZK:
+
+        if not probe(self.ip, self.port, self.connect_timeout):
+            raise ConnectionError(
+                f"{self.device} did not accept a connection within {self.connect_timeout}s"
+            )
+
+        zk = ZK(self.ip, port=self.port, timeout=self.connect_timeout, ommit_ping=self.ommit_ping)
+        conn = instrument(zk.connect(), self.device)
+        # give the open session the full timeout for long transfers
+        if not set_session_timeout(zk, self.timeout):
+            log.warning(
+                f"{self.device}: can't change the session timeout with this pyzk version, "
+                f"keeping the connect timeout ({self.connect_timeout}s)"
+            )
+        self.connects += 1
+        DEVICE_CONNECTS.inc(self.device)
+        return conn
+
+    @staticmethod
+    def _close(zk: ZK):
+
+        try:
+            if zk.is_connect:
+                zk.disconnect()
+        except Exception as e:
+            log.warning(f"Error while disconnecting: {e}")
+
+    @staticmethod
+    def _healthy(zk: ZK) -> bool:
+
+        if not zk.is_connect:
+            return False
+        try:
+            return zk.read_sizes()
+        except Exception:
+            return False
+
+    def _take_idle(self) -> Optional[ZK]:
+        """Pop the most recently used idle session that is still usable, if any."""
+
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                zk, released_at = self._idle.pop()
+
+            idle_for = time.monotonic() - released_at
+            if idle_for > self.max_idle:
+                self._close(zk)
+                continue
+            if idle_for <= self.health_check_after or self._healthy(zk):
+                return zk
+
+            self.reconnects += 1
+            DEVICE_RECONNECTS.inc(self.device)
+            self._close(zk)
+
+    def acquire(self) -> ZK:
+        """Borrow a connected session, opening a new one if none is idle."""
+
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolExhausted(
+                f"All {self.max_sessions} sessions to {self.ip}:{self.port} are in use"
+            )
+
+        try:
+            return self._take_idle() or self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, zk: ZK, discard: bool = False):
+        """Return a borrowed session; `discard` closes it instead of keeping it alive."""
+
+        try:
+            if discard or not zk.is_connect:
+                self._close(zk)
+            else:
+                with self._lock:
+                    self._idle.append((zk, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Disconnect every idle session."""
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for zk, _ in idle:
+            self._close(zk)
+
+
+_pools: dict[tuple, DevicePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_device_pool(ip: str, port: int = 4370, **kwargs) -> DevicePool:
+    """
+    Return the shared DevicePool of the device at (ip, port), creating it if needed.
+    Keyword arguments only apply when the pool is created.
+    """
+
+    key = (ip, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = DevicePool(ip, port, **kwargs)
+            _pools[key] = pool
+
+    return pool
@@ -0,0 +1,55 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator
+import asyncio
+import functools
+
+
+_DONE = object()  # sentinel for an exhausted iterator (StopIteration can't cross a future)
+
+
+class DeviceWorker:
+    """
+    Runs the blocking pyzk calls of one device on a dedicated thread.
+
+    Calls are executed one at a time, in submission order, which matches the
+    single socket a pyzk session talks over. Results are handed back to the
+    event loop as asyncio futures, so a slow device only delays its own
+    streams and never the loop itself.
+    """
+
+    def __init__(self, name: str = "zk"):
+
+        self.name = name
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"zk-worker-{name}"
+        )
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """Queue `fn(*args, **kwargs)` on the device thread without waiting for it."""
+
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    def enqueue(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue `fn(*args, **kwargs)` on the device thread from blocking code (no event loop needed)."""
+
+        return self._executor.submit(fn, *args, **kwargs)
+
+    async def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)` on the device thread and wait for its result."""
+
+        return await self.submit(fn, *args, **kwargs)
+
+    async def iterate(self, iterator: Iterator) -> AsyncIterator:
+        """Consume a blocking iterator (e.g. live_capture) one item at a time on the device thread."""
+
+        while True:
+            item = await self.call(next, iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait)
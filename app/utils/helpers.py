@@ -1,39 +1,166 @@
+from app.utils.device_pool import DevicePool, PoolExhausted, DEFAULT_MAX_SESSIONS, get_device_pool
+from app.utils.device_worker import DeviceWorker
+from app.utils.circuit_breaker import CircuitBreaker, get_circuit_breaker
+from app.utils.attendance_store import device_key
+from app.utils.metrics import instrument
 from zk import ZK
+from zk.exception import ZKNetworkError
 from zk.base import Attendance
 from zk.base import User
 from typing import Optional
 from datetime import datetime
+import logging
+import threading
 
 
-# Context manager to use 'with' block
+log = logging.getLogger("main.device")
+
+
+# Context manager to use 'with' block (or 'async with' from async code)
 class ZKConnection:
+    """
+    Device session for one 'with' block. By default sessions are borrowed from
+    the device's shared DevicePool and kept alive between blocks; with
+    pooled=False every block connects and disconnects. Overlapping blocks of
+    the thread that opened the session (e.g. tasks on the device worker)
+    share it until the last of them ends; other threads wait for it.
+    Connection attempts go through the device's CircuitBreaker: while it is
+    open, entering raises DeviceUnavailable without touching the network.
+    """
     
-    def __init__(self, ip: str, port: int = 4370, timeout: int = 165, ommit_ping: bool = False):
+    def __init__(
+        self,
+        ip: str,
+        port: int = 4370,
+        timeout: int = 165,
+        ommit_ping: bool = False,
+        pooled: bool = True,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
         
-        self.zk = ZK(ip, port=port, timeout=timeout, ommit_ping=ommit_ping)
+        self.ip = ip
+        self.port = port
+        self.pool: Optional[DevicePool] = None
+        self.breaker: CircuitBreaker = get_circuit_breaker(ip, port)
+        self.zk = None
+        if pooled:
+            self.pool = get_device_pool(
+                ip, port, timeout=timeout, ommit_ping=ommit_ping, max_sessions=max_sessions
+            )
+        else:
+            self.zk = instrument(
+                ZK(ip, port=port, timeout=timeout, ommit_ping=ommit_ping), device_key(ip, port)
+            )
         self.conn = None
+        self._worker = None
+        self._released = threading.Condition()
+        self._owner = None  # thread that opened the session
+        self._depth = 0  # 'with' blocks of that thread sharing the session
+        self._failed = False
+
+    @property
+    def worker(self) -> DeviceWorker:
+        """Thread that runs this device's blocking calls for async code (created on first use)."""
+
+        if self._worker is None:
+            self._worker = DeviceWorker(f"{self.ip}:{self.port}")
+        return self._worker
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking device call on the device worker and await its result."""
+
+        return await self.worker.call(fn, *args, **kwargs)
 
     def __enter__(self):
         """Enter the runtime context related to this object."""
-        
-        try:
-            self.conn = self.zk.connect()
-            return self.conn
-        except Exception as e:
-            raise ConnectionError(f"Failed to connect to the device: {e}")
+
+        with self._released:
+            # a session is only shared by the thread that opened it (for async
+            # code, the device worker, which runs the calls one at a time);
+            # other threads wait for it to be given back
+            while self.conn is not None and self._owner != threading.get_ident():
+                self._released.wait()
+            if self.conn is not None:
+                self._depth += 1
+                return self.conn
+
+            self.breaker.before_connect()
+            try:
+                if self.pool is not None:
+                    conn = self.pool.acquire()
+                else:
+                    conn = self.zk.connect()
+            except PoolExhausted:
+                # the device is busy, not unreachable
+                self.breaker.abort_trial()
+                raise
+            except Exception as e:
+                self.breaker.record_failure(e)
+                raise ConnectionError(f"Failed to connect to the device: {e}")
+
+            self.breaker.record_success()
+            self.conn = conn
+            self._owner = threading.get_ident()
+            self._depth = 1
+            self._failed = False
+            return conn
     
     def __exit__(self, exc_type, exc_value, traceback):
         """Exit the runtime context related to this object."""
         
-        if self.conn:
+        if exc_type is not None and issubclass(exc_type, (OSError, ZKNetworkError)):
+            # the device stopped answering mid-session
+            self.breaker.record_failure(exc_value)
+
+        with self._released:
+            self._failed = self._failed or exc_type is not None
+            self._depth -= 1
+            if self._depth > 0:
+                return
+            conn, self.conn = self.conn, None
+            self._owner = None
+            self._released.notify_all()
+
+        if conn and self.pool is not None:
+            # a session that saw an error (or was interrupted mid live_capture)
+            # may be in an unknown state, so it is closed instead of reused
+            self.pool.release(conn, discard=self._failed)
+        elif conn:
             try:
-                self.conn.disconnect()
+                conn.disconnect()
             except Exception as e:
-                print(f"Error while disconnecting: {e}")
+                log.warning(f"Error while disconnecting: {e}")
         else:
-            print("No connection to disconnect.")
-        
-        self.conn = None
+            log.debug("No connection to disconnect.")
+
+    async def __aenter__(self):
+        """Connect on the device worker so the event loop is never blocked."""
+
+        return await self.run(self.__enter__)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+
+        await self.run(self.__exit__, exc_type, exc_value, traceback)
+
+
+_connections: dict[tuple, ZKConnection] = {}
+
+
+def get_connection(
+    ip: str, port: int = 4370, timeout: int = 165, ommit_ping: bool = False
+) -> ZKConnection:
+    """
+    Shared ZKConnection of a device for short API calls, so they reuse one
+    device worker thread instead of starting one per request.
+    """
+
+    key = (ip, port)
+    conn = _connections.get(key)
+    if conn is None:
+        conn = ZKConnection(ip=ip, port=port, timeout=timeout, ommit_ping=ommit_ping)
+        _connections[key] = conn
+
+    return conn
 
 
 def get_attendances(conn: ZKConnection) -> Optional[list[Attendance]]:
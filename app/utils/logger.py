@@ -1,13 +1,133 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from datetime import datetime
+import atexit
+import json
 import logging
 import os
+import queue
+import sys
 import time
 
 
 DEFAULT_LOGS_DIR = "/tmp/logs"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024  # rotate the log file when it reaches this size...
+DEFAULT_ROTATE_SECONDS = 24 * 60 * 60  # ...or when it gets this old
+DEFAULT_BACKUP_COUNT = 10
+DEFAULT_QUEUE_SIZE = 10000  # records waiting for the writer thread before new ones are dropped
 
+# attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
 
-def get_logger(output_dir: str = None) -> logging.Logger:
-    """Initialize and return a logger."""
+_listener: QueueListener = None
+
+
+def _json_default(value):
+    # stream events (and similar objects) log as their dict form
+    to_dict = getattr(value, "to_dict", None)
+    return to_dict() if callable(to_dict) else str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed in `extra=` kept as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+
+        return json.dumps(entry, default=_json_default)
+
+
+class SizeTimeRotatingFileHandler(RotatingFileHandler):
+    """Rotates (numbered backups) when the file exceeds `max_bytes` or is older than `interval` seconds."""
+
+    def __init__(self, filename: str, max_bytes: int, interval: float, backup_count: int):
+
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops them instead of waiting when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+
+        # merge the message once here and keep the extra fields for the JSON formatter
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _stop_listener():
+
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(
+    output_dir: str = None,
+    level: str = None,
+    console: bool = True,
+    max_bytes: int = None,
+    rotate_seconds: float = None,
+    backup_count: int = None,
+) -> logging.Logger:
+    """
+    Initialize and return the application logger.
+
+    Records are put on a queue and written by a background thread: JSON lines
+    to a file rotated on size and age, and plain text to stdout when `console`
+    is set. Logging from the device loops therefore never waits on the disk or
+    the terminal. Modules log to children of this logger ("main.<module>").
+    Defaults come from LOG_LEVEL, LOG_MAX_BYTES, LOG_ROTATE_SECONDS and
+    LOG_BACKUP_COUNT.
+    """
+
+    global _listener
 
     if output_dir is None:
         output_dir = DEFAULT_LOGS_DIR
@@ -22,17 +142,30 @@ def get_logger(output_dir: str = None) -> logging.Logger:
 
     # check if the logger is new
     if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(
-            os.path.join(
-                output_dir,
-                f"log_{time.strftime('%Y%m%d_%H%M%S')}.log"
-            ),
-            mode="w",
+        logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        logger.propagate = False
+
+        file_handler = SizeTimeRotatingFileHandler(
+            os.path.join(output_dir, f"log_{time.strftime('%Y%m%d_%H%M%S')}.log"),
+            max_bytes=max_bytes or int(os.getenv("LOG_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            interval=rotate_seconds or float(os.getenv("LOG_ROTATE_SECONDS", DEFAULT_ROTATE_SECONDS)),
+            backup_count=backup_count or int(os.getenv("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT)),
         )
-        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        file_handler.setFormatter(JsonFormatter())
+        handlers = [file_handler]
+
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(
+                logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+            )
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(maxsize=DEFAULT_QUEUE_SIZE)
+        logger.addHandler(_NonBlockingQueueHandler(log_queue))
 
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)  # flush what's queued on exit
 
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,240 @@
+from bisect import bisect_left
+from functools import wraps
+from zk import ZK
+import abc
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CYCLE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# pyzk calls whose round trip is recorded
+TIMED_DEVICE_CALLS = ("get_users", "get_attendance", "get_time", "unlock", "test_voice")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _samples(self) -> list[str]:
+        """The metric's exposition lines, one per sample."""
+
+    def render(self) -> str:
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> list[str]:
+
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; `observe` is one bisect and a few additions."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value: float):
+
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # per-bucket counts (last one is +Inf), sum, count
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[labels] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self) -> list[str]:
+
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+SWIPE_TO_DECISION = REGISTRY.register(
+    Histogram(
+        "zk_swipe_to_decision_seconds",
+        "Time from a live capture event to the access decision",
+        ("device",),
+    )
+)
+SWIPE_TO_UNLOCK = REGISTRY.register(
+    Histogram(
+        "zk_swipe_to_unlock_seconds",
+        "Time from a live capture event to the unlock command returning",
+        ("device",),
+    )
+)
+ACCESS_DECISIONS = REGISTRY.register(
+    Counter("zk_access_decisions_total", "Access decisions taken", ("device", "result"))
+)
+DEVICE_CALL_SECONDS = REGISTRY.register(
+    Histogram(
+        "zk_device_call_seconds",
+        "Round trip of pyzk calls to the device",
+        ("device", "call"),
+    )
+)
+DEVICE_CALL_ERRORS = REGISTRY.register(
+    Counter("zk_device_call_errors_total", "pyzk calls that raised", ("device", "call"))
+)
+MONITOR_CYCLE_SECONDS = REGISTRY.register(
+    Histogram(
+        "zk_monitor_cycle_seconds",
+        "Duration of a security check cycle (device, users, attendances)",
+        ("device",),
+        buckets=CYCLE_BUCKETS,
+    )
+)
+MONITOR_INTERVAL_SECONDS = REGISTRY.register(
+    Gauge(
+        "zk_monitor_interval_seconds",
+        "Current wait between security checks of a device (adaptive polling)",
+        ("device",),
+    )
+)
+DEVICE_CONNECTS = REGISTRY.register(
+    Counter("zk_device_connects_total", "Device sessions opened", ("device",))
+)
+DEVICE_RECONNECTS = REGISTRY.register(
+    Counter(
+        "zk_device_reconnects_total",
+        "Device sessions replaced because the device dropped them",
+        ("device",),
+    )
+)
+DEVICE_CIRCUIT_STATE = REGISTRY.register(
+    Gauge(
+        "zk_device_circuit_state",
+        "Circuit breaker state of a device (0 closed, 1 half-open, 2 open)",
+        ("device",),
+    )
+)
+DEVICE_CIRCUIT_OPENS = REGISTRY.register(
+    Counter(
+        "zk_device_circuit_opens_total",
+        "Times the circuit breaker of a device opened",
+        ("device",),
+    )
+)
+SSE_SUBSCRIBERS = REGISTRY.register(
+    Gauge("zk_sse_subscribers", "Connected SSE clients", ("device", "stream"))
+)
+
+
+def instrument(zk: ZK, device: str) -> ZK:
+    """Record the round trip of the TIMED_DEVICE_CALLS of a connected session."""
+
+    for call in TIMED_DEVICE_CALLS:
+        method = getattr(zk, call)
+        if getattr(method, "_timed", False):
+            continue
+
+        def timed(*args, _method=method, _call=call, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            except Exception:
+                DEVICE_CALL_ERRORS.inc(device, _call)
+                raise
+            finally:
+                DEVICE_CALL_SECONDS.observe(device, _call, value=time.perf_counter() - start)
+
+        timed._timed = True
+        setattr(zk, call, wraps(method)(timed))
+
+    return zk
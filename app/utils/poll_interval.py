@@ -0,0 +1,33 @@
+DEFAULT_FACTOR = 2
+
+
+class AdaptiveInterval:
+    """
+    Polling interval of a monitor loop, between `minimum` and `maximum`
+    seconds. Every check that found nothing new multiplies it by `factor`;
+    a check that found new records or raised alerts brings it back to
+    `minimum`. With `maximum` equal to `minimum` the interval is fixed.
+    """
+
+    def __init__(self, minimum: float, maximum: float = None, factor: float = DEFAULT_FACTOR):
+
+        self.minimum = minimum
+        self.maximum = minimum if maximum is None else max(minimum, maximum)
+        self.factor = factor
+        self.current = minimum
+
+    @property
+    def adaptive(self) -> bool:
+        return self.maximum > self.minimum
+
+    def update(self, active: bool) -> float:
+        """The interval until the next check, after a check that was `active` or not."""
+
+        if active:
+            self.current = self.minimum
+        else:
+            self.current = min((self.current or 1) * self.factor, self.maximum)
+        return self.current
+
+    def reset(self):
+        self.current = self.minimum
@@ -0,0 +1,193 @@
+from zk import ZK
+from zk.base import User
+from typing import Optional
+import asyncio
+import hashlib
+import threading
+import time
+
+
+DEFAULT_USER_CACHE_TTL = 300  # seconds before the user table is downloaded again
+DEFAULT_MISS_REFRESH_INTERVAL = 5  # min seconds between refreshes caused by unknown ids
+
+# user attributes exposed by listings (and covered by the etag); never the password
+USER_FIELDS = ("uid", "user_id", "name", "privilege", "group_id", "card")
+
+
+class UserDirectory:
+    """
+    Cached copy of a device's user table, indexed by user_id and by name.
+
+    The table is downloaded again when it is older than `ttl` seconds
+    (ttl=None never expires, ttl=0 always refreshes) or, if `refresh_on_miss`
+    is set, when an unknown user_id is looked up. Refreshes caused by unknown
+    ids are rate limited by `miss_refresh_interval` so a stranger repeatedly
+    trying the sensor can't force a full download on every swipe.
+
+    A table loaded from elsewhere than the device (a warm-start snapshot) is
+    used right away and flagged `needs_revalidation` until the next refresh.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = DEFAULT_USER_CACHE_TTL,
+        refresh_on_miss: bool = True,
+        miss_refresh_interval: float = DEFAULT_MISS_REFRESH_INTERVAL,
+    ):
+
+        self.ttl = ttl
+        self.refresh_on_miss = refresh_on_miss
+        self.miss_refresh_interval = miss_refresh_interval
+
+        self.users: list[User] = []  # device order
+        self.by_id: dict[str, User] = {}
+        self.by_name: dict[str, User] = {}
+        self.etag: Optional[str] = None  # hash of the listed user attributes
+        self.loaded_at = None  # time.monotonic() of the last refresh
+        self.needs_revalidation = False
+        self._last_miss_refresh = None
+        self._lock = threading.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def load(self, users: list[User], revalidate: bool = False):
+        """
+        Replace the cached table with `users` and rebuild the indexes. Set
+        `revalidate` when they don't come from the device.
+        """
+
+        by_id = {user.user_id: user for user in users}
+        by_name = {}
+        for user in users:
+            # keep the first user for duplicated names, like a list scan would
+            by_name.setdefault(user.name, user)
+
+        digest = hashlib.blake2b(digest_size=16)
+        for user in users:
+            digest.update(repr(tuple(getattr(user, name) for name in USER_FIELDS)).encode())
+
+        # swap whole dicts so concurrent readers never see a half-built index
+        self.users = list(users)
+        self.by_id = by_id
+        self.by_name = by_name
+        self.etag = digest.hexdigest()
+        self.loaded_at = time.monotonic()
+        self.needs_revalidation = revalidate
+
+    def refresh(self, zk: ZK):
+        """Download the user table from the device."""
+
+        with self._lock:
+            self.load(zk.get_users() or [])
+
+    def refresh_async(self, conn) -> asyncio.Task:
+        """
+        Refresh through `conn` (a ZKConnection) on its device worker without
+        blocking the event loop. Concurrent callers share the running refresh.
+        """
+
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_with(conn))
+        return self._refresh_task
+
+    async def _refresh_with(self, conn):
+
+        async with conn as zk:
+            await conn.run(self.refresh, zk)
+
+    def is_stale(self) -> bool:
+
+        if self.loaded_at is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.monotonic() - self.loaded_at >= self.ttl
+
+    def lookup(self, zk: ZK, user_id) -> Optional[User]:
+        """
+        Return the user with this user_id, or None if it doesn't exist on the device.
+        Refreshes the table first if it is stale, and once more on a miss if allowed.
+        """
+
+        if self.is_stale():
+            self.refresh(zk)
+
+        user = self.by_id.get(user_id)
+        if user is not None or not self.refresh_on_miss:
+            return user
+
+        now = time.monotonic()
+        if (
+            self._last_miss_refresh is not None
+            and now - self._last_miss_refresh < self.miss_refresh_interval
+        ):
+            return None
+
+        self._last_miss_refresh = now
+        self.refresh(zk)
+        return self.by_id.get(user_id)
+
+    def resolve_cached(self, user_id) -> tuple[bool, Optional[User]]:
+        """
+        Resolve a user_id without touching the device: (True, user or None) when
+        lookup() would answer from the cache, (False, None) when it would refresh.
+        """
+
+        if self.is_stale():
+            return False, None
+
+        user = self.by_id.get(user_id)
+        if user is not None or not self.refresh_on_miss:
+            return True, user
+
+        if (
+            self._last_miss_refresh is not None
+            and time.monotonic() - self._last_miss_refresh < self.miss_refresh_interval
+        ):
+            return True, None
+
+        return False, None
+
+    def lookup_cached(self, user_id) -> tuple[Optional[User], bool]:
+        """
+        Resolve a user_id from the cached table only, even a stale one, for
+        callers that refresh it elsewhere (a live capture, whose session can't
+        carry a download). Returns (user or None, whether to start a refresh):
+        a refresh is due when lookup() would do one, at the same rate limit.
+        """
+
+        cached, user = self.resolve_cached(user_id)
+        if cached:
+            return user, False
+        if not self.is_stale():
+            # an unknown id: counts as a refresh caused by a miss
+            self._last_miss_refresh = time.monotonic()
+        return self.by_id.get(user_id), True
+
+    def get_by_name(self, name: str) -> Optional[User]:
+        return self.by_name.get(name)
+
+
+_directories: dict[tuple, UserDirectory] = {}
+_directories_lock = threading.Lock()
+
+
+def get_user_directory(ip: str, port: int = 4370, **kwargs) -> UserDirectory:
+    """
+    Return the shared UserDirectory of the device at (ip, port), creating it if needed.
+    Keyword arguments (ttl, refresh_on_miss, miss_refresh_interval) update its refresh policy.
+    """
+
+    key = (ip, port)
+    with _directories_lock:
+        directory = _directories.get(key)
+        if directory is None:
+            directory = UserDirectory(**kwargs)
+            _directories[key] = directory
+        else:
+            for name, value in kwargs.items():
+                setattr(directory, name, value)
+
+    return directory
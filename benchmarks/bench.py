@@ -0,0 +1,248 @@
+# benchmarks of the access decision path and the monitor checks against a simulated device
+#
+#   python -m benchmarks.bench
+#   python -m benchmarks.bench --sizes 1000,10000 --swipes 5000 --latency 0.002
+from app.src.access_control_core import allow_access, real_time_access_control_stream
+from app.src.access_policy import AccessPolicy
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.monitor_core import check_attendances, security_check_cycle_stream
+from app.src.spam_detector import SpamDetector
+from app.utils.attendance_batch import AttendanceBatch
+from app.utils.user_directory import UserDirectory
+from benchmarks.fake_device import FakeZK, fake_connection
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+ALLOWED_HOURS = "mon-fri 08:00-18:00; sat 09:00-13:00"
+ACCESS_EVENTS = ("access_granted", "access_denied")
+
+# the core modules log every alert; keep the benchmark output to the numbers
+quiet = logging.getLogger("benchmarks")
+quiet.addHandler(logging.NullHandler())
+quiet.propagate = False
+logging.getLogger("main").addHandler(logging.NullHandler())
+logging.getLogger("main").propagate = False
+
+
+def percentile(values: list[float], q: float) -> float:
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_summary(latencies: list[float], elapsed: float) -> dict:
+
+    return {
+        "decisions": len(latencies),
+        "decisions_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compile_policy() -> AccessPolicy:
+
+    return AccessPolicy.compile(
+        whitelist=["user1", "user2"],
+        blacklist=["user3"],
+        allowed_hours=ALLOWED_HOURS,
+        user_hours={"user4": "22:00-06:00"},
+    )
+
+
+def bench_allow_access(users: int, swipes: int, latency: float) -> dict:
+    """allow_access with a warm user directory: one decision per swipe."""
+
+    device = FakeZK(users=users, records=0, latency=latency)
+    device.swipes(swipes)
+    swiped = [device._events.get_nowait().user_id for _ in range(swipes)]
+
+    directory = UserDirectory()
+    policy = compile_policy()
+    latencies = []
+
+    with fake_connection(device) as zk:
+        directory.refresh(zk)
+        started = time.perf_counter()
+        for user_id in swiped:
+            t0 = time.perf_counter()
+            allow_access(zk, user_id, directory=directory, policy=policy)
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+
+    return latency_summary(latencies, elapsed)
+
+
+async def bench_stream(users: int, swipes: int, latency: float) -> dict:
+    """real_time_access_control_stream end to end: live_capture event -> access event."""
+
+    device = FakeZK(users=users, records=0, latency=latency)
+    conn = fake_connection(device)
+    directory = UserDirectory()
+    with conn as zk:
+        directory.refresh(zk)
+
+    device.swipes(swipes)
+    device.close_capture()
+
+    received = []
+    started = time.perf_counter()
+    async for event in real_time_access_control_stream(
+        conn,
+        logger=quiet,
+        directory=directory,
+        policy=compile_policy(),
+        spam_detector=SpamDetector(),
+    ):
+        if event.event_type in ACCESS_EVENTS:
+            received.append(time.perf_counter())
+    elapsed = time.perf_counter() - started
+    conn.worker.shutdown()
+
+    latencies = [done - emitted for emitted, done in zip(device.emitted, received)]
+    return latency_summary(latencies, elapsed)
+
+
+def bench_monitor(records: int, latency_per_record: float) -> dict:
+    """check_attendances: first (full audit), unchanged and 1%-new incremental checks."""
+
+    device = FakeZK(users=1000, records=records, latency_per_record=latency_per_record)
+    conn = fake_connection(device)
+    watermark = AttendanceWatermark()
+
+    def timed(first_check: bool) -> float:
+        t0 = time.perf_counter()
+        check_attendances(
+            conn, ALLOWED_HOURS, first_check, logger=quiet, watermark=watermark
+        )
+        return round((time.perf_counter() - t0) * 1000, 3)
+
+    first = timed(True)
+    unchanged = timed(False)
+    for _ in range(max(1, records // 100)):
+        device.add_record(str(device._rng.randrange(1, 1001)))
+    incremental = timed(False)
+
+    return {
+        "records": records,
+        "first_check_ms": first,
+        "unchanged_check_ms": unchanged,
+        "incremental_check_ms": incremental,
+    }
+
+
+async def bench_monitor_cycle(records: int, latency_per_record: float) -> dict:
+    """One streamed security check cycle (device, users, attendances) on a fresh watermark."""
+
+    device = FakeZK(users=1000, records=records, latency_per_record=latency_per_record)
+    conn = fake_connection(device, port=10000 + records)  # own worker and metrics per size
+
+    t0 = time.perf_counter()
+    events = 0
+    async for _ in security_check_cycle_stream(
+        conn, 5, ALLOWED_HOURS, True, quiet, watermark=AttendanceWatermark()
+    ):
+        events += 1
+    elapsed = time.perf_counter() - t0
+    conn.worker.shutdown()
+
+    return {"records": records, "cycle_ms": round(elapsed * 1000, 3), "events": events}
+
+
+def bench_batch(records: int) -> dict:
+    """Memory of a downloaded log as pyzk records vs. an AttendanceBatch, and archive save/load."""
+
+    device = FakeZK(users=1000, records=0)
+
+    tracemalloc.start()
+    for _ in range(records):
+        device.add_record(str(device._rng.randrange(1, 1001)))
+    with fake_connection(device) as zk:
+        attendances = zk.get_attendance()
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    batch = AttendanceBatch.from_attendances(attendances)
+    convert = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "attendance.archive")
+        t0 = time.perf_counter()
+        batch.save(path)
+        save = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        loaded = AttendanceBatch.load(path)
+        load = time.perf_counter() - t0
+        del loaded
+
+    return {
+        "records": records,
+        "list_bytes_per_record": round(list_bytes / records, 1) if records else 0.0,
+        "batch_bytes_per_record": round(batch.nbytes() / records, 1) if records else 0.0,
+        "convert_ms": round(convert * 1000, 3),
+        "save_ms": round(save * 1000, 3),
+        "load_ms": round(load * 1000, 3),
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmarks against a simulated ZK device")
+    parser.add_argument("--users", type=int, default=1000, help="users enrolled on the device")
+    parser.add_argument("--swipes", type=int, default=2000, help="swipes per decision benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="attendance log sizes")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per device call")
+    parser.add_argument(
+        "--latency-per-record", type=float, default=0.0, help="extra seconds per record transferred"
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = {
+        "allow_access": bench_allow_access(args.users, args.swipes, args.latency),
+        "access_stream": asyncio.run(bench_stream(args.users, args.swipes, args.latency)),
+        "check_attendances": [bench_monitor(size, args.latency_per_record) for size in sizes],
+        "monitor_cycle": [
+            asyncio.run(bench_monitor_cycle(size, args.latency_per_record)) for size in sizes
+        ],
+        "attendance_batch": [bench_batch(size) for size in sizes],
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name in ("allow_access", "access_stream"):
+        r = results[name]
+        print(
+            f"{name:<18} {r['decisions']:>7} decisions  {r['decisions_per_sec']:>10.1f}/s"
+            f"  p50 {r['p50_ms']:.3f} ms  p99 {r['p99_ms']:.3f} ms"
+        )
+    for r in results["check_attendances"]:
+        print(
+            f"check_attendances  {r['records']:>7} records  first {r['first_check_ms']:.1f} ms"
+            f"  unchanged {r['unchanged_check_ms']:.1f} ms  +1% {r['incremental_check_ms']:.1f} ms"
+        )
+    for r in results["monitor_cycle"]:
+        print(f"monitor_cycle      {r['records']:>7} records  {r['cycle_ms']:.1f} ms  ({r['events']} events)")
+    for r in results["attendance_batch"]:
+        print(
+            f"attendance_batch   {r['records']:>7} records  {r['list_bytes_per_record']:.0f} -> "
+            f"{r['batch_bytes_per_record']:.0f} bytes/record  convert {r['convert_ms']:.1f} ms"
+            f"  save {r['save_ms']:.1f} ms  load {r['load_ms']:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
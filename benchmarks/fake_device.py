@@ -0,0 +1,182 @@
+from app.utils.helpers import ZKConnection
+from datetime import datetime, timedelta
+from zk.base import Attendance, User, const
+import queue
+import random
+import threading
+import time
+
+
+class FakeZK:
+    """
+    In-memory stand-in for a pyzk ZK session with the calls the core modules use.
+
+    - `users` enrolled users (every `admin_every`-th one is an admin, every
+      `no_password_every`-th one has no password) and `records` attendance
+      records spread over the days before now, some of them off-hours and some
+      rapid repeats
+    - every device call sleeps `latency` seconds (plus `latency_per_record`
+      for each record/user it returns) to model the network round trip
+    - `swipe(user_id)` / `swipes(n)` feed live_capture, which yields None after
+      `new_timeout` seconds without events like the real device
+    """
+
+    def __init__(
+        self,
+        users: int = 1000,
+        records: int = 10000,
+        latency: float = 0.0,
+        latency_per_record: float = 0.0,
+        admin_every: int = 200,
+        no_password_every: int = 500,
+        seed: int = 0,
+    ):
+
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+        self.is_connect = False
+        self.calls: dict[str, int] = {}
+
+        rng = random.Random(seed)
+        self._rng = rng
+        self.user_list = [
+            User(
+                uid=i,
+                name=f"user{i}",
+                privilege=const.USER_ADMIN if admin_every and i % admin_every == 0 else const.USER_DEFAULT,
+                password="" if no_password_every and i % no_password_every == 0 else "1234",
+                group_id=str(i % 4),
+                user_id=str(i),
+            )
+            for i in range(1, users + 1)
+        ]
+        self.attendance_list = self._generate_log(records, rng)
+
+        self._events: queue.Queue = queue.Queue()
+        self._capturing = threading.Event()
+        self.emitted: list[float] = []  # perf_counter of every record live_capture yielded, in order
+
+    def _generate_log(self, records: int, rng: random.Random) -> list[Attendance]:
+
+        now = datetime.now().replace(microsecond=0)
+        start = now - timedelta(days=max(1, records // 500))
+        span = int((now - start).total_seconds())
+
+        offsets = sorted(rng.randrange(span) for _ in range(records))
+        log = []
+        for uid, offset in enumerate(offsets, start=1):
+            user = self.user_list[rng.randrange(len(self.user_list))] if self.user_list else None
+            user_id = user.user_id if user else str(uid)
+            timestamp = start + timedelta(seconds=offset)
+            if log and rng.random() < 0.01:
+                # a rapid repeat of the previous swipe
+                user_id = log[-1].user_id
+                timestamp = log[-1].timestamp + timedelta(seconds=rng.randrange(1, 20))
+            log.append(Attendance(user_id, timestamp, 1, punch=0, uid=uid))
+        return log
+
+    def _call(self, name: str, size: int = 0):
+
+        self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency + self.latency_per_record * size
+        if delay:
+            time.sleep(delay)
+
+    # session
+
+    def connect(self):
+        self._call("connect")
+        self.is_connect = True
+        return self
+
+    def disconnect(self):
+        self._call("disconnect")
+        self.is_connect = False
+        return True
+
+    # device calls
+
+    def read_sizes(self):
+        self._call("read_sizes")
+        self.users = len(self.user_list)
+        self.records = len(self.attendance_list)
+        return True
+
+    def get_users(self):
+        self._call("get_users", len(self.user_list))
+        return list(self.user_list)
+
+    def get_attendance(self):
+        self._call("get_attendance", len(self.attendance_list))
+        return list(self.attendance_list)
+
+    def get_time(self):
+        self._call("get_time")
+        return datetime.now()
+
+    def unlock(self, time=3):
+        self._call("unlock")
+        return True
+
+    def test_voice(self, index=0):
+        self._call("test_voice")
+        return True
+
+    # live capture
+
+    def add_record(self, user_id: str, timestamp: datetime = None) -> Attendance:
+        """Append a record to the log (what a swipe does on a real device)."""
+
+        record = Attendance(
+            str(user_id),
+            timestamp or datetime.now().replace(microsecond=0),
+            1,
+            punch=0,
+            uid=len(self.attendance_list) + 1,
+        )
+        self.attendance_list.append(record)
+        return record
+
+    def swipe(self, user_id: str, timestamp: datetime = None):
+        self._events.put(self.add_record(user_id, timestamp))
+
+    def swipes(self, count: int, unknown_ratio: float = 0.05):
+        """Queue `count` swipes of random users (`unknown_ratio` of them not enrolled)."""
+
+        for _ in range(count):
+            if self._rng.random() < unknown_ratio or not self.user_list:
+                self.swipe(f"unknown{self._rng.randrange(10**6)}")
+            else:
+                self.swipe(self._rng.choice(self.user_list).user_id)
+
+    def close_capture(self):
+        """Make live_capture return once the queued swipes are consumed."""
+        self._events.put(None)
+
+    def live_capture(self, new_timeout=10):
+
+        self._capturing.set()
+        try:
+            while self._capturing.is_set():
+                try:
+                    record = self._events.get(timeout=new_timeout)
+                except queue.Empty:
+                    yield None
+                    continue
+                if record is None:
+                    return
+                self.emitted.append(time.perf_counter())
+                yield record
+        finally:
+            self._capturing.clear()
+
+    def end_live_capture(self):
+        self._capturing.clear()
+
+
+def fake_connection(device: FakeZK, ip: str = "127.0.0.1", port: int = 4370) -> ZKConnection:
+    """A ZKConnection whose sessions are `device` instead of a real ZK."""
+
+    conn = ZKConnection(ip=ip, port=port, pooled=False)
+    conn.zk = device
+    return conn
@@ -0,0 +1 @@
+python -m app.scripts.fleet_script
\ No newline at end of file
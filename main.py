@@ -1,9 +1,17 @@
-from fastapi import FastAPI
-from app.src import real_time_access_control_stream, check_security_stream
-from app.utils import get_logger, ZKConnection
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from app.src import SpamDetector, find_access_control_hub, get_access_control_hub, get_monitor_hub
+from app.src import FleetMonitor, FleetDevice, load_inventory, audit_report_stream
+from app.src import RulesConflict, StateSnapshot
+from app.utils import get_logger, get_connection, get_user_directory, AttendanceStore
+from app.utils.attendance_store import device_key
+from app.utils.metrics import REGISTRY, SSE_SUBSCRIBERS
+from app.utils.user_directory import USER_FIELDS
+from app.src.events import sse_frame
+from datetime import datetime
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import json
+from typing import Optional
+import atexit
 import os
 
 
@@ -11,6 +19,44 @@ directory = os.path.dirname(os.path.abspath(__file__))
 logs_dir = os.path.join(directory, "logs")
 logger = get_logger(logs_dir)
 
+# attendance history fed by the security monitor streams
+data_dir = os.path.join(directory, "data")
+attendance_store = AttendanceStore(
+    os.getenv("ATTENDANCE_DB", os.path.join(data_dir, "attendance.db"))
+)
+
+# logs downloaded by device audit reports, re-audited by source="archive"
+archive_dir = os.getenv("ATTENDANCE_ARCHIVE", os.path.join(data_dir, "archive"))
+
+# warm-start state (user tables, access rules, attendance watermarks) of the devices served
+state_snapshot = StateSnapshot(
+    os.getenv("STATE_SNAPSHOT", os.path.join(data_dir, "state.json")), logger=logger
+)
+
+
+def _track_device(ip: str, port: int):
+    """
+    Restore a device's state from the snapshot (first time only) and keep
+    saving it. Creates the device's hubs: call it from requests that start or
+    change a session, not from reads.
+    """
+
+    access_control = get_access_control_hub(ip, port, timeout=165, ommit_ping=False)
+    monitor = get_monitor_hub(ip, port, timeout=165, ommit_ping=False)
+    state_snapshot.attach(
+        ip,
+        port,
+        directory=get_user_directory(ip, port),
+        rules=access_control.rules,
+        watermarks={"monitor": monitor.watermark, "access_control": access_control.watermark},
+    )
+
+
+for _ip, _port in state_snapshot.devices():
+    _track_device(_ip, _port)
+state_snapshot.start()
+atexit.register(state_snapshot.stop)
+
 
 app = FastAPI(
     title="ZKTeco Access Control and Monitoring System",
@@ -23,6 +69,35 @@ class SecurityMonitorRequest(BaseModel):
     admin_count: int
     allowed_hours: str = "8,18"
     check_interval: int = 5
+    max_interval: Optional[float] = None  # idle devices are polled less often, up to this
+
+
+class FleetDeviceRequest(BaseModel):
+    ip: str
+    port: int = 4370
+    admin_count: int = 2
+    allowed_hours: str = "8,18"
+    check_interval: float = 30
+    name: Optional[str] = None
+
+
+class FleetMonitorRequest(BaseModel):
+    devices: list[FleetDeviceRequest] = []  # empty: use the FLEET_INVENTORY file
+    max_concurrency: int = 10  # device checks running at the same time
+    jitter: float = 0.1  # +/- fraction of each device's interval
+    alert_interval: float = 5  # seconds between checks of a device that raised alerts
+
+
+class AuditReportRequest(BaseModel):
+    devices: list[FleetDeviceRequest] = []  # empty: use the FLEET_INVENTORY file
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    source: str = "store"  # "store" (local attendance history), "device" (download the logs) or "archive" (the last downloads)
+    max_workers: Optional[int] = None  # worker processes, default one per core
+
+
+class SessionMonitorRequest(BaseModel):
+    allowed_hours: str = "8,18"  # swipes outside these hours raise an attendance_time_violation
 
 
 class AccessControlRequest(BaseModel):
@@ -30,7 +105,24 @@ class AccessControlRequest(BaseModel):
     port: int = 4370
     whitelist: str  # comma-separated list of user names that match the ones on the device e.g. "x,y"
     blacklist: str  # same as above
-    allowed_hours: str = "8,18"
+    allowed_hours: str = "8,18"  # "8,18" or weekday windows e.g. "mon-fri 08:00-18:00; sat 9-13"
+    user_hours: dict[str, str] = {}  # per-user allowed hours, by user name
+    group_hours: dict[str, str] = {}  # per-group allowed hours, by device group id
+    user_cache_ttl: int = 300  # seconds before the cached user table is downloaded again
+    spam_window: float = 30  # seconds in which spam_threshold attempts by one user raise an alert
+    spam_threshold: int = 2
+    monitor: Optional[SessionMonitorRequest] = None  # also check and store the swipes as attendance records
+
+
+class AccessRulesRequest(BaseModel):
+    ip: str
+    port: int = 4370
+    # rules left out (None) stay as they are
+    whitelist: Optional[str] = None  # comma-separated user names
+    blacklist: Optional[str] = None
+    allowed_hours: Optional[str] = None
+    user_hours: Optional[dict[str, str]] = None
+    group_hours: Optional[dict[str, str]] = None
 
 
 @app.get("/")
@@ -38,34 +130,249 @@ def root():
     return {"message": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Decision latency, device call round trips, monitor cycles and connections (Prometheus format)."""
+
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/devices/{ip}/attendances")
+def device_attendances(
+    ip: str,
+    port: int = 4370,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Attendance history of a device from the local store (no device access).
+    Records are ordered oldest first and filtered by time range and user.
+    Only records seen by a security monitor stream are available.
+    """
+
+    device = device_key(ip, port)
+    return {
+        "device": device,
+        "total": attendance_store.count(device, start, end, user_id),
+        "limit": limit,
+        "offset": offset,
+        "attendances": attendance_store.query(
+            device, start, end, user_id, limit=limit, offset=offset
+        ),
+    }
+
+
+def _log_refresh_error(task):
+
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Background user table refresh failed: {task.exception()}")
+
+
+@app.get("/devices/{ip}/users")
+async def device_users(
+    response: Response,
+    ip: str,
+    port: int = 4370,
+    fields: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Users enrolled on a device, from the cached user table shared with the
+    access control stream. A stale table is served while it is refreshed in
+    the background; only the first request waits for the device.
+    `fields` selects attributes (comma-separated, default all but passwords).
+    The ETag is a hash of the table: send it back in If-None-Match to get a
+    304 until the users change.
+    """
+
+    selected = USER_FIELDS
+    if fields:
+        selected = tuple(name.strip() for name in fields.split(",") if name.strip())
+        unknown = set(selected) - set(USER_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))} (allowed: {', '.join(USER_FIELDS)})",
+            )
+
+    # a device the service serves has its user table saved already (hubs are
+    # created by tracked requests only); a read creates no hub
+    user_directory = get_user_directory(ip, port)
+    # the device's shared transfer connection: a served device's hubs run their
+    # checks on it too, so the refresh shares their session instead of taking another
+    conn = get_connection(ip, port)
+    if user_directory.loaded_at is None:
+        try:
+            await user_directory.refresh_async(conn)
+        except Exception as e:
+            logger.error(f"Failed to load users of {device_key(ip, port)}: {e}")
+            raise HTTPException(status_code=502, detail=f"Failed to load users from device: {e}")
+    elif user_directory.is_stale() or user_directory.needs_revalidation:
+        # the cached (or warm-started) table answers meanwhile
+        user_directory.refresh_async(conn).add_done_callback(_log_refresh_error)
+
+    etag = f'"{user_directory.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    users = user_directory.users
+    return {
+        "device": device_key(ip, port),
+        "total": len(users),
+        "limit": limit,
+        "offset": offset,
+        "users": [
+            {name: getattr(user, name) for name in selected}
+            for user in users[offset:offset + limit]
+        ],
+    }
+
+
 @app.post("/security-monitor/stream")
-async def security_monitor_stream(req: SecurityMonitorRequest):
+async def security_monitor_stream(
+    req: SecurityMonitorRequest, last_event_id: Optional[str] = Header(None)
+):
     """
     Server-Sent Events endpoint for real-time security monitoring.
     Returns a continuous stream of security events.
+    All clients of the same device share one monitoring loop; the rules of this
+    request apply if it is the one that starts it. Send the Last-Event-ID
+    header to get the events missed since that id first.
+    """
+
+    _track_device(req.ip, req.port)  # a restored watermark skips the hub's first audit
+    hub = get_monitor_hub(req.ip, req.port, timeout=165, ommit_ping=False)
+    hub.configure(
+        admin_count=req.admin_count,
+        allowed_hours=req.allowed_hours,
+        check_interval=req.check_interval,
+        max_interval=req.max_interval,
+        store=attendance_store,
+        logger=logger,
+    )
+
+    async def event_generator():
+        labels = (device_key(req.ip, req.port), "security_monitor")
+        SSE_SUBSCRIBERS.inc(*labels)
+        frames = hub.sse(last_event_id)
+        try:
+            async for frame in frames:
+                yield frame
+
+        except Exception as e:
+            logger.error(f"Exception in security generator: {e}", exc_info=True)
+            yield sse_frame({'error': str(e), 'type': 'security_generator_exception'})
+        finally:
+            await frames.aclose()
+            SSE_SUBSCRIBERS.dec(*labels)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+        },
+    )
+
+
+def _fleet_devices(requested: list[FleetDeviceRequest]) -> list[FleetDevice]:
+    """The devices of a request, or the FLEET_INVENTORY file when none are given."""
+
+    if requested:
+        return [FleetDevice(**device.model_dump()) for device in requested]
+
+    inventory = os.getenv("FLEET_INVENTORY", os.path.join(directory, "devices.json"))
+    try:
+        return load_inventory(inventory)
+    except (OSError, ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"No devices given and no usable inventory: {e}")
+
+
+@app.post("/fleet-monitor/stream")
+async def fleet_monitor_stream(req: FleetMonitorRequest):
+    """
+    Server-Sent Events endpoint for security monitoring of many devices.
+    Returns one merged stream; every event carries the device it comes from.
+    """
+
+    devices = _fleet_devices(req.devices)
+
+    monitor = FleetMonitor(
+        devices,
+        max_concurrency=req.max_concurrency,
+        jitter=req.jitter,
+        alert_interval=req.alert_interval,
+        logger=logger,
+        store=attendance_store,
+    )
+
+    async def event_generator():
+        labels = ("fleet", "fleet_monitor")
+        SSE_SUBSCRIBERS.inc(*labels)
+        try:
+            async for event in monitor.events():
+                logger.debug("Got event from fleet stream", extra={"event": event})
+                yield sse_frame(event)
+
+        except Exception as e:
+            logger.error(f"Exception in fleet generator: {e}", exc_info=True)
+            yield sse_frame({'error': str(e), 'type': 'fleet_generator_exception'})
+        finally:
+            SSE_SUBSCRIBERS.dec(*labels)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+        },
+    )
+
+
+@app.post("/reports/audit/stream")
+async def audit_report(req: AuditReportRequest):
+    """
+    Server-Sent Events endpoint for the off-hours / rapid entry report of many
+    devices. Each device's log is audited in a worker process; an audit_shard
+    event is sent as each one finishes, then one audit_report event with the
+    merged report sorted by time.
     """
 
-    conn = ZKConnection(ip=req.ip, port=req.port, timeout=165, ommit_ping=False)
+    if req.source not in ("store", "device", "archive"):
+        raise HTTPException(status_code=400, detail=f"Invalid source: {req.source}")
+    devices = _fleet_devices(req.devices)
 
     async def event_generator():
         try:
-            async for event in check_security_stream(
-                conn=conn,
-                admin_count=req.admin_count,
-                allowed_time_range=tuple(
-                    _.strip() for _ in req.allowed_hours.split(",")
-                ),
-                check_interval=req.check_interval,
+            async for event in audit_report_stream(
+                devices,
+                start=req.start,
+                end=req.end,
+                source=req.source,
+                store_path=attendance_store.path,
+                max_workers=req.max_workers,
                 logger=logger,
+                archive_dir=archive_dir,
             ):
-                print(f"=== GOT SECURITY EVENT: {event} ===")
-                logger.info(f"Got event from security stream: {event}")
-                yield f"data: {json.dumps(event)}\n\n"
+                yield sse_frame(event)
 
         except Exception as e:
-            print(f"=== EXCEPTION IN SECURITY GENERATOR: {e} ===")
-            logger.error(f"Exception in security generator: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e), 'type': 'security_generator_exception'})}\n\n"
+            logger.error(f"Exception in audit report generator: {e}", exc_info=True)
+            yield sse_frame({'error': str(e), 'type': 'audit_report_exception'})
 
     return StreamingResponse(
         event_generator(),
@@ -79,31 +386,68 @@ async def security_monitor_stream(req: SecurityMonitorRequest):
 
 
 @app.post("/access-control/stream")
-async def access_control_stream(req: AccessControlRequest):
+async def access_control_stream(
+    req: AccessControlRequest, last_event_id: Optional[str] = Header(None)
+):
     """
     Server-Sent Events endpoint for real-time access control.
     Returns a continuous stream of access control events.
+    All clients of the same device share one live capture session. The rules
+    of the first request become the device's access rules; a later request
+    with other rules is rejected (409) instead of replacing them: change them
+    with PUT /access-control/rules. Send the
+    Last-Event-ID header to get the events missed since that id first.
+    With `monitor`, the session also checks and stores every swipe as a new
+    attendance record (the polled checks stay with /security-monitor/stream).
     """
 
-    conn = ZKConnection(ip=req.ip, port=req.port, timeout=165, ommit_ping=False)
+    _track_device(req.ip, req.port)
+    hub = get_access_control_hub(req.ip, req.port, timeout=165, ommit_ping=False)
+    user_directory = get_user_directory(req.ip, req.port, ttl=req.user_cache_ttl)
+    rules = {
+        "whitelist": req.whitelist.split(","),
+        "blacklist": req.blacklist.split(","),
+        "allowed_hours": req.allowed_hours,
+        "user_hours": req.user_hours,
+        "group_hours": req.group_hours,
+    }
+
+    monitor = None
+    if req.monitor is not None:
+        monitor = {
+            "allowed_time_range": req.monitor.allowed_hours,
+            "store": attendance_store,
+        }
+
+    spam_detector = SpamDetector(window=req.spam_window, threshold=req.spam_threshold)
+    try:
+        hub.configure(
+            directory=user_directory,
+            rules=rules,
+            spam_detector=spam_detector,
+            logger=logger,
+            monitor=monitor,
+        )
+    except RulesConflict as e:
+        raise HTTPException(
+            status_code=409, detail=f"{e}; change them with PUT /access-control/rules"
+        )
 
     async def event_generator():
+        labels = (device_key(req.ip, req.port), "access_control")
+        SSE_SUBSCRIBERS.inc(*labels)
+        frames = hub.sse(last_event_id)
         try:
-            async for event in real_time_access_control_stream(
-                conn=conn,
-                whitelist=list(_.strip() for _ in req.whitelist.split(",")),
-                blacklist=list(_.strip() for _ in req.blacklist.split(",")),
-                allowed_hours=tuple(_.strip() for _ in req.allowed_hours.split(",")),
-                logger=logger,
-            ):
-                print(f"=== GOT ACCESS CONTROL EVENT: {event} ===")
-                logger.info(f"Got event from access control stream: {event}")
-                yield f"data: {json.dumps(event)}\n\n"
+            async for frame in frames:
+                yield frame
 
         except Exception as e:
-            print(f"=== EXCEPTION IN ACCESS CONTROL GENERATOR: {e} ===")
             logger.error(f"Exception in access control generator: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e), 'type': 'access_control_generator_exception'})}\n\n"
+            yield sse_frame({'error': str(e), 'type': 'access_control_generator_exception'})
+        finally:
+            # leave the hub right away so its linger period starts with the last client
+            await frames.aclose()
+            SSE_SUBSCRIBERS.dec(*labels)
 
     return StreamingResponse(
         event_generator(),
@@ -113,4 +457,49 @@ async def access_control_stream(req: AccessControlRequest):
             "Connection": "keep-alive",
             "Access-Control-Allow-Origin": "*",
         },
-    )
\ No newline at end of file
+    )
+
+
+def _rules_response(ip: str, port: int, hub) -> dict:
+
+    rules = hub.rules.current
+    return {
+        "device": device_key(ip, port),
+        "version": rules.version,
+        "running": hub.running,
+        "rules": rules.spec,
+    }
+
+
+@app.get("/access-control/rules")
+def access_rules(ip: str, port: int = 4370):
+    """Access rules of a device's access control session and their version."""
+
+    hub = find_access_control_hub(ip, port)
+    if hub is None:
+        raise HTTPException(status_code=404, detail=f"No access control session for {device_key(ip, port)}")
+    return _rules_response(ip, port, hub)
+
+
+@app.put("/access-control/rules")
+def update_access_rules(req: AccessRulesRequest):
+    """
+    Replace some or all access rules of a device. A running access control
+    session applies them from the next swipe, without reconnecting; decision
+    events carry the `policy_version` they were decided with.
+    """
+
+    _track_device(req.ip, req.port)
+    hub = get_access_control_hub(req.ip, req.port)
+    try:
+        hub.rules.update(
+            whitelist=req.whitelist.split(",") if req.whitelist is not None else None,
+            blacklist=req.blacklist.split(",") if req.blacklist is not None else None,
+            allowed_hours=req.allowed_hours,
+            user_hours=req.user_hours,
+            group_hours=req.group_hours,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _rules_response(req.ip, req.port, hub)
@@ -0,0 +1,76 @@
+from app.src import access_control_core
+from app.src.access_policy import PolicyHolder
+from app.src.events import AccessDenied, AccessGranted
+from app.utils.user_directory import UserDirectory
+from benchmarks.fake_device import FakeZK, fake_connection
+import asyncio
+import logging
+import threading
+
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+
+def test_background_refresh_runs_on_the_side_connections_worker(monkeypatch):
+
+    capture = fake_connection(FakeZK(users=0, records=0), port=14393)
+    device = FakeZK(users=5, records=0)
+    side = fake_connection(device, port=14393)
+    monkeypatch.setattr(access_control_core, "_side_connection", lambda conn: side)
+
+    threads = []
+    get_users = device.get_users
+    monkeypatch.setattr(
+        device, "get_users", lambda: threads.append(threading.current_thread().name) or get_users()
+    )
+
+    directory = UserDirectory()
+    directory.load(device.user_list[:2], revalidate=True)
+    access_control_core._refresh_in_background(directory, capture).result(timeout=5)
+
+    assert len(directory) == 5 and not directory.needs_revalidation
+    assert threads and threads[0].startswith("zk-worker-")
+    side.worker.shutdown()
+
+
+def test_stream_misses_are_refreshed_on_the_side_connection(monkeypatch):
+
+    capture_device = FakeZK(users=0, records=0)
+    device = FakeZK(users=5, records=0)
+    side = fake_connection(device, port=14394)
+    monkeypatch.setattr(access_control_core, "_side_connection", lambda conn: side)
+
+    directory = UserDirectory(ttl=None, miss_refresh_interval=0)
+    directory.load(device.user_list[:2])
+
+    async def run():
+        events = []
+
+        async def consume():
+            async for event in access_control_core.real_time_access_control_stream(
+                fake_connection(capture_device, port=14394),
+                directory=directory,
+                policy=PolicyHolder(allowed_hours="0:00,23:59"),
+                logger=QUIET,
+            ):
+                events.append(event)
+
+        task = asyncio.create_task(consume())
+        while not capture_device._capturing.is_set():
+            await asyncio.sleep(0.01)
+        capture_device.swipe("5")  # not in the cached table yet
+        while "5" not in directory.by_id:
+            await asyncio.sleep(0.01)
+        capture_device.swipe("5")
+        capture_device.close_capture()
+        await task
+        return events
+
+    events = asyncio.run(run())
+    side.worker.shutdown()
+
+    decisions = [e for e in events if isinstance(e, (AccessGranted, AccessDenied))]
+    assert [type(e) for e in decisions] == [AccessDenied, AccessGranted]
+    assert "get_users" not in capture_device.calls
+    assert device.calls["get_users"] == 1
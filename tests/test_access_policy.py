@@ -0,0 +1,116 @@
+from app.src.access_policy import AccessPolicy, PolicyHolder, Schedule
+from app.src.attendance_audit import find_off_hours
+from app.src.monitor_core import attendance_alerts
+from app.src.rules_watcher import RulesFileWatcher
+from app.utils.attendance_batch import AttendanceBatch
+from datetime import datetime, time as dtime, timedelta
+from zk.base import Attendance, User
+import logging
+import os
+import pytest
+
+
+MONDAY = datetime(2026, 1, 5)
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+
+def at(hour: int, minute: int = 0, second: int = 0, day: datetime = MONDAY) -> datetime:
+    return day.replace(hour=hour, minute=minute, second=second)
+
+
+@pytest.mark.parametrize(
+    "when, allowed",
+    [
+        (at(7, 59, 59), False),
+        (at(8), True),
+        (at(17, 59, 59), True),
+        (at(18), True),
+        (at(18, 0, 1), False),
+        (at(18, 0, 59), False),
+        (at(18).replace(microsecond=1), False),
+    ],
+)
+def test_window_includes_its_end_instant_only(when, allowed):
+
+    assert Schedule.parse("8,18").allows(when) is allowed
+
+
+def test_overnight_window_ends_on_the_next_day():
+
+    schedule = Schedule.parse("22:00-06:00")
+
+    assert schedule.allows(at(23, 30))
+    assert schedule.allows(at(6))
+    assert not schedule.allows(at(6, 0, 1))
+    assert not schedule.allows(at(12))
+
+
+def test_overlapping_window_covers_an_end_minute():
+
+    schedule = Schedule.parse("8-12; 12-18")
+
+    assert schedule.allows(at(12, 0, 30))
+    assert not schedule.allows(at(18, 0, 30))
+
+
+def test_weekday_windows():
+
+    schedule = Schedule.parse("mon-fri 8-18; sat 9-13")
+    saturday, sunday = datetime(2026, 1, 10), datetime(2026, 1, 11)
+
+    assert schedule.allows(at(10, day=saturday))
+    assert not schedule.allows(at(13, 0, 1, day=saturday))
+    assert not schedule.allows(at(10, day=sunday))
+
+
+def test_vectorized_audit_matches_the_schedule():
+
+    schedule = Schedule.parse("8,18")
+    times = [at(7, 59, 59), at(8), at(17, 59, 59), at(18), at(18, 0, 1), at(18, 0, 59), at(23)]
+    records = [Attendance("1", when, 1, punch=0, uid=i) for i, when in enumerate(times)]
+    expected = [att.timestamp for att in records if not schedule.allows(att.timestamp)]
+
+    assert expected == [at(7, 59, 59), at(18, 0, 1), at(18, 0, 59), at(23)]
+    batch = AttendanceBatch.from_attendances(records)
+    assert [att.timestamp for att in find_off_hours(batch, schedule)] == expected
+
+
+def test_policy_denies_after_the_end_of_the_window():
+
+    policy = AccessPolicy.compile(whitelist=["boss"], allowed_hours="8,18")
+
+    assert policy.evaluate(User(1, "ann", 0), at(18)).granted
+    assert not policy.evaluate(User(1, "ann", 0), at(18, 0, 1)).granted
+    assert policy.evaluate(User(2, "boss", 0), at(18, 0, 1)).granted
+
+
+def test_rules_file_changes_only_the_rules_it_sets(tmp_path):
+
+    path = tmp_path / "rules.env"
+    path.write_text("WHITE_LISTED=1,2\n")
+    holder = PolicyHolder(allowed_hours="6,22", blacklist=["9"])
+    watcher = RulesFileWatcher(str(path), holder)
+
+    path.write_text("WHITE_LISTED=1,2,3\nBLACK_LISTED=\n")
+    os.utime(path, ns=(0, 1))  # a change even within the file system's time resolution
+    assert watcher.check()
+
+    spec = holder.current.spec
+    assert spec["whitelist"] == ["1", "2", "3"] and spec["blacklist"] == [""]
+    assert spec["allowed_hours"] == "6,22"
+    assert "user_hours" not in spec
+
+
+def test_violations_report_the_window_of_the_records_weekday():
+
+    schedule = Schedule.parse("mon-fri 8-18; sat 9-13")
+    saturday, sunday = MONDAY + timedelta(days=5), MONDAY + timedelta(days=6)
+    records = [Attendance("1", at(15, day=saturday), 1), Attendance("1", at(15, day=sunday), 1)]
+
+    events = list(attendance_alerts(records, [], schedule, QUIET))
+
+    assert (events[0].allowed_start, events[0].allowed_end) == (dtime(9), dtime(13))
+    assert events[1].allowed_start is None and "allowed_start" not in events[1].to_dict()
+    assert events[1].allowed_hours == schedule.describe()
@@ -0,0 +1,61 @@
+from app.src.access_policy import Schedule
+from app.src.attendance_audit import audit_log, find_off_hours, find_rapid_entries
+from app.utils.attendance_batch import AttendanceBatch
+from app.utils.helpers import parse_time
+from benchmarks.fake_device import FakeZK
+from collections import defaultdict
+import pytest
+
+
+def reference_audit(attendances, allowed_hours=("8", "18")):
+    """The per-record checks the vectorized audit replaced (start <= t <= end)."""
+
+    start, end = (parse_time(hour) for hour in allowed_hours)
+    off_hours = [att for att in attendances if not start <= att.timestamp.time() <= end]
+
+    user_times = defaultdict(list)
+    for att in attendances:
+        user_times[att.user_id].append(att.timestamp)
+    rapid = []
+    for user_id, times in user_times.items():
+        times.sort()
+        for i in range(1, len(times)):
+            seconds = (times[i] - times[i - 1]).total_seconds()
+            if seconds < 30:
+                rapid.append((user_id, times[i - 1], times[i], seconds))
+    return off_hours, rapid
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_audit_log_matches_the_per_record_checks(seed, columnar):
+
+    attendances = FakeZK(users=300, records=20000, seed=seed).attendance_list
+    expected_off_hours, expected_rapid = reference_audit(attendances)
+
+    log = AttendanceBatch.from_attendances(attendances) if columnar else attendances
+    off_hours, rapid = audit_log(log, Schedule.parse(("8", "18")))
+
+    key = lambda att: (att.uid, att.user_id, att.timestamp)
+    assert [key(att) for att in off_hours] == [key(att) for att in expected_off_hours]
+    assert [tuple(entry) for entry in rapid] == expected_rapid
+
+
+def test_incremental_checks_match_the_full_audit():
+
+    attendances = FakeZK(users=50, records=2000, seed=3).attendance_list
+    schedule = Schedule.parse("8,18")
+    _, expected_rapid = audit_log(attendances, schedule)
+
+    # the same log checked in chunks, carrying each user's last entry over
+    last_seen, rapid = {}, []
+    for start in range(0, len(attendances), 150):
+        chunk = attendances[start:start + 150]
+        assert find_off_hours(chunk, schedule) == [
+            att for att in chunk if not schedule.allows(att.timestamp)
+        ]
+        rapid.extend(find_rapid_entries(chunk, last_seen))
+        last_seen.update((att.user_id, att.timestamp) for att in chunk)
+
+    key = lambda entry: (entry.user_id, entry.current)
+    assert sorted(rapid, key=key) == sorted(expected_rapid, key=key)
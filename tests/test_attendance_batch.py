@@ -0,0 +1,55 @@
+from app.src.access_policy import Schedule
+from app.src.attendance_audit import audit_log
+from app.src.audit_report import archive_path, audit_shard
+from app.src.fleet import FleetDevice
+from app.src.monitor_core import check_attendances
+from app.utils.attendance_batch import AttendanceBatch
+from app.utils.attendance_store import AttendanceStore, device_key
+from benchmarks.fake_device import FakeZK, fake_connection
+from datetime import timedelta
+import logging
+import numpy as np
+
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+
+def test_archive_round_trip_is_memory_mapped_and_checked_directly(tmp_path):
+
+    device = FakeZK(users=100, records=3000, seed=4)
+    batch = AttendanceBatch.from_attendances(device.attendance_list)
+    path = str(tmp_path / "attendance")
+    batch.save(path)
+    batch.save(path)  # replaces the archive
+
+    loaded = AttendanceBatch.load(path)
+    assert isinstance(loaded.times, np.memmap)
+    assert np.load(f"{path}/times.npy", mmap_mode="r").tolist() == batch.times.tolist()
+    key = lambda att: (att.uid, att.user_id, att.timestamp, att.status, att.punch)
+    assert [key(att) for att in loaded] == [key(att) for att in batch]
+    assert AttendanceBatch.from_attendances(loaded) is loaded
+
+    # a device serving the archived log: checked from the mapped columns
+    device.get_attendance = lambda: loaded
+    store = AttendanceStore(str(tmp_path / "attendance.db"))
+    check_attendances(
+        fake_connection(device, port=14395), "8,18", first_check=True, logger=QUIET, store=store
+    )
+    assert store.count(device_key("127.0.0.1", 14395)) == len(set((a.user_id, a.timestamp) for a in batch))
+
+
+def test_audit_of_an_archived_log(tmp_path):
+
+    attendances = FakeZK(users=100, records=3000, seed=5).attendance_list
+    device = FleetDevice("10.0.0.5", allowed_hours="8,18")
+    AttendanceBatch.from_attendances(attendances).save(archive_path(str(tmp_path), device))
+
+    start = attendances[1000].timestamp + timedelta(microseconds=1)
+    end = attendances[2000].timestamp
+    shard = audit_shard(device, start, end, source="archive", archive_dir=str(tmp_path))
+
+    period = [att for att in attendances if start <= att.timestamp <= end]
+    off_hours, rapid = audit_log(period, Schedule.parse("8,18"))
+    assert shard.error is None and shard.records == len(period)
+    assert len(shard.entries) == len(off_hours) + len(rapid)
@@ -0,0 +1,80 @@
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.monitor_core import check_attendances
+from app.utils.attendance_batch import AttendanceBatch
+from benchmarks.fake_device import FakeZK, fake_connection
+from datetime import datetime, timedelta
+from zk.base import Attendance
+import logging
+import pytest
+
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+START = datetime(2026, 1, 5, 9)
+
+
+def log(count: int, first_uid: int = 1, start: datetime = START) -> list[Attendance]:
+    return [
+        Attendance(str(i % 3), start + timedelta(minutes=i), 1, punch=0, uid=first_uid + i)
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_new_records_are_the_ones_past_the_watermark(columnar):
+
+    records = log(10)
+    as_log = AttendanceBatch.from_attendances if columnar else list
+    watermark = AttendanceWatermark()
+
+    assert not watermark.initialized
+    assert len(watermark.new_records(as_log(records[:6]))) == 6
+    watermark.advance(as_log(records[:6]), as_log(records[:6]))
+
+    assert not watermark.changed(6)
+    assert watermark.changed(10)
+    new = watermark.new_records(as_log(records))
+    assert [att.uid for att in new] == [7, 8, 9, 10]
+    assert watermark.last_seen == {"0": records[3].timestamp, "1": records[4].timestamp, "2": records[5].timestamp}
+
+
+def test_rewritten_log_falls_back_to_the_last_timestamp():
+
+    records = log(5)
+    watermark = AttendanceWatermark()
+    watermark.advance(records, records)
+
+    # the device log was cleared: uids restart and the record at the watermark is gone
+    rewritten = log(3, first_uid=1, start=records[-1].timestamp - timedelta(minutes=1))
+    assert [att.timestamp for att in watermark.new_records(rewritten)] == [
+        rewritten[2].timestamp
+    ]
+
+
+def test_extend_moves_past_live_records():
+
+    records = log(6)
+    watermark = AttendanceWatermark()
+    watermark.advance(records[:4], records[:4])
+    watermark.extend(records[4:])
+
+    assert watermark.count == 6
+    assert watermark.new_records(records) == []
+    assert watermark.last_seen["1"] == records[4].timestamp
+
+
+def test_monitors_of_one_device_each_see_new_records():
+
+    device = FakeZK(users=10, records=100)
+    conn = fake_connection(device, port=14371)
+    first, second = AttendanceWatermark(), AttendanceWatermark()
+    for watermark in (first, second):
+        check_attendances(conn, "8,18", True, logger=QUIET, watermark=watermark)
+
+    device.add_record("1")
+    check_attendances(conn, "8,18", False, logger=QUIET, watermark=first)
+
+    assert first.count == second.count + 1
+    assert second.changed(len(device.attendance_list))
+    assert [att.uid for att in second.new_records(device.attendance_list)] == [101]
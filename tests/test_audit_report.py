@@ -0,0 +1,17 @@
+from app.src.audit_report import run_audit_report
+from app.src.fleet import FleetDevice
+from app.utils.circuit_breaker import get_circuit_breaker
+
+
+def test_report_skips_devices_whose_circuit_is_open():
+
+    device = FleetDevice("10.0.0.6", port=14396)
+    breaker = get_circuit_breaker(device.ip, device.port)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(ConnectionError("down"))
+
+    shards = list(run_audit_report([device], source="device"))
+
+    assert len(shards) == 1 and shards[0].records == 0
+    assert "circuit open" in shards[0].error
+    breaker.record_success()
@@ -0,0 +1,113 @@
+from app.utils import circuit_breaker
+from app.utils.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerWatch,
+    CircuitBreaker,
+    DeviceUnavailable,
+)
+import pytest
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def opened(clock: Clock) -> CircuitBreaker:
+
+    breaker = CircuitBreaker("10.0.0.1:4370", failure_threshold=3, base_delay=1, max_delay=60)
+    for _ in range(3):
+        breaker.before_connect()
+        breaker.record_failure(OSError("timed out"))
+    return breaker
+
+
+def test_consecutive_failures_open_the_circuit(clock):
+
+    breaker = CircuitBreaker("10.0.0.1:4370", failure_threshold=3)
+    breaker.record_failure(OSError("timed out"))
+    breaker.record_failure(OSError("timed out"))
+    assert breaker.state == CLOSED
+    breaker.record_success()  # the count is of consecutive failures
+    breaker.record_failure(OSError("timed out"))
+    breaker.record_failure(OSError("timed out"))
+    assert breaker.state == CLOSED
+
+    breaker.record_failure(OSError("timed out"))
+    assert breaker.state == OPEN
+    assert breaker.last_error == "timed out"
+    with pytest.raises(DeviceUnavailable):
+        breaker.before_connect()
+
+
+def test_one_trial_after_the_delay_and_success_closes(clock):
+
+    breaker = opened(clock)
+    clock.now += 1  # the first delay is at most base_delay
+    assert breaker.state == HALF_OPEN
+    assert breaker.retry_in() == 0
+
+    breaker.before_connect()
+    with pytest.raises(DeviceUnavailable):
+        breaker.before_connect()  # one trial at a time
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+    breaker.before_connect()
+
+
+def test_failed_trial_reopens_with_a_longer_delay(clock):
+
+    breaker = opened(clock)
+    clock.now += 1
+    breaker.before_connect()
+    breaker.record_failure(OSError("refused"))
+
+    assert breaker.state == OPEN
+    assert 1 <= breaker.retry_in() <= 2  # base_delay * 2, half of it jitter
+    clock.now += 0.99
+    with pytest.raises(DeviceUnavailable):
+        breaker.before_connect()
+    clock.now += 1.01
+    assert breaker.state == HALF_OPEN
+
+
+def test_aborted_trial_lets_the_next_attempt_through(clock):
+
+    breaker = opened(clock)
+    clock.now += 1
+    breaker.before_connect()
+    breaker.abort_trial()  # e.g. the pool had no free session
+    breaker.before_connect()
+    assert breaker.state == HALF_OPEN
+
+
+def test_watch_reports_each_change_once(clock):
+
+    breaker = CircuitBreaker("10.0.0.1:4370", failure_threshold=1, base_delay=1)
+    watch = BreakerWatch(breaker)
+    assert watch.poll() is None
+
+    breaker.record_failure(OSError("timed out"))
+    assert watch.poll() == OPEN
+    assert watch.poll() is None
+    clock.now += 1
+    assert watch.poll() == HALF_OPEN
+    breaker.record_success()
+    assert watch.poll() == CLOSED
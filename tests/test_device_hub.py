@@ -0,0 +1,102 @@
+from app.src.access_policy import PolicyHolder, RulesConflict
+from app.src.device_hub import (
+    AccessControlHub,
+    EventBuffer,
+    find_access_control_hub,
+    get_access_control_hub,
+    has_hub,
+)
+from app.src.events import NoAttendances
+from app.utils.user_directory import UserDirectory
+from benchmarks.fake_device import FakeZK, fake_connection
+import pytest
+
+
+RULES = {"whitelist": [""], "blacklist": ["eve"], "allowed_hours": "8,18", "user_hours": {}, "group_hours": {}}
+
+
+def hub(rules: PolicyHolder = None) -> AccessControlHub:
+    return AccessControlHub(fake_connection(FakeZK(users=5, records=0)), directory=UserDirectory(), policy=rules)
+
+
+def test_first_rules_seed_the_hub_and_equal_ones_are_accepted():
+
+    access_control = hub()
+    assert not access_control.rules.configured
+
+    access_control.configure(rules=RULES)
+    assert access_control.rules.version == 2
+    assert access_control.rules.current.spec == RULES
+
+    access_control.configure(rules=dict(RULES))
+    assert access_control.rules.version == 2
+
+
+def test_other_rules_dont_replace_updated_ones():
+
+    access_control = hub()
+    access_control.configure(rules=RULES)
+    access_control.rules.update(allowed_hours="9,17")  # PUT /access-control/rules
+
+    with pytest.raises(RulesConflict):
+        access_control.configure(rules=RULES)
+    assert access_control.rules.version == 3
+    assert access_control.rules.current.spec["allowed_hours"] == "9,17"
+
+
+def test_restored_rules_are_kept():
+
+    restored = PolicyHolder()
+    restored.replace(restored.policy, dict(RULES, blacklist=["mallory"]))  # as StateSnapshot.attach does
+    access_control = hub(restored)
+
+    with pytest.raises(RulesConflict):
+        access_control.configure(rules=RULES)
+    assert access_control.rules.current.spec["blacklist"] == ["mallory"]
+
+
+def buffer_of(count: int, size: int = 10) -> EventBuffer:
+
+    buffer = EventBuffer(size)
+    for i in range(count):
+        buffer.publish(NoAttendances(message=str(i)))
+    return buffer
+
+
+def test_since_returns_the_events_after_the_id():
+
+    buffer = buffer_of(5)
+    missed = buffer.since(f"{buffer.epoch}-2")
+    assert [p.seq for p in missed] == [3, 4, 5]
+    assert [p.event.message for p in missed] == ["2", "3", "4"]
+    assert f"id: {buffer.epoch}-3".encode() in missed[0].frame
+    assert buffer.since(f"{buffer.epoch}-5") == []
+
+
+def test_since_returns_what_is_left_after_the_ring_wrapped():
+
+    buffer = buffer_of(25, size=10)
+    assert [p.seq for p in buffer.since(f"{buffer.epoch}-3")] == list(range(16, 26))
+    assert [p.seq for p in buffer.since(f"{buffer.epoch}-20")] == list(range(21, 26))
+
+
+@pytest.mark.parametrize("last_event_id", [None, "", "garbage", "1-2-3", "0-2"])
+def test_since_ignores_missing_foreign_and_malformed_ids(last_event_id):
+
+    assert buffer_of(5).since(last_event_id) == []
+    assert EventBuffer(10).since(last_event_id) == []
+
+
+def test_since_ignores_ids_of_another_process():
+
+    buffer = buffer_of(5)
+    assert buffer.since(f"{buffer.epoch - 1}-2") == []
+
+
+def test_finding_a_hub_creates_none():
+
+    assert find_access_control_hub("10.0.0.8", 14398) is None
+    assert not has_hub("10.0.0.8", 14398)
+
+    created = get_access_control_hub("10.0.0.8", 14398)
+    assert find_access_control_hub("10.0.0.8", 14398) is created
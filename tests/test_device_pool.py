@@ -0,0 +1,14 @@
+from app.utils import device_pool
+from app.utils.device_pool import set_session_timeout
+from zk import ZK
+
+
+def test_session_timeout_follows_the_checked_pyzk_version(monkeypatch):
+
+    zk = ZK("127.0.0.1", timeout=5)
+    assert set_session_timeout(zk, 165)
+    assert zk._ZK__sock.gettimeout() == 165
+
+    monkeypatch.setattr(device_pool.pyzk, "VERSION", (device_pool.PYZK_CHECKED_VERSION[0] + 1, 0))
+    assert not set_session_timeout(zk, 30)
+    assert zk._ZK__sock.gettimeout() == 165
@@ -0,0 +1,56 @@
+from app.src.events import AttendanceTimeViolation, UserAdded
+from app.src.fleet import FleetDevice, FleetMonitor
+from app.utils.helpers import get_connection
+from benchmarks.fake_device import FakeZK, fake_connection
+from datetime import datetime, timedelta
+from zk.base import User
+import asyncio
+import logging
+
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+
+def fleet(device: FakeZK, port: int) -> FleetMonitor:
+
+    monitor = FleetMonitor([FleetDevice("127.0.0.1", port, admin_count=100)], logger=QUIET)
+    state = monitor.devices[0]
+    state.conn = fake_connection(device, port=port)
+    return monitor
+
+
+def check(monitor: FleetMonitor) -> list:
+
+    async def run():
+        queue = asyncio.Queue()
+        await monitor._check_device(monitor.devices[0], queue)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    return asyncio.run(run())
+
+
+def test_fleets_on_one_device_dont_hide_changes_from_each_other():
+
+    device = FakeZK(users=20, records=200)
+    first, second = fleet(device, 14370), fleet(device, 14370)
+    check(first)
+    check(second)
+
+    night = (datetime.now() - timedelta(days=1)).replace(hour=3, minute=0, second=0, microsecond=0)
+    record = device.add_record("1", night)
+    device.user_list.append(User(99, "new", 0, password="1", user_id="99"))
+
+    for monitor in (first, second):
+        events = check(monitor)
+        violations = [e for e in events if isinstance(e, AttendanceTimeViolation)]
+        assert [e.attendance_time for e in violations] == [record.timestamp]
+        assert [e.user_id for e in events if isinstance(e, UserAdded)] == ["99"]
+
+
+def test_fleets_reuse_the_devices_shared_connection():
+
+    devices = [FleetDevice("10.0.0.7", 14397)]
+    first, second = FleetMonitor(devices, logger=QUIET), FleetMonitor(devices, logger=QUIET)
+
+    assert first.devices[0].conn is second.devices[0].conn is get_connection("10.0.0.7", 14397)
@@ -0,0 +1,64 @@
+from benchmarks.fake_device import FakeZK, fake_connection
+import asyncio
+import threading
+
+
+def test_overlapping_blocks_share_one_session():
+
+    device = FakeZK(users=5, records=0)
+    conn = fake_connection(device, port=14390)
+    started = asyncio.Event()
+
+    async def transfer():
+        async with conn as zk:
+            started.set()
+            await asyncio.sleep(0.01)
+            return await conn.run(zk.get_users)
+
+    async def other():
+        await started.wait()
+        async with conn as zk:
+            return await conn.run(zk.get_users)
+
+    async def run():
+        return await asyncio.gather(transfer(), other())
+
+    first, second = asyncio.run(run())
+    assert len(first) == len(second) == 5
+    assert device.calls["connect"] == device.calls["disconnect"] == 1
+    assert conn.conn is None and not device.is_connect
+
+
+def test_sequential_blocks_connect_each_time():
+
+    device = FakeZK(users=5, records=0)
+    conn = fake_connection(device, port=14391)
+    for _ in range(2):
+        with conn as zk:
+            zk.get_users()
+    assert device.calls["connect"] == device.calls["disconnect"] == 2
+
+
+def test_other_threads_wait_for_the_session():
+
+    device = FakeZK(users=5, records=0)
+    conn = fake_connection(device, port=14392)
+    inside = threading.Event()
+    entered = []
+
+    def other():
+        inside.wait()
+        with conn:
+            entered.append(device.calls["disconnect"])
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    with conn:
+        inside.set()
+        thread.join(0.1)
+        assert thread.is_alive()  # not handed the open session
+    thread.join(1)
+
+    # the other thread only got a session after this one was given back
+    assert entered == [1]
+    assert device.calls["connect"] == device.calls["disconnect"] == 2
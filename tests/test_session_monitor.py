@@ -0,0 +1,99 @@
+from app.src.access_control_core import real_time_access_control_stream
+from app.src.access_policy import PolicyHolder
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.events import AccessDenied, AccessGranted, AttendanceTimeViolation, UncheckedRecords
+from app.src.session_monitor import SessionMonitor
+from app.utils.attendance_store import AttendanceStore, device_key
+from app.utils.user_directory import UserDirectory
+from benchmarks.fake_device import FakeZK, fake_connection
+from datetime import datetime
+import asyncio
+import logging
+
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+CAPTURE_CALLS = {"connect", "disconnect", "read_sizes", "unlock", "test_voice"}
+
+
+def closed_hours() -> str:
+    """Allowed hours that exclude the current time."""
+
+    hour = datetime.now().hour
+    return f"{(hour + 2) % 24},{(hour + 3) % 24}"
+
+
+def open_hours() -> str:
+    """Allowed hours that include the current time."""
+
+    hour = datetime.now().hour
+    return f"{(hour + 23) % 24},{(hour + 2) % 24}"
+
+
+def test_swipes_are_checked_and_stored_on_the_capture_session(tmp_path):
+
+    device = FakeZK(users=50, records=200)
+    store = AttendanceStore(str(tmp_path / "attendance.db"))
+    watermark = AttendanceWatermark()
+    monitor = SessionMonitor(closed_hours(), store=store, logger=QUIET, watermark=watermark)
+    directory = UserDirectory(ttl=None)
+    directory.load(device.user_list)
+
+    async def run():
+        events = []
+
+        async def consume():
+            async for event in real_time_access_control_stream(
+                fake_connection(device, port=14380),
+                directory=directory,
+                policy=PolicyHolder(allowed_hours="0:00,23:59"),
+                monitor=monitor,
+                logger=QUIET,
+            ):
+                events.append(event)
+
+        task = asyncio.create_task(consume())
+        while not device._capturing.is_set():
+            await asyncio.sleep(0.01)
+        for user in device.user_list[:20]:
+            device.swipe(user.user_id)
+        device.close_capture()
+        await task
+        return events
+
+    events = asyncio.run(run())
+
+    assert sum(isinstance(e, (AccessGranted, AccessDenied)) for e in events) == 20
+    assert sum(isinstance(e, AttendanceTimeViolation) for e in events) == 20
+    assert not any(isinstance(e, UncheckedRecords) for e in events)  # first start
+    assert watermark.count == 220
+    assert store.count(device_key("127.0.0.1", 14380)) == 20
+    # no polling, no transfers over the capture's socket
+    assert set(device.calls) <= CAPTURE_CALLS
+    assert device.calls["read_sizes"] == 1
+
+
+def test_records_added_without_a_capture_are_reported():
+
+    device = FakeZK(users=5, records=10)
+    monitor = SessionMonitor("0:00,23:59", logger=QUIET)
+    assert monitor.resume(device) is None
+    assert monitor.watermark.count == 10
+
+    for user in device.user_list[:3]:
+        device.add_record(user.user_id)
+    unchecked = monitor.resume(device)
+    assert isinstance(unchecked, UncheckedRecords) and unchecked.count == 3
+    assert monitor.watermark.count == 13
+    assert monitor.resume(device) is None
+
+
+def test_swipes_within_the_hours_raise_nothing():
+
+    device = FakeZK(users=5, records=0)
+    monitor = SessionMonitor(open_hours(), logger=QUIET)
+    monitor.resume(device)
+    assert monitor.observe(device.add_record("1")) == []
+    assert monitor.watermark.count == 1
+    assert monitor.watermark.last_seen == {"1": device.attendance_list[-1].timestamp}
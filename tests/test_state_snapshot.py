@@ -0,0 +1,81 @@
+from app.src.access_policy import PolicyHolder
+from app.src.attendance_sync import AttendanceWatermark
+from app.src.state_snapshot import StateSnapshot
+from app.utils.user_directory import UserDirectory
+from datetime import datetime
+from zk.base import Attendance, User
+import json
+
+
+def device_state():
+
+    directory = UserDirectory()
+    directory.load([User(1, "ann", 0, password="secret", group_id="1", user_id="7")])
+    rules = PolicyHolder(allowed_hours="8,18", blacklist=["eve"])
+    watermark = AttendanceWatermark()
+    records = [Attendance("7", datetime(2026, 1, 5, 9), 1, punch=0, uid=1)]
+    watermark.advance(records, records)
+    return directory, rules, watermark
+
+
+def test_round_trip_restores_users_rules_and_watermarks(tmp_path):
+
+    path = str(tmp_path / "state.json")
+    directory, rules, watermark = device_state()
+    snapshot = StateSnapshot(path)
+    snapshot.attach("10.0.0.1", 4370, directory, rules, {"monitor": watermark})
+    assert snapshot.save()
+    assert not snapshot.save()  # nothing changed since
+
+    assert "secret" not in open(path).read()
+
+    restored = UserDirectory(), PolicyHolder(), AttendanceWatermark()
+    other = AttendanceWatermark()
+    snapshot = StateSnapshot(path)
+    assert snapshot.devices() == [("10.0.0.1", 4370)]
+    assert snapshot.attach(
+        "10.0.0.1", 4370, restored[0], restored[1], {"monitor": restored[2], "session": other}
+    )
+
+    directory, rules, watermark = restored
+    assert directory.get_by_name("ann").user_id == "7"
+    assert directory.needs_revalidation
+    assert rules.current.spec == {"allowed_hours": "8,18", "blacklist": ["eve"]}
+    assert watermark.initialized and watermark.count == 1
+    assert watermark.last_seen == {"7": datetime(2026, 1, 5, 9)}
+    # a monitor without saved state starts fresh
+    assert not other.initialized
+
+    directory.load([User(1, "ann", 0, user_id="7")])
+    assert not directory.needs_revalidation
+
+
+def test_startup_rules_and_untracked_devices_are_kept(tmp_path):
+
+    path = str(tmp_path / "state.json")
+    directory, rules, watermark = device_state()
+    snapshot = StateSnapshot(path)
+    snapshot.attach("10.0.0.1", 4370, directory, rules, {"monitor": watermark})
+    snapshot.attach("10.0.0.2", 4370, rules=PolicyHolder(allowed_hours="9,17"))
+    snapshot.save()
+
+    startup_rules = PolicyHolder(allowed_hours="6,22")
+    snapshot = StateSnapshot(path)
+    snapshot.attach("10.0.0.1", 4370, rules=startup_rules)
+    assert startup_rules.current.spec == {"allowed_hours": "6,22"}
+
+    startup_rules.update(whitelist=["boss"])
+    assert snapshot.save()
+    devices = json.load(open(path))["devices"]
+    assert devices["10.0.0.1:4370"]["rules"]["whitelist"] == ["boss"]
+    assert devices["10.0.0.1:4370"]["watermarks"]["monitor"]["count"] == 1
+    assert devices["10.0.0.2:4370"]["rules"] == {"allowed_hours": "9,17"}
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+
+    path = tmp_path / "state.json"
+    path.write_text("{not json")
+
+    snapshot = StateSnapshot(str(path))
+    assert snapshot.devices() == []
@@ -0,0 +1,80 @@
+from app.src.events import ExcessAdminUsers, UserAdded
+from app.src.monitor_core import check_users_stream
+from app.src.user_audit import UserSnapshot
+from benchmarks.fake_device import FakeZK, fake_connection
+from zk.base import User, const
+import asyncio
+import logging
+
+
+QUIET = logging.getLogger("tests.quiet")
+QUIET.disabled = True
+
+
+def user(uid: int, privilege: int = const.USER_DEFAULT, password: str = "1234") -> User:
+    return User(uid, f"user{uid}", privilege, password=password, user_id=str(uid))
+
+
+def test_first_update_is_the_baseline():
+
+    snapshot = UserSnapshot()
+    changes = snapshot.update([user(1), user(2, const.USER_ADMIN)])
+
+    assert changes.baseline
+    assert changes.added == []
+    assert [row.user_id for row in changes.changed] == ["1", "2"]
+    assert snapshot.admin_count == 1
+
+
+def test_update_reports_what_changed():
+
+    snapshot = UserSnapshot()
+    snapshot.update([user(1), user(2, const.USER_ADMIN), user(3)])
+
+    assert not snapshot.update([user(1), user(2, const.USER_ADMIN), user(3)])
+
+    changes = snapshot.update([user(1, const.USER_ADMIN), user(3, password=""), user(4)])
+    assert [row.user_id for row in changes.added] == ["4"]
+    assert [row.user_id for row in changes.removed] == ["2"]
+    assert [(a.user_id, a.privilege) for _, a in changes.privilege_changed] == [("1", const.USER_ADMIN)]
+    assert [row.user_id for row in changes.changed] == ["1", "3", "4"]
+    assert changes.admins_changed
+    assert list(snapshot.admins) == ["1"]
+
+
+def cycle(conn, snapshot: UserSnapshot, admin_count: int, first_check: bool = False) -> list:
+
+    async def run():
+        return [
+            event
+            async for event in check_users_stream(
+                conn, admin_count, first_check, QUIET, snapshot=snapshot
+            )
+        ]
+
+    return asyncio.run(run())
+
+
+def test_excess_admins_are_reported_on_every_check():
+
+    device = FakeZK(users=10, records=0, admin_every=2)
+    conn = fake_connection(device, port=14372)
+    snapshot = UserSnapshot()
+
+    for first_check in (True, False, False):
+        events = cycle(conn, snapshot, admin_count=2, first_check=first_check)
+        assert [e.admin_count for e in events if isinstance(e, ExcessAdminUsers)] == [5]
+
+
+def test_monitors_of_one_device_each_see_user_changes():
+
+    device = FakeZK(users=10, records=0)
+    conn = fake_connection(device, port=14373)
+    first, second = UserSnapshot(), UserSnapshot()
+    cycle(conn, first, 10, first_check=True)
+    cycle(conn, second, 10, first_check=True)
+
+    device.user_list.append(user(42))
+    for snapshot in (first, second):
+        events = cycle(conn, snapshot, 10)
+        assert [e.user_id for e in events if isinstance(e, UserAdded)] == ["42"]